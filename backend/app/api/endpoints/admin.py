@@ -0,0 +1,47 @@
+import os
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response
+
+from app.core.config import settings
+from app.core.security.auth import require_admin
+from app.utils.profiler import LoopProfiler
+
+router = APIRouter(prefix="/api/admin", dependencies=[Depends(require_admin)])
+
+
+@router.post("/profile")
+async def profile(
+    seconds: float = Query(10.0, gt=0),
+    interval_ms: float = Query(5.0, ge=1.0, le=100.0),
+    memory: bool = True,
+    blocking_threshold_ms: float = Query(0.0, ge=0.0)
+):
+    """Profile the worker serving this request and return a zip to download.
+
+    The zip holds folded CPU stacks of every thread (event loop and executor
+    threads alike), a summary with the hottest frames, an optional tracemalloc
+    diff over the window and, with ``blocking_threshold_ms`` set, the stacks
+    of loop steps that ran longer than the threshold. Other workers are not
+    profiled; repeat the request to reach them.
+    """
+    if seconds > settings.PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be at most {settings.PROFILE_MAX_SECONDS}")
+    profiler = LoopProfiler(
+        seconds,
+        interval=interval_ms / 1000,
+        memory=memory,
+        blocking_threshold=blocking_threshold_ms / 1000 if blocking_threshold_ms else None
+    )
+    try:
+        result = await profiler.run()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    filename = f"profile-{os.getpid()}-{time.strftime('%Y%m%dT%H%M%S')}.zip"
+    return Response(
+        content=result.to_zip(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -6,13 +6,9 @@ import logging
 from app.rag.initialize_rag import RAGInitializer
 from dotenv import load_dotenv
 from langchain.vectorstores import Chroma
-from langchain.embeddings import OpenAIEmbeddings
+from app.core.config.logging import configure_logging
+from app.services.knowledge_base.embeddings import get_query_embeddings
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 def close_existing_connections(db_path: str):
@@ -21,7 +17,7 @@ def close_existing_connections(db_path: str):
         # Initialize Chroma client
         vector_store = Chroma(
             persist_directory=db_path,
-            embedding_function=OpenAIEmbeddings()
+            embedding_function=get_query_embeddings()
         )
         # Explicitly close the client
         vector_store._client.close()
@@ -119,6 +115,8 @@ def main():
 
 if __name__ == "__main__":
     import argparse
+
+    configure_logging()
     
     parser = argparse.ArgumentParser(description='Clean and reinitialize vector store')
     parser.add_argument('--force', action='store_true', 
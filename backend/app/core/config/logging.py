@@ -0,0 +1,201 @@
+"""Process-wide logging: structured records written off the request path.
+
+``configure_logging()`` installs a queue-backed handler on the root logger; a
+background listener thread formats the records and writes them to stderr, so
+logging on the event loop costs a queue put. Every record carries the request
+ID bound with ``bind_request_id``. Large payloads go through ``log_payload``,
+which samples them per logger and truncates them before they are formatted.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar, Token
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"
+
+# Attributes every LogRecord has; anything else was passed in ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional["NonBlockingQueueHandler"] = None
+_configure_lock = threading.Lock()
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def bind_request_id(request_id: Optional[str] = None) -> Token:
+    """Tag records logged from this context with ``request_id`` (a new one if omitted)."""
+    return request_id_var.set(request_id or new_request_id())
+
+
+def reset_request_id(token: Token):
+    request_id_var.reset(token)
+
+
+def truncate(text: str, limit: int) -> str:
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text) - limit} chars truncated]"
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+class PayloadSampler:
+    """Decides per logger whether a large payload is logged.
+
+    The rate for a logger is the one configured for its nearest dotted
+    ancestor, falling back to ``default_rate``.
+    """
+
+    def __init__(self, default_rate: float, rates: Optional[Dict[str, float]] = None):
+        self.default_rate = default_rate
+        self.rates = rates or {}
+        self._resolved: Dict[str, float] = {}
+
+    def rate(self, logger_name: str) -> float:
+        rate = self._resolved.get(logger_name)
+        if rate is None:
+            name = logger_name
+            while name and name not in self.rates:
+                name = name.rpartition(".")[0]
+            rate = self._resolved[logger_name] = self.rates.get(name, self.default_rate)
+        return rate
+
+    def sample(self, logger_name: str) -> bool:
+        rate = self.rate(logger_name)
+        return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+
+_sampler = PayloadSampler(settings.LOG_PAYLOAD_SAMPLE_RATE, parse_sample_rates(settings.LOG_PAYLOAD_SAMPLE_RATES))
+
+
+def log_payload(logger: logging.Logger, label: str, payload: Any, level: int = logging.INFO, **fields):
+    """Log a large payload for a sample of calls, truncated to LOG_PAYLOAD_MAX_CHARS.
+
+    Unsampled calls return before the payload is converted to text.
+    """
+    if not logger.isEnabledFor(level) or not _sampler.sample(logger.name):
+        return
+    text = payload if isinstance(payload, str) else repr(payload)
+    logger.log(level, f"{label}: {truncate(text, settings.LOG_PAYLOAD_MAX_CHARS)}", extra={"sampled": True, **fields})
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_var.get()
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener without formatting them; drops them when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue, max_message_chars: int):
+        super().__init__(log_queue)
+        self.max_message_chars = max_message_chars
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the args now, while they still hold the values being logged
+        record.msg = truncate(record.getMessage(), self.max_message_chars)
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class StderrHandler(logging.StreamHandler):
+    """Writes to whatever ``sys.stderr`` is at the time, which test runners swap out."""
+
+    @property
+    def stream(self):
+        return sys.stderr
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the message, request ID and any ``extra`` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": round(record.created, 3),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                data[key] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+def configure_logging(level: Optional[str] = None, log_format: Optional[str] = None):
+    """Install the queue-backed root handler once per process; later calls do nothing."""
+    global _listener, _handler
+    with _configure_lock:
+        if _listener is not None:
+            return
+        output = StderrHandler()
+        if (log_format or settings.LOG_FORMAT) == "json":
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+        _handler = NonBlockingQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE), settings.LOG_MAX_MESSAGE_CHARS)
+        _handler.addFilter(RequestIdFilter())
+        root = logging.getLogger()
+        root.addHandler(_handler)
+        root.setLevel(level or settings.LOG_LEVEL)
+        # httpx logs every API call at INFO
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+
+        _listener = logging.handlers.QueueListener(_handler.queue, output)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Write out the queued records and stop the listener thread."""
+    global _listener, _handler
+    with _configure_lock:
+        if _listener is None:
+            return
+        logging.getLogger().removeHandler(_handler)
+        _listener.stop()
+        _listener = None
+        _handler = None
+
+
+def dropped_records() -> int:
+    return _handler.dropped if _handler is not None else 0
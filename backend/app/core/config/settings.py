@@ -0,0 +1,125 @@
+import os
+
+# Paths
+PDF_DIRECTORY = os.getenv("PDF_DIRECTORY", "/app/data")
+CHROMA_DIRECTORY = os.getenv("CHROMA_DIRECTORY", "/app/chroma_db")
+# Kept outside CHROMA_DIRECTORY so cleaning the vector store does not drop it
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "/app/embedding_cache/embeddings.sqlite3")
+
+# Retrieval
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "3"))
+# Seconds between checks of the persisted index for changes made by ingestion
+RAG_INDEX_CHECK_INTERVAL = float(os.getenv("RAG_INDEX_CHECK_INTERVAL", "5"))
+# Search backend over the persisted collection: "chroma" (hnswlib),
+# "numpy" (exact search over an in-memory float32 matrix loaded at open) or
+# "mmap" (exact search over flat files written by ingestion and memory-mapped,
+# so all workers on a host share one copy through the page cache)
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "chroma")
+# Write the flat-file index for the mmap backend at the end of each ingestion
+MMAP_INDEX_ENABLED = os.getenv("MMAP_INDEX_ENABLED", str(VECTOR_STORE_BACKEND == "mmap")).lower() in ("1", "true", "yes")
+# numpy backend: "float32", or "float16"/"int8" to search a compact matrix and
+# re-rank RESCORE_FACTOR * k candidates against float32 rows memory-mapped
+# from a temporary file in SPILL_DIRECTORY (default: the system temp dir)
+VECTOR_STORE_PRECISION = os.getenv("VECTOR_STORE_PRECISION", "float32")
+VECTOR_STORE_RESCORE_FACTOR = int(os.getenv("VECTOR_STORE_RESCORE_FACTOR", "4"))
+VECTOR_STORE_SPILL_DIRECTORY = os.getenv("VECTOR_STORE_SPILL_DIRECTORY", "")
+# Vector searches run on their own thread pool; beyond the in-flight cap they queue
+RAG_SEARCH_WORKERS = int(os.getenv("RAG_SEARCH_WORKERS", "4"))
+RAG_SEARCH_MAX_IN_FLIGHT = int(os.getenv("RAG_SEARCH_MAX_IN_FLIGHT", "8"))
+# Hybrid retrieval: BM25 and dense candidates per query, merged by reciprocal rank fusion
+RAG_HYBRID_SEARCH = os.getenv("RAG_HYBRID_SEARCH", "true").lower() in ("1", "true", "yes")
+RAG_HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "20"))
+RAG_RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+# Prompt tokens for retrieved passages; adjacent chunks are merged without their overlap
+RAG_CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1500"))
+
+# LLM provider for chat and embeddings: "openai" (any OpenAI-compatible API at
+# OPENAI_API_BASE), or "fake" for deterministic offline answers and vectors
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
+# Shared HTTP connection pool: connections in total, idle ones kept open and for how many seconds
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+# Timeouts in seconds; for streamed answers the chat timeout bounds the wait for each chunk
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_CHAT_TIMEOUT = float(os.getenv("LLM_CHAT_TIMEOUT", "60"))
+LLM_EMBEDDING_TIMEOUT = float(os.getenv("LLM_EMBEDDING_TIMEOUT", "30"))
+
+# Embeddings: "openai" (through the LLM provider), or "fake" for deterministic offline vectors
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "fake" if LLM_PROVIDER == "fake" else "openai")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+FAKE_EMBEDDING_SIZE = int(os.getenv("FAKE_EMBEDDING_SIZE", "1536"))
+# Ingestion embedding requests: in flight at once, token budget (0 = unlimited), retries on 429/5xx
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+EMBEDDING_TOKENS_PER_MINUTE = float(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", "1000000"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+
+# Query embedding cache
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+QUERY_EMBEDDING_CACHE_TTL = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "3600"))
+QUERY_EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Query embedding cache misses are sent together: up to BATCH_SIZE queries per
+# request, waiting at most BATCH_WAIT_MS for others to arrive (size 1 = off)
+QUERY_EMBEDDING_BATCH_SIZE = int(os.getenv("QUERY_EMBEDDING_BATCH_SIZE", "16"))
+QUERY_EMBEDDING_BATCH_WAIT_MS = float(os.getenv("QUERY_EMBEDDING_BATCH_WAIT_MS", "5"))
+
+# Semantic answer cache: reuse an answer when a query is within this cosine
+# distance of a cached one and retrieved the same chunks from the same index
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ANSWER_CACHE_MAX_DISTANCE = float(os.getenv("ANSWER_CACHE_MAX_DISTANCE", "0.05"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+
+# Conversation memory (QueryEngine): recent turns sent verbatim within a token
+# budget, older turns folded into a background summary; idle sessions evicted LRU
+CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", "6"))
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "1500"))
+CONVERSATION_MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", "1000"))
+CONVERSATION_IDLE_TTL = float(os.getenv("CONVERSATION_IDLE_TTL", "3600"))
+
+# Incremental ingestion: watch PDF_DIRECTORY and sync the index when it changes
+RAG_WATCH_DATA_DIR = os.getenv("RAG_WATCH_DATA_DIR", "false").lower() in ("1", "true", "yes")
+RAG_WATCH_POLL_INTERVAL = float(os.getenv("RAG_WATCH_POLL_INTERVAL", "2"))
+RAG_WATCH_DEBOUNCE = float(os.getenv("RAG_WATCH_DEBOUNCE", "5"))
+
+# Ingestion: worker processes for PDF parsing/splitting (1 = parse in-process)
+RAG_PARSE_WORKERS = int(os.getenv("RAG_PARSE_WORKERS", "1"))
+# Streaming ingestion: chunks per embedding request, chunks per vector store
+# write, and batches buffered between pipeline stages
+RAG_EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "64"))
+RAG_UPSERT_BATCH_SIZE = int(os.getenv("RAG_UPSERT_BATCH_SIZE", "1024"))
+RAG_PIPELINE_QUEUE_SIZE = int(os.getenv("RAG_PIPELINE_QUEUE_SIZE", "4"))
+
+# Seconds between progress frames on /api/ingestion/jobs/{job_id}/ws
+RAG_JOB_PROGRESS_INTERVAL = float(os.getenv("RAG_JOB_PROGRESS_INTERVAL", "0.5"))
+# Ingestion job records, written by the worker running a job so every worker
+# can report it; kept outside CHROMA_DIRECTORY so a rebuild does not drop them
+INGESTION_JOBS_DIRECTORY = os.getenv("INGESTION_JOBS_DIRECTORY", CHROMA_DIRECTORY.rstrip("/") + "_jobs")
+
+# Logging: level, "text" or "json" lines, records buffered for the background
+# writer (dropped when full) and the longest message kept
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "2000"))
+# Share of large payloads (retrieved context, prompts) that are logged, with
+# per-logger overrides as "app.main=0.1,app.rag=0"
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.01"))
+LOG_PAYLOAD_SAMPLE_RATES = os.getenv("LOG_PAYLOAD_SAMPLE_RATES", "")
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "500"))
+
+# Admin endpoints (/api/admin/...) require "Authorization: Bearer <token>";
+# they are disabled while no token is set
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN", "")
+# Longest profiling window /api/admin/profile accepts, in seconds
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+# Startup warmup, after which /api/ready reports ready: import and open the
+# index, open a connection to the LLM API and run one search. Each step gets
+# STEP_TIMEOUT seconds; with warmup off the worker is ready at once
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+WARMUP_STEP_TIMEOUT = float(os.getenv("WARMUP_STEP_TIMEOUT", "60"))
+# Seconds before retrying a failed index open, doubling up to the maximum
+WARMUP_RETRY_DELAY = float(os.getenv("WARMUP_RETRY_DELAY", "1"))
+WARMUP_MAX_RETRY_DELAY = float(os.getenv("WARMUP_MAX_RETRY_DELAY", "60"))
@@ -0,0 +1,18 @@
+import hmac
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+from app.core.config import settings
+
+
+def require_admin(authorization: Optional[str] = Header(None)):
+    """Dependency admitting requests with ``Authorization: Bearer <ADMIN_API_TOKEN>``.
+
+    Admin endpoints are disabled (404) while ADMIN_API_TOKEN is unset.
+    """
+    if not settings.ADMIN_API_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), settings.ADMIN_API_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Admin token required", headers={"WWW-Authenticate": "Bearer"})
@@ -1,22 +1,60 @@
-from fastapi import FastAPI, WebSocket, HTTPException
+from fastapi import FastAPI, Request, Response, WebSocket, WebSocketDisconnect, HTTPException
 from pydantic import BaseModel
 from typing import List, Dict, Optional
+import importlib
 import logging
 import json
-import openai
+import asyncio
 import os
-from app.rag.initialize_rag import RAGInitializer
-from langchain.vectorstores import Chroma
-from langchain.embeddings import OpenAIEmbeddings
+import time
+from app.rag.context import pack_context
+from app.rag.pipeline import IngestionProgress
+from app.rag.watcher import DataDirectoryWatcher
+from app.core.config import settings
+from app.core.config.logging import bind_request_id, configure_logging, dropped_records, log_payload, request_id_var, reset_request_id
+from app.services.memory.vector_store import Retrieval, SearchResult, close_async_retriever, current_index_version, get_async_retriever, get_retrieval_engine
+from app.services.chat.answer_cache import get_answer_cache
+from app.services.chat.service import CompletionStream, llm_configured
+from app.services.chat.single_flight import Publish, SingleFlight
+from app.services.knowledge_base.embeddings import get_query_embeddings, normalize_query
+from app.services.knowledge_base.service import REBUILD, SYNC, IngestionJobManager, IngestionRejected, vector_store_lock
+from app.services.llm.provider import close_llm_provider, get_llm_provider
+from app.api.endpoints.admin import router as admin_router
+from app.api.endpoints.analytics import router as analytics_router
+from app.utils.metrics import (
+    ACTIVE_WEBSOCKETS,
+    CACHE_LOOKUPS,
+    CHAT_REQUEST_SECONDS,
+    CHAT_REQUESTS,
+    CHAT_STAGE_SECONDS,
+    COALESCED_REQUESTS,
+    INGESTION_CHUNKS,
+    LLM_TOKENS,
+    RETRIEVED_CHUNK_FUSED_SCORE,
+    RETRIEVED_CHUNK_SCORE
+)
+from app.utils.warmup import Warmup, WarmupSkipped
 
 # Basic FastAPI app
 app = FastAPI()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+app.include_router(analytics_router)
+app.include_router(admin_router)
 
-# Simple logging
-logging.basicConfig(level=logging.INFO)
+# Queue-backed root handler; records are written on a background thread
+configure_logging()
 logger = logging.getLogger(__name__)
 
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    """Tag the request's log records with its X-Request-ID, or a new one, and echo it back"""
+    token = bind_request_id(request.headers.get("x-request-id"))
+    try:
+        response = await call_next(request)
+        response.headers["X-Request-ID"] = request_id_var.get()
+        return response
+    finally:
+        reset_request_id(token)
+
 class ChatMessage(BaseModel):
     messages: List[Dict[str, str]]
 
@@ -24,6 +62,124 @@ class ChatResponse(BaseModel):
     response: Optional[str] = None
     error: Optional[str] = None
 
+WARMUP_QUERY = "warm-up"
+
+async def open_index():
+    """Open the persisted vector store, importing its backend on the way"""
+    await asyncio.get_running_loop().run_in_executor(None, get_retrieval_engine().reload)
+
+async def open_llm_connection():
+    """Embed a query so the LLM connection pool holds a live TLS connection"""
+    if not get_llm_provider().configured:
+        raise WarmupSkipped("No API key configured")
+    await asyncio.get_running_loop().run_in_executor(None, get_query_embeddings().embed_query, WARMUP_QUERY)
+
+async def run_dummy_search():
+    """Start the retrieval threads and touch the index with one search"""
+    await get_async_retriever().retrieve(WARMUP_QUERY, k=1)
+
+# /api/ready stays false until the index is open (retried until it is); the
+# other steps only make the first query fast
+warmup = Warmup(
+    [("open_index", open_index), ("llm_connection", open_llm_connection), ("search", run_dummy_search)],
+    required=["open_index"],
+    timeout=settings.WARMUP_STEP_TIMEOUT,
+    retry_delay=settings.WARMUP_RETRY_DELAY,
+    max_retry_delay=settings.WARMUP_MAX_RETRY_DELAY
+)
+
+@app.on_event("startup")
+async def start_warmup():
+    """Warm up in the background so the worker answers health checks meanwhile"""
+    if settings.WARMUP_ON_STARTUP:
+        warmup.start()
+    else:
+        warmup.skip()
+
+@app.on_event("shutdown")
+async def stop_warmup():
+    warmup.cancel()
+
+def run_sync_job(progress: IngestionProgress) -> Dict:
+    """Apply new, modified and removed PDFs to the vector store"""
+    # Imports langchain and Chroma, which serving does not need until a job runs
+    from app.rag.initialize_rag import RAGInitializer
+
+    initializer = RAGInitializer(
+        pdf_dir=settings.PDF_DIRECTORY,
+        db_dir=settings.CHROMA_DIRECTORY
+    )
+    initial_info = initializer.get_store_info()
+    changes = initializer.sync_vector_store(progress)
+    INGESTION_CHUNKS.inc(changes["chunks_added"], operation="added")
+    INGESTION_CHUNKS.inc(changes["chunks_deleted"], operation="deleted")
+    get_retrieval_engine().invalidate()
+    if changes["chunks_added"] or changes["chunks_deleted"]:
+        # Cached answers were grounded in chunks that may be gone
+        get_answer_cache().clear()
+    return {
+        "changes": changes,
+        "initial_state": initial_info,
+        "final_state": initializer.get_store_info()
+    }
+
+def run_rebuild_job(progress: IngestionProgress) -> Dict:
+    """Delete the vector store and index every PDF again"""
+    from app.clean_and_init_db import clean_vector_store, verify_pdf_directory
+    
+    if not verify_pdf_directory(settings.PDF_DIRECTORY):
+        raise RuntimeError("No PDF files found or invalid directory")
+    if not clean_vector_store(settings.CHROMA_DIRECTORY):
+        raise RuntimeError("Failed to clean vector store")
+    return run_sync_job(progress)
+
+# Rebuilds run on a worker thread so the event loop keeps serving chats; the
+# lock and job records are shared, so one job runs across all workers and
+# any worker can report it
+ingestion_jobs = IngestionJobManager(
+    {SYNC: run_sync_job, REBUILD: run_rebuild_job},
+    lock=vector_store_lock(settings.CHROMA_DIRECTORY),
+    state_dir=settings.INGESTION_JOBS_DIRECTORY,
+    publish_interval=settings.RAG_JOB_PROGRESS_INTERVAL
+)
+
+# Identical questions (same normalized text and index version) in flight at once share one answer
+answer_flights = SingleFlight()
+
+def sync_vector_store():
+    """Sync from the watcher thread, joining a sync that is already running"""
+    try:
+        job, _ = ingestion_jobs.submit(SYNC)
+    except IngestionRejected as e:
+        logger.info(f"Skipping watcher sync: {e}")
+        return
+    ingestion_jobs.wait(job.id)
+
+data_dir_watcher = DataDirectoryWatcher(
+    settings.PDF_DIRECTORY,
+    on_change=sync_vector_store,
+    poll_interval=settings.RAG_WATCH_POLL_INTERVAL,
+    debounce=settings.RAG_WATCH_DEBOUNCE
+)
+
+@app.on_event("startup")
+async def start_data_dir_watcher():
+    """Optionally keep the index in sync with edits to the PDF directory"""
+    if settings.RAG_WATCH_DATA_DIR:
+        data_dir_watcher.start()
+
+@app.on_event("shutdown")
+async def stop_data_dir_watcher():
+    data_dir_watcher.stop()
+
+@app.on_event("shutdown")
+async def stop_retrieval_pool():
+    close_async_retriever()
+
+@app.on_event("shutdown")
+async def close_llm_connections():
+    close_llm_provider()
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -34,6 +190,14 @@ async def health():
     """Health check endpoint"""
     return {"status": "healthy"}
 
+@app.get("/api/ready")
+async def ready(response: Response):
+    """Readiness probe: 503 until the startup warmup has opened the index"""
+    state = warmup.state()
+    if not state["ready"]:
+        response.status_code = 503
+    return state
+
 @app.get("/api/test/env")
 async def test_env():
     """Test environment and OpenAI key"""
@@ -53,19 +217,14 @@ async def test_imports():
     """Test importing required packages"""
     results = {}
     try:
-        # Test langchain import
-        try:
-            import langchain
-            results["langchain"] = "ok"
-        except ImportError as e:
-            results["langchain"] = str(e)
-
-        # Test OpenAI import
-        try:
-            import openai
-            results["openai"] = "ok"
-        except ImportError as e:
-            results["openai"] = str(e)
+        loop = asyncio.get_running_loop()
+        for name in ("langchain", "openai"):
+            # A first import takes up to seconds; run it off the event loop
+            try:
+                await loop.run_in_executor(None, importlib.import_module, name)
+                results[name] = "ok"
+            except ImportError as e:
+                results[name] = str(e)
 
         return {
             "status": "ok",
@@ -79,13 +238,10 @@ async def test_imports():
 async def test_embedding():
     """Test OpenAI embeddings"""
     try:
-        from langchain.embeddings import OpenAIEmbeddings
-        
-        embeddings = OpenAIEmbeddings()
         test_text = "Hello, world!"
         
         # Try to generate an embedding
-        result = embeddings.embed_query(test_text)
+        result = (await get_llm_provider().embed([test_text], model=settings.EMBEDDING_MODEL))[0]
         
         return {
             "status": "ok",
@@ -98,156 +254,313 @@ async def test_embedding():
 
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat(message: ChatMessage):
+    started = time.monotonic()
+    outcome = "error"
     try:
-        if not openai.api_key:
+        provider = get_llm_provider()
+        if not provider.configured:
             return ChatResponse(error="OpenAI API key not configured")
 
         if not message.messages:
             return ChatResponse(error="No message provided")
 
-        response = await openai.ChatCompletion.acreate(
-            model="gpt-4o-mini",
-            messages=[{"role": m["role"], "content": m["content"]} for m in message.messages]
+        result = await provider.chat(
+            [{"role": m["role"], "content": m["content"]} for m in message.messages],
+            model="gpt-4o-mini"
         )
+        CHAT_STAGE_SECONDS.observe(time.monotonic() - started, stage="llm_total")
+        record_usage(result.usage)
+        outcome = "answered"
         
-        return ChatResponse(response=response.choices[0].message.content, error=None)
+        return ChatResponse(response=result.content, error=None)
     except Exception as e:
         logger.error(f"Chat error: {str(e)}")
         return ChatResponse(error=str(e))
+    finally:
+        CHAT_REQUESTS.inc(endpoint="http", outcome=outcome)
+        CHAT_REQUEST_SECONDS.observe(time.monotonic() - started, endpoint="http")
+
+def record_usage(usage: Optional[Dict]):
+    if usage:
+        LLM_TOKENS.inc(usage.get("prompt_tokens", 0), direction="prompt")
+        LLM_TOKENS.inc(usage.get("completion_tokens", 0), direction="completion")
+
+def error_frame(message: str, stream: bool = False) -> Dict:
+    frame = {"error": message, "response": None}
+    if stream:
+        frame["type"] = "error"
+    return frame
+
+def build_rag_messages(context: str, user_message: str) -> List[Dict[str, str]]:
+    """Create messages for OpenAI with strict instructions"""
+    return [
+        {
+            "role": "system",
+            "content": """You are an AI assistant that ONLY answers questions based on the provided context. 
+            If the context doesn't contain enough information to answer the question, say 'I don't have enough information in the provided documents to answer this question.'
+            Do not make up information or use external knowledge.
+            
+            Context:
+            {context}""".format(context=context)
+        },
+        {"role": "user", "content": user_message}
+    ]
+
+def source_info(result: SearchResult) -> Dict:
+    return {
+        "id": result.id,
+        "score": result.score,
+        "fused_score": result.fused_score,
+        "source": os.path.basename(result.metadata.get("source", "")),
+        "page": result.metadata.get("page")
+    }
+
+async def stream_answer(
+    publish: Publish,
+    messages: List[Dict[str, str]],
+    results: List[SearchResult],
+    retrieval_ms: float,
+    cached_answer: Optional[str] = None
+) -> str:
+    """Publish a start frame with the sources, one delta frame per token and a done frame"""
+    publish({
+        "type": "start",
+        "error": None,
+        "sources": [source_info(result) for result in results]
+    })
+
+    if cached_answer is not None:
+        publish({"type": "delta", "content": cached_answer})
+        publish({
+            "type": "done",
+            "error": None,
+            "response": cached_answer,
+            "cached": True,
+            "usage": None,
+            "timing": {"retrieval_ms": retrieval_ms}
+        })
+        return cached_answer
+
+    completion = CompletionStream(messages, model="gpt-4o-mini", temperature=0.0)
+    try:
+        async for delta in completion.deltas():
+            publish({"type": "delta", "content": delta})
+    finally:
+        await completion.aclose()
+
+    timing = {"retrieval_ms": retrieval_ms, **completion.timing()}
+    if timing["time_to_first_token_ms"] is not None:
+        CHAT_STAGE_SECONDS.observe(timing["time_to_first_token_ms"] / 1000, stage="llm_first_token")
+    if timing["completion_ms"] is not None:
+        CHAT_STAGE_SECONDS.observe(timing["completion_ms"] / 1000, stage="llm_total")
+    record_usage(completion.usage)
+    logger.info(f"Streamed answer: {timing}, usage {completion.usage}")
+    publish({
+        "type": "done",
+        "error": None,
+        "response": completion.content,
+        "cached": False,
+        "usage": completion.usage,
+        "timing": timing
+    })
+    return completion.content
+
+async def produce_answer(user_message: str, publish: Publish):
+    """Retrieve context and answer from the answer cache or a streamed completion, publishing frames"""
+    retrieval_started = time.monotonic()
+    retrieval = await get_rag_retrieval(user_message)
+    retrieval_ms = round((time.monotonic() - retrieval_started) * 1000, 1)
+    results = retrieval.results if retrieval else []
+    if not results:
+        publish(error_frame("No relevant information found in the documents", stream=True))
+        return
+    
+    # A paraphrase of an answered question over the same chunks gets the same answer
+    chunk_ids = [result.id for result in results]
+    # Identifier lookups are answered by keyword search and have no embedding
+    use_answer_cache = settings.ANSWER_CACHE_ENABLED and retrieval.query_embedding is not None
+    cached = None
+    if use_answer_cache:
+        cached = get_answer_cache().lookup(retrieval.query_embedding, chunk_ids, retrieval.index_version)
+        CACHE_LOOKUPS.inc(cache="answer", result="miss" if cached is None else "hit")
+    
+    prompt_started = time.monotonic()
+    context = format_context(results)
+    messages = build_rag_messages(context, user_message)
+    CHAT_STAGE_SECONDS.observe(time.monotonic() - prompt_started, stage="prompt_build")
+    
+    if cached is None:
+        log_payload(logger, "Messages sent to OpenAI", messages)
+    
+    answer = await stream_answer(
+        publish, messages, results, retrieval_ms,
+        cached_answer=cached.answer if cached else None
+    )
+    
+    if cached is None and answer and use_answer_cache:
+        get_answer_cache().store(user_message, retrieval.query_embedding, chunk_ids, retrieval.index_version, answer)
+
+async def answer_question(websocket: WebSocket, user_message: str, stream: bool):
+    """Send the answer to one question, sharing the work with identical questions in flight"""
+    started = time.monotonic()
+    outcome = "error"
+    send_seconds = 0.0
+    key = (normalize_query(user_message), current_index_version())
+    flight, joined = answer_flights.join(key, lambda publish: produce_answer(user_message, publish))
+    if joined:
+        COALESCED_REQUESTS.inc()
+    try:
+        async for frame in flight.events_from_start():
+            reply = frame
+            if frame["type"] == "done":
+                outcome = "cached" if frame["cached"] else "answered"
+            if not stream:
+                if frame["type"] == "error":
+                    reply = error_frame(frame["error"])
+                elif frame["type"] == "done":
+                    reply = {
+                        "error": None,
+                        "response": frame["response"],
+                        "cached": frame["cached"]
+                    }
+                else:
+                    continue
+            send_started = time.monotonic()
+            await websocket.send_json(reply)
+            send_seconds += time.monotonic() - send_started
+    finally:
+        answer_flights.leave(flight)
+        CHAT_STAGE_SECONDS.observe(send_seconds, stage="socket_send")
+        CHAT_REQUESTS.inc(endpoint="websocket", outcome=outcome)
+        CHAT_REQUEST_SECONDS.observe(time.monotonic() - started, endpoint="websocket")
 
 @app.websocket("/api/chat/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    """Answer chat messages over a WebSocket.
+
+    Clients sending ``"stream": true`` get start/delta/done frames; others get
+    the whole answer in a single frame. Identical questions asked at the same
+    time are answered once and the result sent to every asker.
+    """
     await websocket.accept()
     logger.info("WebSocket connection accepted")
+    ACTIVE_WEBSOCKETS.inc()
     
     try:
         while True:
+            stream = False
             try:
                 # Get message
                 data = await websocket.receive_text()
+                # This connection's task has its own context, so the ID covers just this message
+                bind_request_id()
                 parsed_data = json.loads(data)
                 
                 if "message" not in parsed_data:
-                    await websocket.send_json({
-                        "error": "Message must contain 'message' key",
-                        "response": None
-                    })
+                    await websocket.send_json(error_frame("Message must contain 'message' key"))
                     continue
                 
                 user_message = parsed_data["message"]
-                
-                # Get context from RAG
-                context = await get_rag_context(user_message)
-                if not context:
-                    await websocket.send_json({
-                        "error": "No relevant information found in the documents",
-                        "response": None
-                    })
+                stream = bool(parsed_data.get("stream", False))
+                if not llm_configured():
+                    await websocket.send_json(error_frame("OpenAI API key not configured", stream))
                     continue
-                
-                # Create messages for OpenAI with strict instructions
-                messages = [
-                    {
-                        "role": "system",
-                        "content": """You are an AI assistant that ONLY answers questions based on the provided context. 
-                        If the context doesn't contain enough information to answer the question, say 'I don't have enough information in the provided documents to answer this question.'
-                        Do not make up information or use external knowledge.
-                        
-                        Context:
-                        {context}""".format(context=context)
-                    },
-                    {"role": "user", "content": user_message}
-                ]
-                
-                logger.info(f"Context used: {context}")
-                logger.info(f"Messages sent to OpenAI: {messages}")
-                
-                # Get OpenAI response
-                response = await openai.ChatCompletion.acreate(
-                    model="gpt-4o-mini",
-                    messages=messages,
-                    temperature=0.0  # Set to 0 for more focused answers
-                )
-                
-                await websocket.send_json({
-                    "error": None,
-                    "response": response.choices[0].message.content
-                })
+                await answer_question(websocket, user_message, stream)
                 
             except json.JSONDecodeError:
-                await websocket.send_json({
-                    "error": "Invalid JSON format",
-                    "response": None
-                })
+                await websocket.send_json(error_frame("Invalid JSON format"))
+            except WebSocketDisconnect:
+                raise
             except Exception as e:
                 logger.error(f"Error in websocket: {str(e)}")
-                await websocket.send_json({
-                    "error": str(e),
-                    "response": None
-                })
+                await websocket.send_json(error_frame(str(e), stream))
                 
     except WebSocketDisconnect:
         logger.info("WebSocket disconnected")
+    finally:
+        ACTIVE_WEBSOCKETS.dec()
 
-@app.post("/api/initialize-rag")
-async def initialize_rag():
-    """Initialize or update the RAG system with PDF files."""
+def submit_ingestion_job(kind: str, response: Response) -> Dict:
     try:
-        initializer = RAGInitializer(
-            pdf_dir="/app/data",
-            db_dir="/app/chroma_db"
-        )
-        
-        # Get initial state
-        initial_info = initializer.get_store_info()
-        
-        # Initialize vector store
-        success = initializer.initialize_vector_store()
-        
-        if success:
-            # Get updated state
-            final_info = initializer.get_store_info()
-            return {
-                "status": "success",
-                "initial_state": initial_info,
-                "final_state": final_info
-            }
-        else:
-            return {
-                "status": "error",
-                "message": "Failed to initialize vector store",
-                "initial_state": initial_info
-            }
-            
-    except Exception as e:
+        job, coalesced = ingestion_jobs.submit(kind)
+        return {
+            "status": "accepted",
+            "job_id": job.id,
+            "coalesced": coalesced,
+            "job": job.to_dict()
+        }
+    except IngestionRejected as e:
+        response.status_code = 409
         return {
             "status": "error",
-            "message": str(e)
+            "message": str(e),
+            "job_id": e.active.id if e.active is not None else None
         }
 
+@app.post("/api/initialize-rag")
+async def initialize_rag(response: Response):
+    """Start an incremental sync of the RAG system with the PDF files on disk.
+
+    Returns a job ID at once; poll /api/ingestion/jobs/{job_id} for progress.
+    409 if a rebuild is running in any worker.
+    """
+    return submit_ingestion_job(SYNC, response)
+
+@app.get("/api/ingestion/jobs")
+async def list_ingestion_jobs():
+    """Recent ingestion jobs, newest first"""
+    return {"status": "success", "jobs": [job.to_dict() for job in ingestion_jobs.recent()]}
+
+@app.get("/api/ingestion/jobs/{job_id}")
+async def get_ingestion_job(job_id: str):
+    """Status, progress and result of an ingestion job"""
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown ingestion job")
+    return {"status": "success", "job": job.to_dict()}
+
+@app.websocket("/api/ingestion/jobs/{job_id}/ws")
+async def ingestion_job_progress(websocket: WebSocket, job_id: str):
+    """Push the job state every few hundred milliseconds until it finishes"""
+    await websocket.accept()
+    try:
+        while True:
+            job = ingestion_jobs.get(job_id)
+            if job is None:
+                await websocket.send_json({"error": "Unknown ingestion job", "job": None})
+                break
+            await websocket.send_json({"error": None, "job": job.to_dict()})
+            if not job.active:
+                break
+            await asyncio.sleep(settings.RAG_JOB_PROGRESS_INTERVAL)
+        await websocket.close()
+    except WebSocketDisconnect:
+        logger.info("Ingestion progress WebSocket disconnected")
+
 @app.get("/api/debug-rag")
 async def debug_rag():
     """Debug endpoint to check RAG system state"""
     try:
-        vector_store = Chroma(
-            persist_directory="/app/chroma_db",
-            embedding_function=OpenAIEmbeddings()
-        )
-        
-        # Get collection stats
-        collection = vector_store._collection
+        engine = get_retrieval_engine()
+        vector_store = engine.vector_store
         
         # Get a sample document to verify content
-        sample_results = vector_store.similarity_search(
-            "what is this document about",
-            k=1
-        )
+        sample_results = await get_async_retriever().search("what is this document about", k=1)
         
         return {
             "status": "success",
-            "document_count": collection.count(),
-            "sample_content": sample_results[0].page_content if sample_results else None,
+            "document_count": engine.count(),
+            "vector_index": engine.index.stats(),
+            "index_version": engine.index_version,
+            "sample_content": sample_results[0].content if sample_results else None,
             "embedding_function": str(vector_store._embedding_function),
+            "query_embedding_cache": get_query_embeddings().cache.stats(),
+            "query_embedding_batches": getattr(get_query_embeddings().embeddings, "stats", lambda: None)(),
+            "retrieval": get_async_retriever().stats(),
+            "answer_cache": get_answer_cache().stats(),
+            "single_flight": answer_flights.stats(),
+            "llm_provider": get_llm_provider().stats(),
+            "log_records_dropped": dropped_records(),
             "persist_directory": vector_store._persist_directory
         }
         
@@ -257,91 +570,50 @@ async def debug_rag():
             "error": str(e)
         }
 
-async def get_rag_context(query: str) -> str:
-    """Get relevant context from RAG for the query"""
+async def get_rag_retrieval(query: str) -> Optional[Retrieval]:
+    """Get the chunks most relevant to the query, with the query embedding and index version"""
     try:
-        vector_store = Chroma(
-            persist_directory="/app/chroma_db",
-            embedding_function=OpenAIEmbeddings()
-        )
+        # Runs on the retrieval thread pool so a slow search does not block other sockets
+        retrieval = await get_async_retriever().retrieve(query, k=settings.RAG_TOP_K)
+        timing = retrieval.timing
+        logger.info(f"Retrieval waited {timing.queue_ms}ms, searched in {timing.search_ms}ms")
+        CHAT_STAGE_SECONDS.observe(timing.queue_ms / 1000, stage="retrieval_queue")
+        CHAT_STAGE_SECONDS.observe(timing.embed_ms / 1000, stage="embedding")
+        CHAT_STAGE_SECONDS.observe((timing.search_ms - timing.embed_ms) / 1000, stage="vector_search")
+        for result in retrieval.results:
+            if result.score is not None:
+                RETRIEVED_CHUNK_SCORE.observe(result.score)
+            if result.fused_score is not None:
+                RETRIEVED_CHUNK_FUSED_SCORE.observe(result.fused_score)
         
-        # Get more relevant documents and with higher similarity threshold
-        docs = vector_store.similarity_search_with_score(
-            query, 
-            k=3,  # Get top 3 most relevant chunks
-            score_threshold=0.7  # Only return relatively good matches
-        )
-        
-        if not docs:
+        if not retrieval.results:
             logger.warning(f"No relevant documents found for query: {query}")
-            return ""
         
-        # Combine context from documents, including relevance scores
-        context_parts = []
-        for doc, score in docs:
-            logger.info(f"Document chunk (score {score}): {doc.page_content}")
-            context_parts.append(doc.page_content)
-            
-        context = "\n\nRelevant passage:\n".join(context_parts)
-        return context
+        log_payload(logger, "Retrieved chunks", [(result.score, result.fused_score, result.content) for result in retrieval.results])
+        return retrieval
         
     except Exception as e:
         logger.error(f"Error getting RAG context: {str(e)}")
-        return ""
+        return None
+
+async def get_rag_results(query: str) -> List[SearchResult]:
+    """Get the chunks most relevant to the query"""
+    retrieval = await get_rag_retrieval(query)
+    return retrieval.results if retrieval else []
+
+def format_context(results: List[SearchResult]) -> str:
+    """Combine context from documents within the context token budget"""
+    packed = pack_context(results, settings.RAG_CONTEXT_TOKEN_BUDGET)
+    logger.info(f"Packed context: {packed.stats()}")
+    return packed.text
+
+async def get_rag_context(query: str) -> str:
+    """Get relevant context from RAG for the query"""
+    return format_context(await get_rag_results(query))
 
 @app.post("/api/clean-and-init-rag")
-async def clean_and_init_rag():
-    """Clean and reinitialize the RAG system"""
-    try:
-        from app.clean_and_init_db import clean_vector_store, verify_pdf_directory
-        from app.rag.initialize_rag import RAGInitializer
-        
-        pdf_dir = "/app/data"
-        db_dir = "/app/chroma_db"
-        
-        # Verify PDF directory
-        pdf_files = verify_pdf_directory(pdf_dir)
-        if not pdf_files:
-            return {
-                "status": "error",
-                "message": "No PDF files found or invalid directory"
-            }
-        
-        # Clean existing vector store
-        if not clean_vector_store(db_dir):
-            return {
-                "status": "error",
-                "message": "Failed to clean vector store"
-            }
-        
-        # Initialize new vector store
-        initializer = RAGInitializer(pdf_dir=pdf_dir, db_dir=db_dir)
-        
-        # Get initial state
-        initial_info = initializer.get_store_info()
-        
-        # Initialize vector store
-        success = initializer.initialize_vector_store()
-        if not success:
-            return {
-                "status": "error",
-                "message": "Failed to initialize vector store"
-            }
-        
-        # Get final state
-        final_info = initializer.get_store_info()
-        
-        return {
-            "status": "success",
-            "message": "Vector store reinitialized successfully",
-            "initial_state": initial_info,
-            "final_state": final_info
-        }
-        
-    except Exception as e:
-        return {
-            "status": "error",
-            "message": str(e)
-        }
+async def clean_and_init_rag(response: Response):
+    """Start a job that cleans and reinitializes the RAG system"""
+    return submit_ingestion_job(REBUILD, response)
 
 # Remove all other endpoints for now
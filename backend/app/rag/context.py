@@ -0,0 +1,129 @@
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from app.rag.parsing import CHUNK_OVERLAP
+from app.services.memory.vector_store import SearchResult
+from app.utils.tokens import count_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+PASSAGE_SEPARATOR = "\n\nRelevant passage:\n"
+TOKEN_COUNT_KEY = "token_count"
+
+# A passage cut to fewer tokens than this is left out rather than truncated
+MIN_PASSAGE_TOKENS = 32
+
+
+def chunk_tokens(result: SearchResult) -> int:
+    """Token count recorded at ingestion, or counted now for chunks indexed before it was."""
+    cached = result.metadata.get(TOKEN_COUNT_KEY)
+    return int(cached) if cached is not None else count_tokens(result.content)
+
+
+def overlap_length(left: str, right: str, max_overlap: int = CHUNK_OVERLAP) -> int:
+    """Length of the longest suffix of ``left`` that is also a prefix of ``right``."""
+    for size in range(min(len(left), len(right), max_overlap), 0, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+@dataclass
+class Passage:
+    """One or more adjacent chunks of a source page, in document order."""
+    source: str
+    page: Optional[int]
+    rank: int
+    chunks: List[SearchResult] = field(default_factory=list)
+    text: str = ""
+    tokens: int = 0
+
+    @property
+    def last_index(self) -> Optional[int]:
+        return self.chunks[-1].metadata.get("chunk_index") if self.chunks else None
+
+    def append(self, result: SearchResult):
+        """Add the chunk following this passage, without the text the two share."""
+        shared = overlap_length(self.text, result.content)
+        self.chunks.append(result)
+        if not self.text:
+            self.text = result.content
+            self.tokens = chunk_tokens(result)
+            return
+        self.text = self.text + ("\n" if not shared else "") + result.content[shared:]
+        self.tokens += chunk_tokens(result) - (count_tokens(result.content[:shared]) if shared else 0)
+
+
+@dataclass
+class PackedContext:
+    text: str
+    passages: List[Passage]
+    tokens: int
+    # Chunks left out because the budget was spent
+    dropped: int = 0
+
+    def stats(self) -> Dict:
+        return {
+            "passages": len(self.passages),
+            "chunks": sum(len(p.chunks) for p in self.passages),
+            "tokens": self.tokens,
+            "dropped_chunks": self.dropped
+        }
+
+
+def merge_adjacent(results: List[SearchResult]) -> List[Passage]:
+    """Group chunks into passages of consecutive chunks from the same source page.
+
+    Passages are ordered by the rank of their best chunk; ``results`` is
+    expected best first, as retrieval returns it.
+    """
+    by_key: Dict[tuple, List[tuple]] = {}
+    for rank, result in enumerate(results):
+        key = (result.metadata.get("source"), result.metadata.get("page"))
+        by_key.setdefault(key, []).append((rank, result))
+
+    passages = []
+    for (source, page), ranked in by_key.items():
+        ranked.sort(key=lambda item: (item[1].metadata.get("chunk_index") is None, item[1].metadata.get("chunk_index") or 0))
+        current: Optional[Passage] = None
+        for rank, result in ranked:
+            index = result.metadata.get("chunk_index")
+            adjacent = (
+                current is not None and source is not None and index is not None
+                and current.last_index is not None and index == current.last_index + 1
+            )
+            if not adjacent:
+                current = Passage(source=source, page=page, rank=rank)
+                passages.append(current)
+            current.rank = min(current.rank, rank)
+            current.append(result)
+    return sorted(passages, key=lambda passage: passage.rank)
+
+
+def pack_context(results: List[SearchResult], token_budget: int) -> PackedContext:
+    """Fit the best passages into ``token_budget`` prompt tokens.
+
+    Adjacent chunks are merged so their overlap is sent once, passages go in
+    rank order, and the last one that does not fit whole is truncated if a
+    useful part of it fits.
+    """
+    separator_tokens = count_tokens(PASSAGE_SEPARATOR)
+    packed, texts, used, dropped = [], [], 0, 0
+    for passage in merge_adjacent(results):
+        cost = passage.tokens + (separator_tokens if texts else 0)
+        remaining = token_budget - used
+        if cost <= remaining:
+            text = passage.text
+        elif remaining - (cost - passage.tokens) >= MIN_PASSAGE_TOKENS:
+            text = truncate_to_tokens(passage.text, remaining - (cost - passage.tokens))
+            cost = remaining
+        else:
+            dropped += len(passage.chunks)
+            continue
+        texts.append(text)
+        packed.append(passage)
+        used += cost
+    if dropped:
+        logger.info(f"Context budget of {token_budget} tokens left out {dropped} chunks")
+    return PackedContext(text=PASSAGE_SEPARATOR.join(texts), passages=packed, tokens=used, dropped=dropped)
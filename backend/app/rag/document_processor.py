@@ -1,20 +1,23 @@
 import os
+import uuid
 from typing import List, Optional
 import logging
 from langchain.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.embeddings import OpenAIEmbeddings
 from langchain.vectorstores import Chroma
 from langchain.schema import Document
+from app.core.config import settings
+from app.rag.parsing import parse_pdfs
+from app.rag.pipeline import IngestionPipeline
+from app.services.knowledge_base.embeddings import get_ingestion_embeddings
 
-# Set up detailed logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class DocumentProcessor:
-    def __init__(self, persist_directory: str = "chroma_db"):
+    def __init__(self, persist_directory: str = "chroma_db", parse_workers: int = settings.RAG_PARSE_WORKERS):
         self.persist_directory = persist_directory
-        self.embeddings = OpenAIEmbeddings()
+        self.parse_workers = parse_workers
+        self.embeddings = get_ingestion_embeddings()
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=200,
@@ -62,6 +65,19 @@ class DocumentProcessor:
             logger.error(f"Steps completed before error: {', '.join(steps_completed)}")
             return None
 
+    def _process_pdfs_sequentially(self, directory_path: str, pdf_files: List[str]):
+        for filename in pdf_files:
+            logger.info(f"Processing {filename}")
+            yield filename, self.process_pdf(os.path.join(directory_path, filename))
+
+    def _process_pdfs_in_pool(self, directory_path: str, pdf_files: List[str]):
+        """Parse and split files across worker processes, yielding in input order."""
+        paths = [os.path.join(directory_path, f) for f in pdf_files]
+        for filename, (_, chunks, error) in zip(pdf_files, parse_pdfs(paths, workers=self.parse_workers)):
+            if error is not None:
+                logger.error(f"Error processing {filename}: {error}")
+            yield filename, chunks
+
     def process_directory(self, directory_path: str) -> List[Document]:
         """Process all PDFs in a directory with detailed logging."""
         all_chunks = []
@@ -69,14 +85,15 @@ class DocumentProcessor:
         failed_files = []
 
         try:
-            pdf_files = [f for f in os.listdir(directory_path) if f.endswith('.pdf')]
+            pdf_files = sorted(f for f in os.listdir(directory_path) if f.endswith('.pdf'))
             logger.info(f"Found {len(pdf_files)} PDF files in {directory_path}")
 
-            for filename in pdf_files:
-                file_path = os.path.join(directory_path, filename)
-                logger.info(f"Processing {filename}")
-                
-                chunks = self.process_pdf(file_path)
+            if self.parse_workers > 1:
+                results = self._process_pdfs_in_pool(directory_path, pdf_files)
+            else:
+                results = self._process_pdfs_sequentially(directory_path, pdf_files)
+
+            for filename, chunks in results:
                 if chunks:
                     all_chunks.extend(chunks)
                     processed_files.append(filename)
@@ -103,11 +120,29 @@ class DocumentProcessor:
             logger.info(f"Creating vector store with {len(documents)} documents")
             logger.info(f"Using persist directory: {self.persist_directory}")
             
-            vectorstore = Chroma.from_documents(
-                documents=documents,
-                embedding=self.embeddings,
-                persist_directory=self.persist_directory
+            vectorstore = Chroma(
+                persist_directory=self.persist_directory,
+                embedding_function=self.embeddings
+            )
+
+            def upsert(ids, texts, metadatas, vectors):
+                vectorstore._collection.add(
+                    ids=ids,
+                    embeddings=vectors,
+                    documents=texts,
+                    metadatas=metadatas
+                )
+
+            # Embed and write in bounded batches instead of all vectors at once
+            pipeline = IngestionPipeline(
+                self.embeddings,
+                upsert,
+                embed_batch_size=settings.RAG_EMBED_BATCH_SIZE,
+                upsert_batch_size=settings.RAG_UPSERT_BATCH_SIZE,
+                max_pending_batches=settings.RAG_PIPELINE_QUEUE_SIZE,
+                max_in_flight=settings.EMBEDDING_MAX_CONCURRENCY
             )
+            pipeline.run((str(uuid.uuid1()), doc) for doc in documents)
             
             logger.info("Persisting vector store")
             vectorstore.persist()
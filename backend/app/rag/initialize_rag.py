@@ -1,28 +1,54 @@
 import os
 import logging
-from typing import List, Dict
+import threading
+from typing import List, Dict, Optional
 from pathlib import Path
-from langchain.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.embeddings import OpenAIEmbeddings
 from langchain.vectorstores import Chroma
+from langchain.schema import Document
+from app.core.config import settings
+from app.rag.lexical_index import LexicalIndex
+from app.rag.manifest import IngestionManifest, chunk_id
+from app.rag.parsing import CHUNK_OVERLAP, CHUNK_SIZE, make_text_splitter, parse_pdfs, split_pdf
+from app.rag.pipeline import IngestionPipeline, IngestionProgress
+from app.services.knowledge_base.embeddings import get_ingestion_embeddings
+from app.services.knowledge_base.service import holding_vector_store_lock
+from app.services.memory.mmap_store import current_generation, write_mmap_index
+from app.services.memory.vector_store import detach_persistence
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Serializes writers to the vector store within this process; the file lock
+# taken with it serializes them across processes
+_ingestion_lock = threading.Lock()
+
 class RAGInitializer:
-    def __init__(self, pdf_dir: str, db_dir: str):
+    def __init__(self, pdf_dir: str, db_dir: str, parse_workers: int = settings.RAG_PARSE_WORKERS):
         self.pdf_dir = Path(pdf_dir)
         self.db_dir = Path(db_dir)
-        self.embeddings = OpenAIEmbeddings()
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len
-        )
+        self.parse_workers = parse_workers
+        self.embeddings = get_ingestion_embeddings()
+        self.chunk_size = CHUNK_SIZE
+        self.chunk_overlap = CHUNK_OVERLAP
+        self.text_splitter = make_text_splitter(self.chunk_size, self.chunk_overlap)
         
-    def load_pdfs(self) -> List[Dict]:
+    def list_pdfs(self) -> List[Path]:
+        """PDFs in the data directory, in a stable order."""
+        return sorted(self.pdf_dir.glob("*.pdf"))
+
+    def load_pdf(self, pdf_path: Path) -> List[Document]:
+        """Load and split a single PDF, numbering its chunks in document order."""
+        return split_pdf(pdf_path, self.chunk_size, self.chunk_overlap)
+
+    def parse_pdfs(self, pdf_files: List[Path]):
+        """Parse files sequentially or across ``parse_workers`` processes, in input order."""
+        return parse_pdfs(
+            pdf_files,
+            workers=self.parse_workers,
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap
+        )
+
+    def load_pdfs(self) -> List[Document]:
         """Load all PDFs from the directory and return their chunks."""
         all_chunks = []
         
@@ -30,46 +56,150 @@ class RAGInitializer:
             logger.error(f"PDF directory {self.pdf_dir} does not exist")
             return all_chunks
             
-        pdf_files = list(self.pdf_dir.glob("*.pdf"))
+        pdf_files = self.list_pdfs()
         if not pdf_files:
             logger.warning(f"No PDF files found in {self.pdf_dir}")
             return all_chunks
             
-        for pdf_path in pdf_files:
-            try:
-                logger.info(f"Processing {pdf_path}")
-                loader = PyPDFLoader(str(pdf_path))
-                pages = loader.load()
-                chunks = self.text_splitter.split_documents(pages)
-                all_chunks.extend(chunks)
-                logger.info(f"Successfully processed {pdf_path}: {len(chunks)} chunks created")
-            except Exception as e:
-                logger.error(f"Error processing {pdf_path}: {str(e)}")
+        for pdf_path, chunks, error in self.parse_pdfs(pdf_files):
+            if error is not None:
+                logger.error(f"Error processing {pdf_path}: {error}")
+                continue
+            all_chunks.extend(chunks)
+            logger.info(f"Successfully processed {pdf_path}: {len(chunks)} chunks created")
                 
         return all_chunks
+
+    def sync_vector_store(self, progress: Optional[IngestionProgress] = None) -> Dict:
+        """Bring the vector store in line with the PDF directory.
+
+        Only new or modified files are parsed and embedded; chunks of modified
+        or removed files are deleted by their recorded IDs. ``progress`` is
+        updated as files are parsed and chunks embedded and written.
+        """
+        progress = progress or IngestionProgress()
+        with _ingestion_lock, holding_vector_store_lock(self.db_dir, {"kind": "sync"}):
+            self.db_dir.mkdir(parents=True, exist_ok=True)
+            if not self.pdf_dir.exists():
+                raise FileNotFoundError(f"PDF directory {self.pdf_dir} does not exist")
+
+            manifest = IngestionManifest.load(self.db_dir)
+            vector_store = Chroma(
+                persist_directory=str(self.db_dir),
+                embedding_function=self.embeddings
+            )
+            lexical_index = LexicalIndex.load(self.db_dir)
+            if not manifest.exists() and vector_store._collection.count():
+                # Chunks from before the manifest have random IDs and cannot be diffed
+                logger.warning("Vector store has no ingestion manifest, rebuilding it")
+                vector_store._collection.delete()
+                lexical_index.clear()
+            elif not lexical_index.exists() and vector_store._collection.count():
+                # Stores built before hybrid retrieval: index what is already there
+                existing = vector_store._collection.get(include=["documents"])
+                lexical_index.add(existing["ids"], existing["documents"])
+                logger.info(f"Built lexical index for {len(lexical_index)} existing chunks")
+
+            diff = manifest.diff(self.list_pdfs())
+            logger.info(f"Ingestion diff: {diff.summary()}")
+            progress.files_total = len(diff.to_index)
+
+            stale_ids = []
+            for source in diff.removed + [str(p) for p in diff.changed]:
+                stale_ids.extend(manifest.chunk_ids(source))
+                manifest.forget(source)
+            if stale_ids:
+                vector_store._collection.delete(ids=stale_ids)
+                lexical_index.remove(stale_ids)
+
+            failed_files = []
+            new_ids = {}
+
+            def chunk_stream():
+                for pdf_path, chunks, error in self.parse_pdfs(diff.to_index):
+                    source = str(pdf_path)
+                    if error is not None:
+                        logger.error(f"Error processing {pdf_path}: {error}")
+                        failed_files.append(pdf_path.name)
+                        progress.files_failed += 1
+                        continue
+
+                    file_hash = diff.hashes[source]
+                    ids = [chunk_id(source, file_hash, i) for i in range(len(chunks))]
+                    new_ids[source] = ids
+                    manifest.record(pdf_path, file_hash, ids)
+                    progress.files_parsed += 1
+                    progress.chunks_parsed += len(chunks)
+                    logger.info(f"Successfully processed {pdf_path}: {len(chunks)} chunks created")
+                    yield from zip(ids, chunks)
+
+            def upsert(ids, texts, metadatas, vectors):
+                vector_store._collection.add(
+                    ids=ids,
+                    embeddings=vectors,
+                    documents=texts,
+                    metadatas=metadatas
+                )
+                lexical_index.add(ids, texts)
+
+            pipeline = IngestionPipeline(
+                self.embeddings,
+                upsert,
+                embed_batch_size=settings.RAG_EMBED_BATCH_SIZE,
+                upsert_batch_size=settings.RAG_UPSERT_BATCH_SIZE,
+                max_pending_batches=settings.RAG_PIPELINE_QUEUE_SIZE,
+                max_in_flight=settings.EMBEDDING_MAX_CONCURRENCY,
+                progress=progress
+            )
+            try:
+                stats = pipeline.run(chunk_stream())
+            except Exception:
+                # Roll back the partially written files so the next run re-adds them
+                rollback_ids = [i for ids in new_ids.values() for i in ids]
+                if rollback_ids:
+                    vector_store._collection.delete(ids=rollback_ids)
+                    lexical_index.remove(rollback_ids)
+                for source in new_ids:
+                    manifest.forget(source)
+                vector_store.persist()
+                lexical_index.save()
+                manifest.save()
+                raise
+            chunks_added = stats["chunks"]
+
+            if diff.has_changes():
+                vector_store.persist()
+            if diff.has_changes() or not lexical_index.exists():
+                lexical_index.save()
+            if settings.MMAP_INDEX_ENABLED and (diff.has_changes() or current_generation(self.db_dir) is None):
+                self.publish_mmap_index(vector_store)
+            manifest.save()
+
+            result = diff.summary()
+            result.update({
+                "chunks_added": chunks_added,
+                "chunks_deleted": len(stale_ids),
+                "total_chunks": sum(len(entry["chunk_ids"]) for entry in manifest.files.values()),
+                "failed_files": failed_files,
+                "chunks_per_second": stats["chunks_per_second"]
+            })
+            logger.info(f"Vector store synced: {result}")
+            return result
         
+    def publish_mmap_index(self, vector_store: Chroma):
+        """Write the collection out as a new generation of the memory-mapped index."""
+        data = vector_store._collection.get(include=["embeddings", "documents", "metadatas"])
+        write_mmap_index(self.db_dir, data["ids"], data["documents"], data["metadatas"], data["embeddings"])
+
     def initialize_vector_store(self) -> bool:
         """Initialize the vector store with PDF contents."""
         try:
-            # Create db directory if it doesn't exist
-            self.db_dir.mkdir(parents=True, exist_ok=True)
-            
-            # Load and chunk PDFs
-            chunks = self.load_pdfs()
-            if not chunks:
+            result = self.sync_vector_store()
+            if not result["total_chunks"]:
                 logger.warning("No chunks created from PDFs")
                 return False
-                
-            # Create or update vector store
-            logger.info(f"Creating vector store in {self.db_dir}")
-            vector_store = Chroma.from_documents(
-                documents=chunks,
-                embedding=self.embeddings,
-                persist_directory=str(self.db_dir)
-            )
-            vector_store.persist()
-            
-            logger.info(f"Successfully initialized vector store with {len(chunks)} chunks")
+
+            logger.info(f"Successfully initialized vector store with {result['total_chunks']} chunks")
             return True
             
         except Exception as e:
@@ -83,9 +213,10 @@ class RAGInitializer:
                 persist_directory=str(self.db_dir),
                 embedding_function=self.embeddings
             )
+            detach_persistence(vector_store)
             
             return {
-                "total_documents": len(vector_store.get()["ids"]),
+                "total_documents": vector_store._collection.count(),
                 "pdf_files": [f.name for f in self.pdf_dir.glob("*.pdf")],
                 "db_location": str(self.db_dir)
             }
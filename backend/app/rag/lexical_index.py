@@ -0,0 +1,294 @@
+import heapq
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_INDEX_FILENAME = "lexical_index.json"
+# Header of the flat-file postings written next to a memory-mapped index
+MAPPED_LEXICAL_HEADER = "lexical.json"
+
+# Words joined by - _ . / : # stay together, so "SKU-1042" and "ERR_TIMEOUT" are single terms
+_TOKEN = re.compile(r"[A-Za-z0-9]+(?:[-_./:#][A-Za-z0-9]+)*")
+_SEPARATOR = re.compile(r"[-_./:#]")
+_IDENTIFIER = re.compile(r"^[A-Za-z0-9]+(?:[-_./:#][A-Za-z0-9]+)*$")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by do does for from how i in is it of on or our the this to "
+    "we what when where which who why with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Casefolded terms; compound identifiers are indexed whole and by their parts."""
+    terms = []
+    for match in _TOKEN.finditer(text):
+        token = match.group().casefold()
+        terms.append(token)
+        parts = _SEPARATOR.split(token)
+        if len(parts) > 1:
+            terms.extend(parts)
+    return [term for term in terms if term not in STOPWORDS]
+
+
+def looks_like_identifier(query: str) -> bool:
+    """A single token such as a product code, SKU or error string, not a plain word."""
+    query = query.strip()
+    if not _IDENTIFIER.match(query):
+        return False
+    return any(c.isdigit() for c in query) or bool(_SEPARATOR.search(query))
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Combine ranked ID lists; each list contributes 1 / (k + rank) per ID."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class LexicalIndex:
+    """In-memory BM25 inverted index over chunk texts.
+
+    Stored as JSON next to the Chroma files (term frequencies per chunk only;
+    texts stay in Chroma) and updated by ingestion as chunks are added or
+    deleted, so it always covers the same chunk IDs as the collection.
+    """
+
+    def __init__(self, db_dir: Path, k1: float = 1.5, b: float = 0.75):
+        self.path = Path(db_dir) / LEXICAL_INDEX_FILENAME
+        self.k1 = k1
+        self.b = b
+        self.docs: Dict[str, Dict[str, int]] = {}
+        self.lengths: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.total_length = 0
+
+    @classmethod
+    def load(cls, db_dir: Path) -> "LexicalIndex":
+        index = cls(db_dir)
+        if index.path.exists():
+            try:
+                with open(index.path) as f:
+                    docs = json.load(f).get("docs", {})
+                for doc_id, terms in docs.items():
+                    index._add_terms(doc_id, terms)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable lexical index {index.path}: {e}")
+                index.clear()
+        return index
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"docs": self.docs}, f)
+        os.replace(tmp_path, self.path)
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def _add_terms(self, doc_id: str, terms: Dict[str, int]):
+        if doc_id in self.docs:
+            self.remove([doc_id])
+        self.docs[doc_id] = terms
+        length = sum(terms.values())
+        self.lengths[doc_id] = length
+        self.total_length += length
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+
+    def add(self, ids: List[str], texts: List[str]):
+        for doc_id, text in zip(ids, texts):
+            self._add_terms(doc_id, dict(Counter(tokenize(text))))
+
+    def remove(self, ids: Iterable[str]):
+        for doc_id in ids:
+            terms = self.docs.pop(doc_id, None)
+            if terms is None:
+                continue
+            self.total_length -= self.lengths.pop(doc_id)
+            for term in terms:
+                posting = self.postings.get(term)
+                if posting is not None:
+                    posting.pop(doc_id, None)
+                    if not posting:
+                        del self.postings[term]
+
+    def clear(self):
+        self.docs.clear()
+        self.lengths.clear()
+        self.postings.clear()
+        self.total_length = 0
+
+    def document_frequency(self, term: str) -> int:
+        return len(self.postings.get(term, ()))
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Top ``k`` chunk IDs by BM25 score, best first."""
+        n = len(self.docs)
+        if not n:
+            return []
+        avg_length = self.total_length / n or 1.0
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, tf in posting.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def is_exact_identifier(self, query: str) -> bool:
+        """True for identifier-like queries that occur verbatim in the corpus."""
+        return looks_like_identifier(query) and self.document_frequency(query.strip().casefold()) > 0
+
+
+def _map(path: Path, dtype, count: int) -> np.ndarray:
+    # np.memmap cannot map an empty file
+    if not count:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+
+def write_lexical_postings(directory: Path, texts: Sequence[str]):
+    """Write BM25 postings for the rows ``0..len(texts) - 1`` as flat files.
+
+    ``lexical_terms.bin`` holds the UTF-8 terms in byte order, located by
+    ``lexical_term_offsets.i64``; the postings of term t are rows
+    ``lexical_starts.i64[t]`` to ``[t + 1]`` of ``lexical_rows.i32`` (row
+    numbers) and ``lexical_tfs.i32`` (term frequencies). ``lexical_lengths.i32``
+    holds each row's length in terms. ``MappedLexicalIndex`` reads them.
+    """
+    directory = Path(directory)
+    postings: Dict[bytes, List[Tuple[int, int]]] = {}
+    lengths = np.zeros(len(texts), dtype=np.int32)
+    for row, text in enumerate(texts):
+        terms = Counter(tokenize(text))
+        lengths[row] = sum(terms.values())
+        for term, tf in terms.items():
+            postings.setdefault(term.encode("utf-8"), []).append((row, tf))
+
+    terms = sorted(postings)
+    term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    starts = np.zeros(len(terms) + 1, dtype=np.int64)
+    for i, term in enumerate(terms):
+        term_offsets[i + 1] = term_offsets[i] + len(term)
+        starts[i + 1] = starts[i] + len(postings[term])
+    entries = np.array([entry for term in terms for entry in postings[term]], dtype=np.int32).reshape(-1, 2)
+
+    with open(directory / "lexical_terms.bin", "wb") as f:
+        f.write(b"".join(terms))
+    term_offsets.tofile(directory / "lexical_term_offsets.i64")
+    starts.tofile(directory / "lexical_starts.i64")
+    np.ascontiguousarray(entries[:, 0]).tofile(directory / "lexical_rows.i32")
+    np.ascontiguousarray(entries[:, 1]).tofile(directory / "lexical_tfs.i32")
+    lengths.tofile(directory / "lexical_lengths.i32")
+    with open(directory / MAPPED_LEXICAL_HEADER, "w") as f:
+        json.dump({
+            "count": len(texts),
+            "terms": len(terms),
+            "postings": int(starts[-1]),
+            "total_length": int(lengths.sum())
+        }, f)
+
+
+class MappedLexicalIndex:
+    """Read-only BM25 over postings written by ``write_lexical_postings``.
+
+    Every file is an ``np.memmap`` view, so workers share the postings through
+    the page cache instead of each parsing the JSON index into its heap.
+    Terms are found by binary search; ``ids`` names the rows.
+    """
+
+    def __init__(self, directory: Path, ids: Sequence[str], k1: float = 1.5, b: float = 0.75):
+        directory = Path(directory)
+        with open(directory / MAPPED_LEXICAL_HEADER) as f:
+            header = json.load(f)
+        if header["count"] != len(ids):
+            raise ValueError(f"Lexical postings cover {header['count']} rows, the index has {len(ids)}")
+        self.ids = ids
+        self.k1 = k1
+        self.b = b
+        self.total_length = header["total_length"]
+        self.term_count = header["terms"]
+        self.terms = _map(directory / "lexical_terms.bin", np.uint8, int(os.path.getsize(directory / "lexical_terms.bin")))
+        self.term_offsets = _map(directory / "lexical_term_offsets.i64", np.int64, self.term_count + 1)
+        self.starts = _map(directory / "lexical_starts.i64", np.int64, self.term_count + 1)
+        self.rows = _map(directory / "lexical_rows.i32", np.int32, header["postings"])
+        self.tfs = _map(directory / "lexical_tfs.i32", np.int32, header["postings"])
+        self.lengths = _map(directory / "lexical_lengths.i32", np.int32, header["count"])
+
+    @classmethod
+    def open(cls, directory: Path, ids: Sequence[str]) -> Optional["MappedLexicalIndex"]:
+        """The postings in ``directory``, or None if none were written there."""
+        if not (Path(directory) / MAPPED_LEXICAL_HEADER).exists():
+            return None
+        return cls(directory, ids)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _find(self, term: str) -> Optional[int]:
+        key = term.encode("utf-8")
+        lo, hi = 0, self.term_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            candidate = self.terms[int(self.term_offsets[mid]):int(self.term_offsets[mid + 1])].tobytes()
+            if candidate < key:
+                lo = mid + 1
+            elif candidate > key:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def _posting(self, term: str) -> Optional[slice]:
+        i = self._find(term)
+        return None if i is None else slice(int(self.starts[i]), int(self.starts[i + 1]))
+
+    def document_frequency(self, term: str) -> int:
+        posting = self._posting(term)
+        return 0 if posting is None else posting.stop - posting.start
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Top ``k`` chunk IDs by BM25 score, best first (as ``LexicalIndex.search``)."""
+        n = len(self.ids)
+        if not n or k <= 0:
+            return []
+        avg_length = self.total_length / n or 1.0
+        rows, scores = [], []
+        for term in set(tokenize(query)):
+            posting = self._posting(term)
+            if posting is None:
+                continue
+            term_rows = np.asarray(self.rows[posting])
+            tf = self.tfs[posting].astype(np.float64)
+            idf = math.log(1 + (n - len(term_rows) + 0.5) / (len(term_rows) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[term_rows] / avg_length)
+            rows.append(term_rows)
+            scores.append(idf * tf * (self.k1 + 1) / (tf + norm))
+        if not rows:
+            return []
+        matched, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(scores))
+        top = np.argsort(-totals, kind="stable")[:k]
+        return [(self.ids[int(matched[i])], float(totals[i])) for i in top]
+
+    def is_exact_identifier(self, query: str) -> bool:
+        """True for identifier-like queries that occur verbatim in the corpus."""
+        return looks_like_identifier(query) and self.document_frequency(query.strip().casefold()) > 0
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "ingestion_manifest.json"
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(source: str, file_hash: str, index: int) -> str:
+    """Deterministic ID for the ``index``-th chunk of a given version of a file."""
+    return hashlib.sha1(f"{source}:{file_hash}:{index}".encode("utf-8")).hexdigest()
+
+
+class ManifestDiff:
+    def __init__(self):
+        self.added: List[Path] = []
+        self.changed: List[Path] = []
+        self.removed: List[str] = []
+        self.unchanged: List[Path] = []
+        # sha256 of every added or changed file, computed while diffing
+        self.hashes: Dict[str, str] = {}
+
+    @property
+    def to_index(self) -> List[Path]:
+        return self.added + self.changed
+
+    def has_changes(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+    def summary(self) -> Dict:
+        return {
+            "added": [p.name for p in self.added],
+            "changed": [p.name for p in self.changed],
+            "removed": [Path(p).name for p in self.removed],
+            "unchanged": len(self.unchanged)
+        }
+
+
+class IngestionManifest:
+    """Record of every indexed PDF: size, mtime, content hash and its chunk IDs.
+
+    Stored as JSON next to the Chroma files, so cleaning the vector store
+    also drops the manifest and the next run rebuilds from scratch.
+    """
+
+    def __init__(self, db_dir: Path):
+        self.path = Path(db_dir) / MANIFEST_FILENAME
+        self.files: Dict[str, Dict] = {}
+
+    @classmethod
+    def load(cls, db_dir: Path) -> "IngestionManifest":
+        manifest = cls(db_dir)
+        if manifest.path.exists():
+            try:
+                with open(manifest.path) as f:
+                    manifest.files = json.load(f).get("files", {})
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable manifest {manifest.path}: {e}")
+        return manifest
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"files": self.files}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def chunk_ids(self, source: str) -> List[str]:
+        return self.files.get(source, {}).get("chunk_ids", [])
+
+    def record(self, path: Path, file_hash: str, ids: List[str]):
+        stat = path.stat()
+        self.files[str(path)] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": file_hash,
+            "chunk_ids": ids
+        }
+
+    def forget(self, source: str):
+        self.files.pop(source, None)
+
+    def diff(self, pdf_files: List[Path]) -> ManifestDiff:
+        """Compare files on disk with the manifest.
+
+        Size and mtime are checked first; the file is only hashed when either
+        differs, so an unchanged corpus costs one ``stat`` per file.
+        """
+        result = ManifestDiff()
+        seen = set()
+        for path in pdf_files:
+            source = str(path)
+            seen.add(source)
+            entry: Optional[Dict] = self.files.get(source)
+            stat = path.stat()
+            if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                result.unchanged.append(path)
+                continue
+
+            file_hash = file_sha256(path)
+            if entry is None:
+                result.added.append(path)
+                result.hashes[source] = file_hash
+            elif entry["sha256"] != file_hash:
+                result.changed.append(path)
+                result.hashes[source] = file_hash
+            else:
+                # Touched but identical content: refresh the stat fields only
+                entry["size"] = stat.st_size
+                entry["mtime"] = stat.st_mtime
+                result.unchanged.append(path)
+
+        result.removed = [source for source in self.files if source not in seen]
+        return result
@@ -0,0 +1,109 @@
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator, List, Optional, Sequence, Tuple, Union
+
+from app.utils.tokens import count_tokens
+
+if TYPE_CHECKING:
+    # langchain is imported by the functions that parse, so context packing
+    # can use the chunk geometry below without it
+    from langchain.schema import Document
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+
+def make_text_splitter(chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len
+    )
+
+
+def iter_pdf_chunks(path: Union[str, Path], chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> Iterator["Document"]:
+    """Stream one PDF page by page and yield its chunks numbered in document order.
+
+    Splitting page by page gives the same chunks as ``split_documents`` on the
+    whole page list, without holding every parsed page of a large manual at
+    once. Each chunk's token count is recorded so context packing need not
+    recount it.
+    """
+    from langchain.document_loaders import PyPDFLoader
+
+    splitter = make_text_splitter(chunk_size, chunk_overlap)
+    index = 0
+    for page in PyPDFLoader(str(path)).lazy_load():
+        for chunk in splitter.split_documents([page]):
+            chunk.metadata["chunk_index"] = index
+            chunk.metadata["token_count"] = count_tokens(chunk.page_content)
+            index += 1
+            yield chunk
+
+
+def split_pdf(path: Union[str, Path], chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> List["Document"]:
+    """Load one PDF and split it into chunks numbered in document order.
+
+    Unlike ``iter_pdf_chunks`` this holds every chunk of the file at once.
+    """
+    return list(iter_pdf_chunks(path, chunk_size, chunk_overlap))
+
+
+def _split_pdf_isolated(args: Tuple[str, int, int]) -> Tuple[Optional[List["Document"]], Optional[str]]:
+    """Worker entry point: never raises, so one bad file cannot abort the batch."""
+    path, chunk_size, chunk_overlap = args
+    try:
+        return split_pdf(path, chunk_size, chunk_overlap), None
+    except Exception as e:
+        return None, str(e)
+
+
+def parse_pdfs(
+    paths: Sequence[Path],
+    workers: int = 1,
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP
+) -> Iterator[Tuple[Path, Optional[List["Document"]], Optional[str]]]:
+    """Yield ``(path, chunks, error)`` for each PDF, in the order of ``paths``.
+
+    With ``workers > 1`` files are parsed and split in a process pool; results
+    are still yielded in input order so chunk order and IDs stay deterministic.
+    Exactly one of ``chunks`` and ``error`` is set for each file.
+
+    Each file's chunks are returned as one list, so memory is bounded per
+    file, not per page: a single large manual is held whole, and the pool
+    holds up to ``2 * workers`` files' chunks while the consumer catches up.
+    """
+    jobs = [(str(path), chunk_size, chunk_overlap) for path in paths]
+    if workers <= 1 or len(jobs) <= 1:
+        for path, job in zip(paths, jobs):
+            chunks, error = _split_pdf_isolated(job)
+            yield path, chunks, error
+        return
+
+    # spawn, not fork: the server process holds threads and open DB handles
+    context = multiprocessing.get_context("spawn")
+    pool_size = min(workers, len(jobs))
+    # Only a window of files is in flight, so parsed-but-unconsumed chunks stay
+    # bounded when the consumer (embedding) is slower than the workers
+    window = pool_size * 2
+    with ProcessPoolExecutor(max_workers=pool_size, mp_context=context) as executor:
+        logger.info(f"Parsing {len(jobs)} PDFs with {pool_size} worker processes")
+        pending = deque()
+        remaining = iter(zip(paths, jobs))
+        for path, job in islice(remaining, window):
+            pending.append((path, executor.submit(_split_pdf_isolated, job)))
+        while pending:
+            path, future = pending.popleft()
+            chunks, error = future.result()
+            for next_path, next_job in islice(remaining, 1):
+                pending.append((next_path, executor.submit(_split_pdf_isolated, next_job)))
+            yield path, chunks, error
@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+from app.services.knowledge_base.base import Embeddings
+from app.services.knowledge_base.embeddings import aembed_documents
+
+if TYPE_CHECKING:
+    from langchain.schema import Document
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# (ids, texts, metadatas, vectors) handed to the upsert stage
+UpsertBatch = Tuple[List[str], List[str], List[Dict], List[List[float]]]
+
+_DONE = object()
+
+
+class _StageError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+@dataclass
+class IngestionProgress:
+    """Counters for a running ingestion, updated by its stages and read from other threads."""
+    files_total: int = 0
+    files_parsed: int = 0
+    files_failed: int = 0
+    chunks_parsed: int = 0
+    chunks_embedded: int = 0
+    chunks_written: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    def estimated_total_chunks(self) -> Optional[int]:
+        files_done = self.files_parsed + self.files_failed
+        if not files_done:
+            return None
+        if files_done >= self.files_total:
+            return self.chunks_parsed
+        # Extrapolate from the chunks per file seen so far
+        return round(self.chunks_parsed / files_done * self.files_total)
+
+    def eta_seconds(self) -> Optional[float]:
+        total = self.estimated_total_chunks()
+        if not total or not self.chunks_written:
+            return None
+        done = min(self.chunks_written / total, 1.0)
+        elapsed = time.monotonic() - self.started_at
+        return round(elapsed * (1 - done) / done, 1)
+
+    def to_dict(self) -> Dict:
+        return {
+            "files_total": self.files_total,
+            "files_parsed": self.files_parsed,
+            "files_failed": self.files_failed,
+            "chunks_parsed": self.chunks_parsed,
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_written": self.chunks_written,
+            "estimated_total_chunks": self.estimated_total_chunks(),
+            "elapsed_seconds": round(time.monotonic() - self.started_at, 1),
+            "eta_seconds": self.eta_seconds()
+        }
+
+
+def batched(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Group ``items`` into lists of ``size`` (the last one may be shorter)."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class IngestionPipeline:
+    """Chunks -> fixed-size embedding batches -> batched upserts.
+
+    Each stage runs in its own thread and hands work to the next through a
+    bounded queue, so parsing, embedding and writing overlap and at most
+    ``max_pending_batches`` batches per stage are held in memory, however
+    large the corpus. The chunks feeding it are parsed a file at a time (see
+    ``parse_pdfs``), so the largest file adds to that bound. The embedding
+    stage keeps ``max_in_flight`` batches in progress concurrently and still
+    emits them in input order. Upserts are grouped separately from embedding
+    batches because chromadb rewrites its whole hnswlib index file on every
+    add.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        upsert: Callable[[List[str], List[str], List[Dict], List[List[float]]], None],
+        embed_batch_size: int = 64,
+        upsert_batch_size: int = 1024,
+        max_pending_batches: int = 4,
+        max_in_flight: int = 1,
+        progress: Optional[IngestionProgress] = None
+    ):
+        self.embeddings = embeddings
+        self.upsert = upsert
+        self.embed_batch_size = embed_batch_size
+        self.upsert_batch_size = upsert_batch_size
+        self.max_pending_batches = max_pending_batches
+        self.max_in_flight = max_in_flight
+        self.progress = progress
+        self._stop = threading.Event()
+
+    def _put(self, q: queue.Queue, item):
+        """Blocking put that gives up once a downstream stage has failed."""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        """Blocking get that returns ``_DONE`` once a downstream stage has failed."""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _produce(self, chunks: Iterable[Tuple[str, "Document"]], out: queue.Queue):
+        try:
+            for batch in batched(chunks, self.embed_batch_size):
+                if not self._put(out, batch):
+                    return
+            self._put(out, _DONE)
+        except BaseException as e:
+            self._put(out, _StageError(e))
+        finally:
+            # Release the parser (and any worker pool) if we stopped early
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+
+    def _embed(self, inbox: queue.Queue, out: queue.Queue):
+        try:
+            asyncio.run(self._embed_batches(inbox, out))
+        except BaseException as e:
+            self._put(out, _StageError(e))
+
+    async def _embed_batches(self, inbox: queue.Queue, out: queue.Queue):
+        """Keep up to ``max_in_flight`` batches embedding at once, emitting them in order."""
+        loop = asyncio.get_running_loop()
+        pending = deque()
+        final = None
+        while True:
+            # Hand finished batches downstream before blocking on more input
+            while pending and (pending[0][1].done() or final is not None or len(pending) >= self.max_in_flight):
+                batch, task = pending.popleft()
+                vectors = await task
+                if self.progress is not None:
+                    self.progress.chunks_embedded += len(batch)
+                item = (
+                    [chunk_id for chunk_id, _ in batch],
+                    [chunk.page_content for _, chunk in batch],
+                    [chunk.metadata for _, chunk in batch],
+                    vectors
+                )
+                if not await loop.run_in_executor(None, self._put, out, item):
+                    return
+            if final is not None:
+                await loop.run_in_executor(None, self._put, out, final)
+                return
+
+            batch = await loop.run_in_executor(None, self._get, inbox)
+            if batch is _DONE or isinstance(batch, _StageError):
+                final = batch
+                continue
+            texts = [chunk.page_content for _, chunk in batch]
+            pending.append((batch, asyncio.ensure_future(aembed_documents(self.embeddings, texts))))
+
+    def _write(self, buffer: List[UpsertBatch]) -> int:
+        ids, texts, metadatas, vectors = [], [], [], []
+        for batch_ids, batch_texts, batch_metadatas, batch_vectors in buffer:
+            ids.extend(batch_ids)
+            texts.extend(batch_texts)
+            metadatas.extend(batch_metadatas)
+            vectors.extend(batch_vectors)
+        self.upsert(ids, texts, metadatas, vectors)
+        if self.progress is not None:
+            self.progress.chunks_written += len(ids)
+        return len(ids)
+
+    def run(self, chunks: Iterable[Tuple[str, "Document"]]) -> Dict:
+        """Embed and upsert ``(chunk_id, chunk)`` pairs; returns throughput stats."""
+        self._stop.clear()
+        started = time.monotonic()
+        to_embed = queue.Queue(maxsize=self.max_pending_batches)
+        to_write = queue.Queue(maxsize=self.max_pending_batches)
+        threads = [
+            threading.Thread(target=self._produce, args=(chunks, to_embed), name="ingest-parse", daemon=True),
+            threading.Thread(target=self._embed, args=(to_embed, to_write), name="ingest-embed", daemon=True)
+        ]
+        for thread in threads:
+            thread.start()
+
+        written = 0
+        buffer: List[UpsertBatch] = []
+        buffered = 0
+        try:
+            while True:
+                item = to_write.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, _StageError):
+                    raise item.error
+                buffer.append(item)
+                buffered += len(item[0])
+                if buffered >= self.upsert_batch_size:
+                    written += self._write(buffer)
+                    buffer, buffered = [], 0
+            if buffer:
+                written += self._write(buffer)
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+
+        elapsed = time.monotonic() - started
+        stats = {
+            "chunks": written,
+            "seconds": round(elapsed, 3),
+            "chunks_per_second": round(written / elapsed, 1) if elapsed else 0.0
+        }
+        logger.info(f"Ingestion pipeline finished: {stats}")
+        return stats
@@ -1,26 +1,21 @@
-from langchain.vectorstores import Chroma
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.chat_models import ChatOpenAI
+from typing import Optional
 from langchain.chains import ConversationalRetrievalChain
-from .chat_memory import ChatMemory
+from app.services.llm.chat_model import ProviderChatModel
+from app.services.memory.conversation import ConversationMemory, get_conversation_memory
+from app.services.memory.vector_store import RetrievalEngine, get_retrieval_engine
 
 class QueryEngine:
-    def __init__(self, persist_directory: str = "chroma_db"):
-        self.embeddings = OpenAIEmbeddings()
-        self.vectorstore = Chroma(
-            persist_directory=persist_directory,
-            embedding_function=self.embeddings
-        )
-        self.chat_memory = ChatMemory()
-        self.llm = ChatOpenAI(temperature=0.7, model_name="gpt-4o-mini")
+    def __init__(self, retrieval_engine: Optional[RetrievalEngine] = None, memory: Optional[ConversationMemory] = None):
+        self.retrieval_engine = retrieval_engine or get_retrieval_engine()
+        self.memory = memory or get_conversation_memory()
+        self.llm = ProviderChatModel(temperature=0.7, model_name="gpt-4o-mini")
 
-    async def query(self, question: str):
+    async def query(self, question: str, session_id: str):
         try:
-            # Create the chain
+            # Create the chain; history is per session and passed in explicitly
             qa_chain = ConversationalRetrievalChain.from_llm(
                 llm=self.llm,
-                retriever=self.vectorstore.as_retriever(search_kwargs={"k": 3}),
-                memory=self.chat_memory.memory,
+                retriever=self.retrieval_engine.vector_store.as_retriever(search_kwargs={"k": 3}),
                 return_source_documents=True,
                 verbose=True
             )
@@ -28,8 +23,9 @@ class QueryEngine:
             # Get response
             response = await qa_chain.acall({
                 "question": question,
-                "chat_history": self.chat_memory.get_chat_history()
+                "chat_history": self.memory.history(session_id)
             })
+            self.memory.add_turn(session_id, question, response["answer"])
 
             # Extract sources
             sources = []
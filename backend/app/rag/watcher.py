@@ -0,0 +1,73 @@
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class DataDirectoryWatcher:
+    """Polls a directory of PDFs and calls ``on_change`` once edits settle.
+
+    A burst of copies or saves resets the debounce timer, so ``on_change``
+    runs once per batch of edits rather than once per file event. Polling
+    keeps this working on bind mounts where inotify events do not arrive.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        on_change: Callable[[], None],
+        poll_interval: float = 2.0,
+        debounce: float = 5.0
+    ):
+        self.directory = Path(directory)
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _snapshot(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        if not self.directory.exists():
+            return snapshot
+        for path in self.directory.glob("*.pdf"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            snapshot[path.name] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="data-dir-watcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Watching {self.directory} for PDF changes")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval * 2)
+            self._thread = None
+
+    def _run(self):
+        last = self._snapshot()
+        pending_since = None
+        while not self._stop.wait(self.poll_interval):
+            current = self._snapshot()
+            if current != last:
+                last = current
+                pending_since = time.monotonic()
+                continue
+            if pending_since is not None and time.monotonic() - pending_since >= self.debounce:
+                pending_since = None
+                logger.info(f"Changes in {self.directory} settled, syncing vector store")
+                try:
+                    self.on_change()
+                except Exception as e:
+                    logger.error(f"Error syncing vector store after change: {e}")
@@ -0,0 +1,140 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# (index version, retrieved chunk IDs) - answers are only reused within one
+BucketKey = Tuple[str, Tuple[str, ...]]
+
+
+@dataclass
+class CachedAnswer:
+    query: str
+    embedding: np.ndarray
+    answer: str
+    stored_at: float
+    hits: int = 0
+
+
+def _unit(vector: Iterable[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+class SemanticAnswerCache:
+    """Reuses answers for paraphrased questions.
+
+    A cached answer is returned when the new query's embedding is within
+    ``max_distance`` cosine distance of a cached query's, the same set of chunks
+    was retrieved, and the index version is unchanged. Since the chat model
+    runs at temperature 0, the same context and an equivalent question yield
+    the same answer.
+    """
+
+    def __init__(self, max_distance: float = 0.05, max_entries: int = 1024, ttl: float = 86400):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._buckets: "OrderedDict[BucketKey, List[CachedAnswer]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(chunk_ids: Iterable[str], index_version: str) -> BucketKey:
+        return index_version, tuple(sorted(chunk_ids))
+
+    def _evict_oldest(self):
+        key, entries = next(iter(self._buckets.items()))
+        entries.pop(0)
+        if not entries:
+            del self._buckets[key]
+        self._size -= 1
+        self.evictions += 1
+
+    def lookup(self, embedding: List[float], chunk_ids: Iterable[str], index_version: str) -> Optional[CachedAnswer]:
+        key = self._key(chunk_ids, index_version)
+        query = _unit(embedding)
+        now = time.monotonic()
+        with self._lock:
+            entries = self._buckets.get(key)
+            if entries:
+                live = [entry for entry in entries if now - entry.stored_at <= self.ttl]
+                self.evictions += len(entries) - len(live)
+                self._size -= len(entries) - len(live)
+                entries[:] = live
+            if not entries:
+                self._buckets.pop(key, None)
+                self.misses += 1
+                return None
+
+            distances = 1.0 - np.stack([entry.embedding for entry in entries]) @ query
+            best = int(np.argmin(distances))
+            if distances[best] > self.max_distance:
+                self.misses += 1
+                return None
+
+            entry = entries[best]
+            entry.hits += 1
+            self.hits += 1
+            self._buckets.move_to_end(key)
+        logger.info(f"Answer cache hit (distance {distances[best]:.4f}) for '{entry.query}'")
+        return entry
+
+    def store(self, query: str, embedding: List[float], chunk_ids: Iterable[str], index_version: str, answer: str):
+        key = self._key(chunk_ids, index_version)
+        entry = CachedAnswer(query=query, embedding=_unit(embedding), answer=answer, stored_at=time.monotonic())
+        with self._lock:
+            # Answers from an older index can never be hit again
+            for stale in [k for k in self._buckets if k[0] != index_version]:
+                self._size -= len(self._buckets.pop(stale))
+            self._buckets.setdefault(key, []).append(entry)
+            self._buckets.move_to_end(key)
+            self._size += 1
+            while self._size > self.max_entries:
+                self._evict_oldest()
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._size = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+_answer_cache: Optional[SemanticAnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    """Return the process-wide answer cache, creating it on first use."""
+    global _answer_cache
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = SemanticAnswerCache(
+                    max_distance=settings.ANSWER_CACHE_MAX_DISTANCE,
+                    max_entries=settings.ANSWER_CACHE_SIZE,
+                    ttl=settings.ANSWER_CACHE_TTL
+                )
+    return _answer_cache
@@ -0,0 +1,85 @@
+import logging
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+from app.services.llm.provider import get_llm_provider
+from app.utils.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+def llm_configured() -> bool:
+    """Whether the provider that completions go to has credentials."""
+    return get_llm_provider().configured
+
+
+class CompletionStream:
+    """A streamed chat completion.
+
+    Iterate ``deltas()`` for content fragments as they arrive; afterwards
+    ``content``, ``usage`` and ``timing()`` describe the whole answer.
+    """
+
+    def __init__(self, messages: List[Dict[str, str]], model: str = "gpt-4o-mini", temperature: float = 0.0):
+        self.messages = messages
+        self.model = model
+        self.temperature = temperature
+        self.parts: List[str] = []
+        self.usage: Optional[Dict] = None
+        self._response = None
+        self._started: Optional[float] = None
+        self._first_token_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+
+    @property
+    def content(self) -> str:
+        return "".join(self.parts)
+
+    async def deltas(self) -> AsyncIterator[str]:
+        self._started = time.monotonic()
+        self._response = get_llm_provider().stream_chat(
+            self.messages, model=self.model, temperature=self.temperature
+        )
+        try:
+            async for chunk in self._response:
+                if chunk.get("usage"):
+                    self.usage = dict(chunk["usage"])
+                for choice in chunk.get("choices") or []:
+                    delta = (choice.get("delta") or {}).get("content")
+                    if not delta:
+                        continue
+                    if self._first_token_at is None:
+                        self._first_token_at = time.monotonic()
+                    self.parts.append(delta)
+                    yield delta
+        finally:
+            self._finished_at = time.monotonic()
+        if self.usage is None:
+            self.usage = self.estimate_usage()
+
+    async def aclose(self):
+        """Stop reading the completion, e.g. because the client went away."""
+        close = getattr(self._response, "aclose", None)
+        if close is not None:
+            await close()
+
+    def estimate_usage(self) -> Dict:
+        prompt_tokens = sum(count_tokens(m["content"]) for m in self.messages)
+        completion_tokens = count_tokens(self.content)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "estimated": True
+        }
+
+    def timing(self) -> Dict:
+        def elapsed_ms(until: Optional[float]) -> Optional[float]:
+            if self._started is None or until is None:
+                return None
+            return round((until - self._started) * 1000, 1)
+
+        return {
+            "time_to_first_token_ms": elapsed_ms(self._first_token_at),
+            "completion_ms": elapsed_ms(self._finished_at)
+        }
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import weakref
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Publish = Callable[[Any], None]
+
+
+class Flight:
+    """One in-flight computation whose events are broadcast to every subscriber.
+
+    Subscribers that join late first replay the events published so far. If
+    the producer fails, every subscriber gets its exception.
+    """
+
+    def __init__(self, key: Hashable):
+        self.key = key
+        self.events: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    def _wake(self):
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    def publish(self, event: Any):
+        self.events.append(event)
+        self._wake()
+
+    def _finish(self, error: Optional[BaseException] = None):
+        self.error = error
+        self.done = True
+        self._wake()
+
+    async def events_from_start(self) -> AsyncIterator[Any]:
+        """All events in order, waiting for new ones until the flight finishes."""
+        position = 0
+        while True:
+            while position < len(self.events):
+                yield self.events[position]
+                position += 1
+            if self.done:
+                break
+            await self._wakeup.wait()
+        if self.error is not None:
+            raise self.error
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one producer run.
+
+    The first caller for a key starts ``producer(publish)`` as a task; callers
+    arriving while it runs subscribe to the same events. A flight is
+    forgotten as soon as it finishes, so neither results nor failures are
+    cached here. When every subscriber has left, the producer is cancelled.
+    Flights are kept per event loop.
+    """
+
+    def __init__(self):
+        self._flights = weakref.WeakKeyDictionary()
+        self.started = 0
+        self.joined = 0
+        self.failed = 0
+
+    def _loop_flights(self) -> Dict[Hashable, Flight]:
+        loop = asyncio.get_running_loop()
+        if loop not in self._flights:
+            self._flights[loop] = {}
+        return self._flights[loop]
+
+    def join(self, key: Hashable, producer: Callable[[Publish], Awaitable[None]]) -> Tuple[Flight, bool]:
+        """The flight for ``key`` and whether it was already running; call ``leave`` when done with it."""
+        flights = self._loop_flights()
+        flight = flights.get(key)
+        if flight is not None and not flight.done:
+            flight.subscribers += 1
+            self.joined += 1
+            logger.info(f"Joined in-flight request ({flight.subscribers} waiting)")
+            return flight, True
+
+        flight = Flight(key)
+        flight.subscribers = 1
+        flights[key] = flight
+        flight.task = asyncio.get_running_loop().create_task(self._run(flights, flight, producer))
+        self.started += 1
+        return flight, False
+
+    async def _run(self, flights: Dict[Hashable, Flight], flight: Flight, producer: Callable[[Publish], Awaitable[None]]):
+        error = None
+        try:
+            await producer(flight.publish)
+        except asyncio.CancelledError:
+            # Not re-raised in subscribers as CancelledError, which would look like their own
+            error = RuntimeError("The shared request was cancelled")
+        except Exception as e:
+            self.failed += 1
+            error = e
+        finally:
+            if flights.get(flight.key) is flight:
+                del flights[flight.key]
+            flight._finish(error)
+
+    def leave(self, flight: Flight):
+        flight.subscribers -= 1
+        if flight.subscribers <= 0 and not flight.done and flight.task is not None:
+            logger.info("Cancelling in-flight request with no subscribers left")
+            flight.task.cancel()
+
+    def stats(self) -> Dict:
+        return {"started": self.started, "joined": self.joined, "failed": self.failed}
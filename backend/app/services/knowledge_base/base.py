@@ -0,0 +1,20 @@
+from abc import ABC, abstractmethod
+from typing import List
+
+
+class Embeddings(ABC):
+    """Interface for embedding models, the one langchain's vector stores call.
+
+    Mirrors ``langchain.embeddings.base.Embeddings`` so the query path can be
+    imported without the langchain package, whose import alone takes about
+    two seconds. langchain's own embeddings (e.g. ``FakeEmbeddings``) work
+    wherever this type is expected.
+    """
+
+    @abstractmethod
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed search docs."""
+
+    @abstractmethod
+    def embed_query(self, text: str) -> List[float]:
+        """Embed query text."""
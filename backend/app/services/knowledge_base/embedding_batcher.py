@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import queue
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from app.services.knowledge_base.base import Embeddings
+from app.services.llm.provider import ProviderError, fake_embedding
+from app.utils.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class RetryableEmbeddingError(Exception):
+    """A transient failure (429 or 5xx) that is worth retrying after a delay."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ProviderEmbeddingBackend:
+    """Embeds one batch per request through the shared LLM provider."""
+
+    def __init__(self, provider, model: str = "text-embedding-ada-002"):
+        self.provider = provider
+        self.model = model
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        try:
+            return await self.provider.embed(texts, model=self.model)
+        except ProviderError as e:
+            if e.retryable:
+                raise RetryableEmbeddingError(str(e), e.retry_after) from e
+            raise
+
+
+class FakeEmbeddingBackend:
+    """Deterministic offline backend for tests and benchmarks.
+
+    Each text maps to a unit vector seeded from its sha256, so equal texts get
+    equal vectors. ``latency`` simulates request time and ``fail_every``
+    raises a retryable error on every n-th request.
+    """
+
+    def __init__(self, size: int = 1536, latency: float = 0.0, fail_every: int = 0):
+        self.size = size
+        self.latency = latency
+        self.fail_every = fail_every
+        self.model = f"fake-{size}"
+        self.requests = 0
+
+    def vector(self, text: str) -> List[float]:
+        return fake_embedding(text, self.size)
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.fail_every and self.requests % self.fail_every == 0:
+            raise RetryableEmbeddingError("Simulated rate limit", retry_after=0.0)
+        return [self.vector(text) for text in texts]
+
+
+class TokenBucket:
+    """Token-bucket limiter refilled continuously at ``tokens_per_minute``.
+
+    The bucket is shared by every event loop and thread that embeds through
+    it: a thread lock guards the counts, and a per-loop asyncio lock keeps
+    the waiters on one loop in order.
+    """
+
+    def __init__(self, tokens_per_minute: float, capacity: Optional[float] = None):
+        self.rate = tokens_per_minute / 60.0
+        self.capacity = capacity or tokens_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._state_lock = threading.Lock()
+        self._locks = weakref.WeakKeyDictionary()
+
+    def _lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if loop not in self._locks:
+            self._locks[loop] = asyncio.Lock()
+        return self._locks[loop]
+
+    async def acquire(self, tokens: float):
+        # A request larger than the bucket could never be admitted otherwise
+        tokens = min(tokens, self.capacity)
+        async with self._lock():
+            while True:
+                with self._state_lock:
+                    now = time.monotonic()
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= tokens:
+                        self.tokens -= tokens
+                        return
+                    wait = (tokens - self.tokens) / self.rate
+                await asyncio.sleep(wait)
+
+
+class AsyncEmbeddingBatcher:
+    """Splits texts into batches and embeds them with bounded concurrency.
+
+    At most ``max_concurrency`` requests are in flight, each request first
+    takes its tiktoken count from the token bucket, and 429/5xx responses are
+    retried with full-jitter exponential backoff. Both limits hold across
+    every caller of the batcher, whichever thread or event loop it runs on.
+    """
+
+    def __init__(
+        self,
+        backend,
+        batch_size: int = 64,
+        max_concurrency: int = 4,
+        tokens_per_minute: float = 0,
+        max_retries: int = 6,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0
+    ):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.requests = 0
+        self.retries = 0
+
+    @property
+    def model(self) -> str:
+        return self.backend.model
+
+    async def _acquire_slot(self):
+        # Sync callers each run their own event loop, so the limit is a thread
+        # semaphore; poll it rather than block the loop while waiting
+        while not self._slots.acquire(blocking=False):
+            await asyncio.sleep(0.005)
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, retry_after or 0.0)
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        await self._acquire_slot()
+        try:
+            if self.bucket is not None:
+                await self.bucket.acquire(sum(count_tokens(text) for text in texts))
+            attempt = 0
+            while True:
+                try:
+                    self.requests += 1
+                    return await self.backend.embed(texts)
+                except RetryableEmbeddingError as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    delay = self._backoff(attempt, e.retry_after)
+                    attempt += 1
+                    self.retries += 1
+                    logger.warning(f"Embedding request failed ({e}), retry {attempt} in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+        finally:
+            self._slots.release()
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        """Embed ``texts``, returning vectors in input order."""
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = await asyncio.gather(*(self._embed_batch(batch) for batch in batches))
+        return [vector for batch in results for vector in batch]
+
+
+class BatchedEmbeddings(Embeddings):
+    """langchain Embeddings adapter over an AsyncEmbeddingBatcher.
+
+    The sync methods start their own event loop, so they must be called from a
+    worker thread (as the ingestion pipeline does), never from the server loop.
+    """
+
+    def __init__(self, batcher: AsyncEmbeddingBatcher):
+        self.batcher = batcher
+        self.model = batcher.model
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.batcher.aembed(texts)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return asyncio.run(self.batcher.aembed(texts))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.batcher.aembed([text]))[0]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def __repr__(self):
+        return f"BatchedEmbeddings({self.model})"
+
+
+class MicroBatchedQueryEmbeddings(Embeddings):
+    """Coalesces concurrent ``embed_query`` calls into ``embed_documents`` requests.
+
+    Each caller queues its query and waits on a future: ``aembed_query``
+    awaits it on the caller's event loop, while ``embed_query`` blocks the
+    calling thread, so only async callers can queue more queries than they
+    have threads. A collector thread takes the first waiting query, gathers
+    more for up to ``max_wait`` seconds or until ``max_batch`` are queued,
+    and hands the batch to one of ``max_concurrency`` sender threads, so the
+    next batch is collected while the previous request is in flight. A failed
+    request fails every query in its batch. The added latency per query is
+    bounded by ``max_wait``.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch: int = 16, max_wait: float = 0.005, max_concurrency: int = 4):
+        self.embeddings = embeddings
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._senders = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="query-embed")
+        self._collector: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.requests = 0
+        self.queries = 0
+        self.max_batch_seen = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def _submit(self, text: str) -> Future:
+        if self._collector is None:
+            with self._start_lock:
+                if self._collector is None:
+                    self._collector = threading.Thread(target=self._collect, name="query-embed-batcher", daemon=True)
+                    self._collector.start()
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.wrap_future(self._submit(text))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._submit(text).result()
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._senders.submit(self._send, batch)
+
+    def _send(self, batch: List[Tuple[str, Future]]):
+        # Identical queries in one batch are embedded once
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        self.requests += 1
+        self.queries += len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        try:
+            vectors: Dict[str, List[float]] = dict(zip(texts, self.embeddings.embed_documents(texts)))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for text, future in batch:
+            future.set_result(vectors[text])
+
+    def stats(self) -> Dict:
+        requests = self.requests or 1
+        return {
+            "requests": self.requests,
+            "queries": self.queries,
+            "avg_batch": round(self.queries / requests, 2),
+            "max_batch": self.max_batch_seen,
+            "max_wait_ms": self.max_wait * 1000
+        }
+
+    def __repr__(self):
+        return f"MicroBatchedQueryEmbeddings({self.embeddings.__class__.__name__})"
@@ -0,0 +1,366 @@
+import asyncio
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.knowledge_base.base import Embeddings
+from app.services.knowledge_base.embedding_batcher import (
+    AsyncEmbeddingBatcher,
+    BatchedEmbeddings,
+    FakeEmbeddingBackend,
+    MicroBatchedQueryEmbeddings,
+    ProviderEmbeddingBackend
+)
+from app.services.llm.provider import get_llm_provider
+from app.utils.metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Canonical form of a query so trivially different phrasings share a cache entry.
+
+    Also the key identical chat questions in flight coalesce on, so a shared
+    answer and the embedding cache agree on which questions are the same.
+    """
+    text = unicodedata.normalize("NFKC", text)
+    return _WHITESPACE.sub(" ", text).strip().casefold().rstrip("?!. ")
+
+
+class QueryEmbeddingCache:
+    """Thread-safe LRU of query embeddings with a TTL and a memory bound.
+
+    Vectors are stored as float32 arrays, so a 1536-dimensional embedding
+    costs about 6 KB instead of the ~50 KB of a list of Python floats.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[float, array]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _size(key: str, vector: array) -> int:
+        return len(key) + vector.itemsize * len(vector)
+
+    def _remove(self, key: str):
+        _, vector = self._entries.pop(key)
+        self._bytes -= self._size(key, vector)
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, vector = entry
+            if time.monotonic() - stored_at > self.ttl:
+                self._remove(key)
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return vector.tolist()
+
+    def put(self, key: str, vector: List[float]):
+        stored = array("f", vector)
+        size = self._size(key, stored)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic(), stored)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Embeddings wrapper that serves repeated queries from a QueryEmbeddingCache.
+
+    Only ``embed_query`` is cached; document embedding is passed straight through.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: Optional[QueryEmbeddingCache] = None):
+        self.embeddings = embeddings
+        self.cache = cache or QueryEmbeddingCache()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def _lookup(self, key: str) -> Optional[List[float]]:
+        vector = self.cache.get(key)
+        CACHE_LOOKUPS.inc(cache="query_embedding", result="miss" if vector is None else "hit")
+        return vector
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        vector = self._lookup(key)
+        if vector is None:
+            # The key is only for lookups; the query is embedded as the user wrote it
+            vector = self.embeddings.embed_query(text)
+            self.cache.put(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        vector = self._lookup(key)
+        if vector is None:
+            vector = await aembed_query(self.embeddings, text)
+            self.cache.put(key, vector)
+        return vector
+
+    def __repr__(self):
+        return f"CachedQueryEmbeddings({self.embeddings.__class__.__name__})"
+
+
+async def aembed_documents(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """Use ``embeddings``' async path if it has one, else run the sync one in a thread."""
+    method = getattr(embeddings, "aembed_documents", None)
+    if method is not None:
+        return await method(texts)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, embeddings.embed_documents, texts)
+
+
+async def aembed_query(embeddings: Embeddings, text: str) -> List[float]:
+    """Use ``embeddings``' async path if it has one, else run the sync one in a thread."""
+    method = getattr(embeddings, "aembed_query", None)
+    if method is not None:
+        return await method(text)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, embeddings.embed_query, text)
+
+
+def embedding_model_name(embeddings: Embeddings) -> str:
+    """Identifier of the model behind ``embeddings``, used to key cached vectors."""
+    return getattr(embeddings, "model", None) or embeddings.__class__.__name__
+
+
+class PersistentEmbeddingCache:
+    """SQLite table of document embeddings keyed by (model, sha256 of chunk text).
+
+    Lives outside the Chroma directory so it survives ``clean_vector_store``.
+    """
+
+    _BATCH = 500
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            for start in range(0, len(unique), self._BATCH):
+                batch = unique[start:start + self._BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[text_hash] = vector.tolist()
+        return found
+
+    def put_many(self, model: str, items: List[Tuple[str, List[float]]]):
+        rows = [(model, text_hash, array("f", vector).tobytes()) for text_hash, vector in items]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+class CacheBackedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends chunks missing from a PersistentEmbeddingCache.
+
+    Rebuilding an index whose chunks are mostly unchanged then costs a local
+    SQLite lookup per chunk instead of an API call.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: PersistentEmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = embedding_model_name(embeddings)
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, texts: List[str]):
+        hashes = [self.cache.text_hash(text) for text in texts]
+        found = self.cache.get_many(self.model, hashes)
+
+        missing = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in found and text_hash not in missing:
+                missing[text_hash] = text
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            logger.info(f"Embedding {len(missing)} of {len(texts)} chunks, {len(texts) - len(missing)} cached")
+        return hashes, found, missing
+
+    def _store(self, found: Dict, missing: Dict, vectors: List[List[float]]):
+        new_items = list(zip(missing.keys(), vectors))
+        self.cache.put_many(self.model, new_items)
+        found.update(new_items)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes, found, missing = self._lookup(texts)
+        if missing:
+            self._store(found, missing, self.embeddings.embed_documents(list(missing.values())))
+        return [found[text_hash] for text_hash in hashes]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes, found, missing = self._lookup(texts)
+        if missing:
+            self._store(found, missing, await aembed_documents(self.embeddings, list(missing.values())))
+        return [found[text_hash] for text_hash in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    def __repr__(self):
+        return f"CacheBackedEmbeddings({self.embeddings.__class__.__name__})"
+
+
+def get_embedding_backend():
+    """Raw async embedding backend selected by ``EMBEDDING_BACKEND``."""
+    if settings.EMBEDDING_BACKEND == "fake":
+        return FakeEmbeddingBackend(size=settings.FAKE_EMBEDDING_SIZE)
+    return ProviderEmbeddingBackend(get_llm_provider(), model=settings.EMBEDDING_MODEL)
+
+
+_ingestion_batcher: Optional[AsyncEmbeddingBatcher] = None
+_ingestion_batcher_lock = threading.Lock()
+
+
+def get_ingestion_batcher() -> AsyncEmbeddingBatcher:
+    """Return the process-wide batcher behind ingestion embeddings.
+
+    Every ingestion in the process shares it, so ``EMBEDDING_MAX_CONCURRENCY``
+    and ``EMBEDDING_TOKENS_PER_MINUTE`` cap them together.
+    """
+    global _ingestion_batcher
+    if _ingestion_batcher is None:
+        with _ingestion_batcher_lock:
+            if _ingestion_batcher is None:
+                _ingestion_batcher = AsyncEmbeddingBatcher(
+                    get_embedding_backend(),
+                    batch_size=settings.RAG_EMBED_BATCH_SIZE,
+                    max_concurrency=settings.EMBEDDING_MAX_CONCURRENCY,
+                    tokens_per_minute=settings.EMBEDDING_TOKENS_PER_MINUTE,
+                    max_retries=settings.EMBEDDING_MAX_RETRIES
+                )
+    return _ingestion_batcher
+
+
+def get_ingestion_embeddings() -> CacheBackedEmbeddings:
+    """Embeddings for ingestion: on-disk cache in front of the concurrent, rate-limited batcher."""
+    return CacheBackedEmbeddings(
+        BatchedEmbeddings(get_ingestion_batcher()),
+        PersistentEmbeddingCache(settings.EMBEDDING_CACHE_PATH)
+    )
+
+
+_query_embeddings: Optional[CachedQueryEmbeddings] = None
+_query_embeddings_lock = threading.Lock()
+
+
+def get_query_embeddings() -> CachedQueryEmbeddings:
+    """Return the process-wide cached embeddings used on the query path.
+
+    Queries go to the same backend and model as ingestion, with retries on
+    429/5xx; cache misses from concurrent requests are micro-batched into
+    one API call.
+    """
+    global _query_embeddings
+    if _query_embeddings is None:
+        with _query_embeddings_lock:
+            if _query_embeddings is None:
+                embeddings = BatchedEmbeddings(AsyncEmbeddingBatcher(
+                    get_embedding_backend(),
+                    batch_size=max(1, settings.QUERY_EMBEDDING_BATCH_SIZE),
+                    max_retries=settings.EMBEDDING_MAX_RETRIES
+                ))
+                if settings.QUERY_EMBEDDING_BATCH_SIZE > 1:
+                    embeddings = MicroBatchedQueryEmbeddings(
+                        embeddings,
+                        max_batch=settings.QUERY_EMBEDDING_BATCH_SIZE,
+                        max_wait=settings.QUERY_EMBEDDING_BATCH_WAIT_MS / 1000,
+                        max_concurrency=settings.EMBEDDING_MAX_CONCURRENCY
+                    )
+                _query_embeddings = CachedQueryEmbeddings(
+                    embeddings,
+                    QueryEmbeddingCache(
+                        max_entries=settings.QUERY_EMBEDDING_CACHE_SIZE,
+                        ttl=settings.QUERY_EMBEDDING_CACHE_TTL,
+                        max_bytes=settings.QUERY_EMBEDDING_CACHE_MAX_BYTES
+                    )
+                )
+    return _query_embeddings
@@ -0,0 +1,304 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from app.core.config.logging import bind_request_id
+from app.rag.pipeline import IngestionProgress
+from app.utils.file_lock import FileLock
+from app.utils.metrics import INGESTION_JOBS, INGESTION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+SYNC = "sync"
+REBUILD = "rebuild"
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class IngestionRejected(Exception):
+    """Raised when a job cannot start because a different one is running.
+
+    ``active`` is None when the writer is not a job, e.g. a command-line sync.
+    """
+
+    def __init__(self, message: str, active: Optional["IngestionJob"]):
+        super().__init__(message)
+        self.active = active
+
+
+_vector_store_locks: Dict[str, FileLock] = {}
+_vector_store_locks_lock = threading.Lock()
+
+
+def vector_store_lock(db_dir: Union[str, Path]) -> FileLock:
+    """This process's handle on the lock every writer of ``db_dir`` takes.
+
+    The lock file sits next to the directory rather than in it, so a rebuild
+    that deletes the directory does not delete the lock it holds.
+    """
+    path = os.path.abspath(str(db_dir)).rstrip("/") + ".lock"
+    with _vector_store_locks_lock:
+        if path not in _vector_store_locks:
+            _vector_store_locks[path] = FileLock(path)
+        return _vector_store_locks[path]
+
+
+@contextmanager
+def holding_vector_store_lock(db_dir: Union[str, Path], owner: Optional[Dict] = None):
+    """Hold the ``db_dir`` write lock, waiting for other processes to release it.
+
+    A job started by IngestionJobManager already holds the lock for its whole
+    run, so its writes go ahead without taking it again.
+    """
+    lock = vector_store_lock(db_dir)
+    if lock.held:
+        yield
+        return
+    lock.acquire(owner)
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+@dataclass
+class IngestionJob:
+    id: str
+    kind: str
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    progress: IngestionProgress = field(default_factory=IngestionProgress)
+    result: Optional[Dict] = None
+    error: Optional[str] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE_STATUSES
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress.to_dict() if self.started_at else None,
+            "result": self.result,
+            "error": self.error
+        }
+
+
+@dataclass
+class StoredIngestionJob:
+    """A job read back from the record kept by the process running it."""
+    data: Dict
+
+    @property
+    def id(self) -> str:
+        return self.data["id"]
+
+    @property
+    def kind(self) -> str:
+        return self.data["kind"]
+
+    @property
+    def status(self) -> str:
+        return self.data["status"]
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE_STATUSES
+
+    def to_dict(self) -> Dict:
+        return dict(self.data)
+
+
+class IngestionJobManager:
+    """Runs ingestion jobs one at a time on a background thread.
+
+    ``runners`` maps a job kind to a callable doing the work; it receives the
+    job's IngestionProgress and returns the job result. A request for the kind
+    already running joins that job; a request for another kind is rejected.
+
+    With several worker processes, pass the vector store's ``lock`` and a
+    shared ``state_dir``: a job holds the lock from submission to completion,
+    so only one runs across the processes, and its state is written to
+    ``state_dir`` every ``publish_interval`` seconds so any process can report
+    it and join it.
+    """
+
+    def __init__(
+        self,
+        runners: Dict[str, Callable[[IngestionProgress], Dict]],
+        history: int = 20,
+        lock: Optional[FileLock] = None,
+        state_dir: Optional[Union[str, Path]] = None,
+        publish_interval: float = 0.5
+    ):
+        self.runners = runners
+        self.history = history
+        self.lock = lock
+        self.state_dir = Path(state_dir) if state_dir else None
+        self.publish_interval = publish_interval
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._active: Optional[IngestionJob] = None
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str = SYNC) -> Tuple[IngestionJob, bool]:
+        """Start a job of ``kind``; returns the job and whether it was already running."""
+        if kind not in self.runners:
+            raise ValueError(f"Unknown ingestion job kind: {kind}")
+        with self._lock:
+            active = self._active
+            if active is not None and active.active:
+                if active.kind == kind:
+                    logger.info(f"Coalescing {kind} request into running job {active.id}")
+                    return active, True
+                raise IngestionRejected(f"A {active.kind} job is already running", active)
+
+            job = IngestionJob(id=uuid.uuid4().hex, kind=kind)
+            if self.lock is not None and not self.lock.acquire({"job_id": job.id, "kind": kind}, blocking=False):
+                return self._join_elsewhere(kind)
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                self._jobs.popitem(last=False)
+            self._active = job
+            self._publish(job)
+            self._prune()
+
+        threading.Thread(target=self._run, args=(job,), name=f"ingestion-{job.id[:8]}", daemon=True).start()
+        return job, False
+
+    def _join_elsewhere(self, kind: str) -> Tuple[StoredIngestionJob, bool]:
+        """Coalesce into or reject against the job another process is running."""
+        holder = self.lock.holder() or {}
+        job = self.get(holder["job_id"]) if holder.get("job_id") else None
+        if job is None:
+            raise IngestionRejected("The vector store is being written by another process", None)
+        if job.kind != kind:
+            raise IngestionRejected(f"A {job.kind} job is already running", job)
+        logger.info(f"Coalescing {kind} request into job {job.id} running in process {holder.get('pid')}")
+        return job, True
+
+    def _run(self, job: IngestionJob):
+        # The job's records carry its ID; this thread runs nothing else
+        bind_request_id(job.id)
+        job.progress = IngestionProgress()
+        job.started_at = time.time()
+        job.status = "running"
+        logger.info(f"Ingestion job {job.id} ({job.kind}) started")
+        self._publish(job)
+        finished = threading.Event()
+        if self.state_dir is not None:
+            threading.Thread(target=self._publish_until, args=(job, finished), name=f"ingestion-{job.id[:8]}-state", daemon=True).start()
+        try:
+            job.result = self.runners[job.kind](job.progress)
+            job.status = "succeeded"
+        except Exception as e:
+            logger.error(f"Ingestion job {job.id} failed: {e}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            finished.set()
+            # Record the outcome before other processes can see the lock free
+            self._publish(job)
+            if self.lock is not None:
+                self.lock.release()
+            INGESTION_JOBS.inc(kind=job.kind, status=job.status)
+            INGESTION_SECONDS.observe(job.finished_at - job.started_at, kind=job.kind)
+            logger.info(f"Ingestion job {job.id} finished: {job.status}")
+
+    def _record_path(self, job_id: str) -> Optional[Path]:
+        # Job IDs are hex; anything else cannot name a record
+        if self.state_dir is None or not job_id.isalnum():
+            return None
+        return self.state_dir / f"{job_id}.json"
+
+    def _publish(self, job: IngestionJob):
+        path = self._record_path(job.id)
+        if path is None:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(job.to_dict(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not record ingestion job {job.id}: {e}")
+
+    def _publish_until(self, job: IngestionJob, finished: threading.Event):
+        while not finished.wait(self.publish_interval):
+            self._publish(job)
+
+    def _prune(self):
+        """Drop records beyond ``history``, oldest first."""
+        if self.state_dir is None or not self.state_dir.exists():
+            return
+        records = sorted(self.state_dir.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for path in records[self.history:]:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def _load(self, path: Path) -> Optional[StoredIngestionJob]:
+        try:
+            with open(path) as f:
+                job = StoredIngestionJob(json.load(f))
+        except (OSError, ValueError):
+            return None
+        if job.active and (self.lock is None or (self.lock.holder() or {}).get("job_id") != job.id):
+            # Its process died mid-job: the kernel released the lock it held
+            job.data.update(status="failed", error="The worker running this job exited")
+        return job
+
+    def get(self, job_id: str) -> Optional[Union[IngestionJob, StoredIngestionJob]]:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        path = self._record_path(job_id)
+        if path is None or not path.exists():
+            return None
+        return self._load(path)
+
+    def recent(self) -> List[Union[IngestionJob, StoredIngestionJob]]:
+        """Jobs newest first, including those run by other processes."""
+        jobs = {job.id: job for job in self._jobs.values()}
+        if self.state_dir is not None and self.state_dir.exists():
+            for path in self.state_dir.glob("*.json"):
+                if path.stem not in jobs:
+                    job = self._load(path)
+                    if job is not None:
+                        jobs[job.id] = job
+        ordered = sorted(jobs.values(), key=lambda job: job.to_dict()["created_at"], reverse=True)
+        return ordered[:self.history]
+
+    @property
+    def active(self) -> Optional[IngestionJob]:
+        job = self._active
+        return job if job is not None and job.active else None
+
+    def wait(self, job_id: str, timeout: Optional[float] = None, poll_interval: float = 0.05) -> Optional[IngestionJob]:
+        """Block until the job finishes or ``timeout`` passes."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        job = self.get(job_id)
+        while job is not None and job.active:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            time.sleep(poll_interval)
+            # Re-read: a job run by another process is a snapshot of its record
+            job = self.get(job_id)
+        return job
@@ -0,0 +1,51 @@
+import asyncio
+from typing import Dict, List, Optional
+
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import AIMessage, BaseMessage, ChatGeneration, ChatMessage, ChatResult
+
+from app.services.llm.provider import get_llm_provider
+
+ROLES = {"human": "user", "ai": "assistant", "system": "system"}
+
+
+def message_dict(message: BaseMessage) -> Dict[str, str]:
+    role = message.role if isinstance(message, ChatMessage) else ROLES[message.type]
+    return {"role": role, "content": message.content}
+
+
+class ProviderChatModel(BaseChatModel):
+    """langchain chat model whose requests go through the shared LLM provider."""
+
+    model_name: str = "gpt-4o-mini"
+    temperature: float = 0.7
+
+    @property
+    def _llm_type(self) -> str:
+        return "llm-provider"
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None
+    ) -> ChatResult:
+        result = await get_llm_provider().chat(
+            [message_dict(message) for message in messages],
+            model=self.model_name,
+            temperature=self.temperature,
+            stop=stop
+        )
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=result.content))],
+            llm_output={"token_usage": result.usage, "model_name": self.model_name}
+        )
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None
+    ) -> ChatResult:
+        # Sync callers are never on the server loop, so a private loop is fine
+        return asyncio.run(self._agenerate(messages, stop))
@@ -0,0 +1,376 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Dict, List, Optional
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUSES = (408, 409, 429, 500, 502, 503, 504)
+
+_END = object()
+
+
+class ProviderError(Exception):
+    """A failed API call. ``retryable`` is set for 429, 5xx, timeouts and connection errors."""
+
+    def __init__(
+        self,
+        message: str,
+        status: Optional[int] = None,
+        retry_after: Optional[float] = None,
+        retryable: bool = False
+    ):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        self.retryable = retryable
+
+
+@dataclass
+class ChatResult:
+    content: str
+    usage: Optional[Dict] = None
+
+
+def fake_embedding(text: str, size: int) -> List[float]:
+    """Unit vector seeded from the sha256 of ``text``, so equal texts get equal vectors."""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    values = [rng.gauss(0.0, 1.0) for _ in range(size)]
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return [v / norm for v in values]
+
+
+def error_from_response(response: httpx.Response) -> ProviderError:
+    try:
+        message = response.json()["error"]["message"]
+    except Exception:
+        message = response.text or response.reason_phrase
+    retry_after = response.headers.get("retry-after")
+    try:
+        retry_after = float(retry_after) if retry_after else None
+    except ValueError:
+        retry_after = None
+    return ProviderError(
+        message,
+        status=response.status_code,
+        retry_after=retry_after,
+        retryable=response.status_code in RETRYABLE_STATUSES
+    )
+
+
+class OpenAIProvider:
+    """Chat and embedding calls to an OpenAI-compatible API over one pooled client.
+
+    The httpx client lives on a private event loop thread, so the server loop,
+    the ingestion batcher's loops and the query embedding threads all share
+    one bounded pool of keep-alive connections. Calls are awaited from
+    whichever loop makes them.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str],
+        base_url: str = "https://api.openai.com/v1",
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        connect_timeout: float = 5.0,
+        chat_timeout: float = 60.0,
+        embedding_timeout: float = 30.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.connect_timeout = connect_timeout
+        self.chat_timeout = chat_timeout
+        self.embedding_timeout = embedding_timeout
+        self.transport = transport
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._start_lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    def _start(self):
+        if self._loop is not None:
+            return
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=loop.run_forever, name="llm-http", daemon=True)
+            self._thread.start()
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                limits=self.limits,
+                timeout=httpx.Timeout(self.chat_timeout, connect=self.connect_timeout),
+                transport=self.transport
+            )
+            self._loop = loop
+
+    def _submit(self, coro: Awaitable) -> Future:
+        self._start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def _timeout(self, timeout: float) -> httpx.Timeout:
+        return httpx.Timeout(timeout, connect=self.connect_timeout)
+
+    async def _post(self, path: str, payload: Dict, timeout: float) -> Dict:
+        self.requests += 1
+        try:
+            response = await self._client.post(path, json=payload, timeout=self._timeout(timeout))
+        except httpx.TimeoutException as e:
+            self.failures += 1
+            raise ProviderError(f"Request to {path} timed out", retryable=True) from e
+        except httpx.TransportError as e:
+            self.failures += 1
+            raise ProviderError(f"Connection error on {path}: {e}", retryable=True) from e
+        if response.status_code >= 400:
+            self.failures += 1
+            raise error_from_response(response)
+        return response.json()
+
+    async def _stream(self, payload: Dict, timeout: float, put) -> None:
+        self.requests += 1
+        try:
+            async with self._client.stream(
+                "POST", "/chat/completions", json=payload, timeout=self._timeout(timeout)
+            ) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    raise error_from_response(response)
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    put(json.loads(data))
+        except httpx.TimeoutException as e:
+            raise ProviderError("Streamed completion timed out", retryable=True) from e
+        except httpx.TransportError as e:
+            raise ProviderError(f"Connection error while streaming: {e}", retryable=True) from e
+
+    async def embed(self, texts: List[str], model: str, timeout: Optional[float] = None) -> List[List[float]]:
+        """Embeddings for ``texts`` in input order."""
+        payload = {"input": texts, "model": model}
+        response = await asyncio.wrap_future(
+            self._submit(self._post("/embeddings", payload, timeout or self.embedding_timeout))
+        )
+        data = sorted(response["data"], key=lambda item: item["index"])
+        return [item["embedding"] for item in data]
+
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        stop: Optional[List[str]] = None,
+        timeout: Optional[float] = None
+    ) -> ChatResult:
+        payload = {"model": model, "messages": messages, "temperature": temperature}
+        if max_tokens is not None:
+            payload["max_tokens"] = max_tokens
+        if stop:
+            payload["stop"] = stop
+        response = await asyncio.wrap_future(
+            self._submit(self._post("/chat/completions", payload, timeout or self.chat_timeout))
+        )
+        return ChatResult(response["choices"][0]["message"]["content"], response.get("usage"))
+
+    async def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float = 0.0,
+        timeout: Optional[float] = None
+    ) -> AsyncIterator[Dict]:
+        """Completion chunks as they arrive; the last one carries token usage.
+
+        Closing the iterator early cancels the request and releases its connection.
+        """
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "stream": True,
+            "stream_options": {"include_usage": True}
+        }
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(chunks.put_nowait, item)
+            except RuntimeError:
+                # The caller's loop is closed; nobody is reading any more
+                pass
+
+        async def pump():
+            try:
+                await self._stream(payload, timeout or self.chat_timeout, put)
+            except Exception as e:
+                self.failures += 1
+                put(e)
+            else:
+                put(_END)
+
+        future = self._submit(pump())
+        try:
+            while True:
+                item = await chunks.get()
+                if item is _END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+    def stats(self) -> Dict:
+        return {
+            "provider": "openai",
+            "base_url": self.base_url,
+            "requests": self.requests,
+            "failures": self.failures,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections
+        }
+
+    def close(self):
+        """Close the pooled connections and stop the client's loop thread."""
+        with self._start_lock:
+            if self._loop is None:
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result(timeout=5)
+            except Exception as e:
+                logger.warning(f"Error closing LLM HTTP client: {e}")
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop.close()
+            self._loop = None
+            self._client = None
+
+
+class FakeProvider:
+    """Offline provider: deterministic embeddings and answers that quote the question."""
+
+    configured = True
+
+    def __init__(self, size: int = 1536, latency: float = 0.0):
+        self.size = size
+        self.latency = latency
+        self.requests = 0
+
+    def answer(self, messages: List[Dict[str, str]]) -> str:
+        return f"Offline answer to: {messages[-1]['content']}"
+
+    def usage(self, messages: List[Dict[str, str]], content: str) -> Dict:
+        prompt_tokens = sum(len(m["content"].split()) for m in messages)
+        completion_tokens = len(content.split())
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+
+    async def embed(self, texts: List[str], model: str, timeout: Optional[float] = None) -> List[List[float]]:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [fake_embedding(text, self.size) for text in texts]
+
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        stop: Optional[List[str]] = None,
+        timeout: Optional[float] = None
+    ) -> ChatResult:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        content = self.answer(messages)
+        return ChatResult(content, self.usage(messages, content))
+
+    async def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float = 0.0,
+        timeout: Optional[float] = None
+    ) -> AsyncIterator[Dict]:
+        self.requests += 1
+        content = self.answer(messages)
+        for i, word in enumerate(content.split(" ")):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            yield {"choices": [{"index": 0, "delta": {"content": word if i == 0 else f" {word}"}}]}
+        yield {"choices": [], "usage": self.usage(messages, content)}
+
+    def stats(self) -> Dict:
+        return {"provider": "fake", "requests": self.requests}
+
+    def close(self):
+        pass
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_llm_provider():
+    """Return the process-wide provider selected by ``LLM_PROVIDER``."""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                if settings.LLM_PROVIDER == "fake":
+                    _provider = FakeProvider(size=settings.FAKE_EMBEDDING_SIZE)
+                else:
+                    _provider = OpenAIProvider(
+                        api_key=os.getenv("OPENAI_API_KEY"),
+                        base_url=settings.OPENAI_API_BASE,
+                        max_connections=settings.LLM_MAX_CONNECTIONS,
+                        max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+                        connect_timeout=settings.LLM_CONNECT_TIMEOUT,
+                        chat_timeout=settings.LLM_CHAT_TIMEOUT,
+                        embedding_timeout=settings.LLM_EMBEDDING_TIMEOUT
+                    )
+    return _provider
+
+
+def close_llm_provider():
+    """Close the provider's connections; the next ``get_llm_provider`` call creates a new one."""
+    global _provider
+    with _provider_lock:
+        if _provider is not None:
+            _provider.close()
+            _provider = None
@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from langchain.schema import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from app.core.config import settings
+from app.services.llm.provider import get_llm_provider
+from app.utils.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = (
+    "Condense the conversation below into a short summary that keeps the facts, "
+    "names, numbers and open questions a support assistant needs to continue it. "
+    "Extend the existing summary if there is one."
+)
+
+
+@dataclass
+class Turn:
+    question: str
+    answer: str
+    tokens: int
+
+    def messages(self) -> List[BaseMessage]:
+        return [HumanMessage(content=self.question), AIMessage(content=self.answer)]
+
+    def transcript(self) -> str:
+        return f"User: {self.question}\nAssistant: {self.answer}"
+
+
+# (previous summary, turns to fold in) -> new summary
+Summarizer = Callable[[str, List[Turn]], Awaitable[str]]
+
+
+async def summarize_turns(summary: str, turns: List[Turn], max_tokens: int = 256) -> str:
+    """Fold ``turns`` into ``summary`` with the chat model."""
+    content = "\n\n".join(turn.transcript() for turn in turns)
+    if summary:
+        content = f"Existing summary:\n{summary}\n\nNew conversation:\n{content}"
+    result = await get_llm_provider().chat(
+        [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": content}
+        ],
+        model="gpt-4o-mini",
+        temperature=0,
+        max_tokens=max_tokens
+    )
+    return result.content.strip()
+
+
+@dataclass
+class Session:
+    id: str
+    summary: str = ""
+    summary_tokens: int = 0
+    # Turns sent verbatim, oldest first
+    turns: Deque[Turn] = field(default_factory=deque)
+    # Turns moved out of ``turns`` that the running summary does not cover yet
+    folding: List[Turn] = field(default_factory=list)
+    task: Optional[asyncio.Task] = None
+    last_used: float = field(default_factory=time.monotonic)
+    # Consecutive failed summaries, and when the next attempt may start
+    failures: int = 0
+    retry_at: float = 0.0
+
+    def verbatim(self, budget: int) -> List[Turn]:
+        """Turns sent as they are: the recent ones, then as many of the newest
+        turns awaiting the summary as fit in ``budget`` tokens."""
+        used = sum(turn.tokens for turn in self.turns)
+        pending = []
+        for turn in reversed(self.folding):
+            if used + turn.tokens > budget:
+                break
+            pending.append(turn)
+            used += turn.tokens
+        return pending[::-1] + list(self.turns)
+
+
+class ConversationMemory:
+    """Per-session chat history with a bounded prompt footprint.
+
+    Each session keeps its last ``max_turns`` turns verbatim, as long as they
+    fit in ``token_budget``; older turns are folded into a running summary by
+    ``summarizer`` in a background task, so answering never waits on it.
+    Until the summary catches up, the turns being folded are still sent
+    verbatim while they fit in the budget. A failed summary keeps its turns
+    and is retried on a later turn, ``retry_delay`` seconds after the failure
+    and doubling up to ``max_retry_delay``; if more than ``max_pending_turns``
+    turns pile up meanwhile, the oldest are dropped and counted. At most
+    ``max_sessions`` sessions are kept, least recently used first out, and
+    sessions idle for ``idle_ttl`` seconds are dropped.
+    """
+
+    def __init__(
+        self,
+        max_turns: int = 6,
+        token_budget: int = 1500,
+        max_sessions: int = 1000,
+        idle_ttl: float = 3600,
+        summarizer: Optional[Summarizer] = None,
+        retry_delay: float = 1.0,
+        max_retry_delay: float = 60.0,
+        max_pending_turns: int = 32
+    ):
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.summarizer = summarizer or summarize_turns
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_pending_turns = max_pending_turns
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.summaries = 0
+        self.summary_failures = 0
+        self.dropped_turns = 0
+
+    def _session(self, session_id: str) -> Session:
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = Session(id=session_id)
+            self._sessions.move_to_end(session_id)
+            session.last_used = now
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if len(self._sessions) <= self.max_sessions and now - oldest.last_used <= self.idle_ttl:
+                    break
+                self._drop(oldest)
+        return session
+
+    def _drop(self, session: Session, evicted: bool = True):
+        del self._sessions[session.id]
+        if session.task is not None:
+            session.task.cancel()
+        if evicted:
+            self.evictions += 1
+
+    def history(self, session_id: str) -> List[BaseMessage]:
+        """Messages to send ahead of the next question: the summary, then recent turns."""
+        session = self._session(session_id)
+        messages: List[BaseMessage] = []
+        if session.summary:
+            messages.append(SystemMessage(content=f"Summary of the earlier conversation: {session.summary}"))
+        for turn in session.verbatim(self.token_budget - session.summary_tokens):
+            messages.extend(turn.messages())
+        return messages
+
+    def history_tokens(self, session_id: str) -> int:
+        session = self._session(session_id)
+        verbatim = session.verbatim(self.token_budget - session.summary_tokens)
+        return session.summary_tokens + sum(turn.tokens for turn in verbatim)
+
+    def add_turn(self, session_id: str, question: str, answer: str):
+        """Record a finished turn and, if the session is over budget, start folding old turns."""
+        session = self._session(session_id)
+        session.turns.append(Turn(question, answer, count_tokens(question) + count_tokens(answer)))
+        budget = self.token_budget - session.summary_tokens
+        while len(session.turns) > 1 and (
+            len(session.turns) > self.max_turns or sum(turn.tokens for turn in session.turns) > budget
+        ):
+            session.folding.append(session.turns.popleft())
+        overflow = len(session.folding) - self.max_pending_turns
+        if overflow > 0 and (session.task is None or session.task.done()):
+            # Only while summaries keep failing: the summary never covers these
+            del session.folding[:overflow]
+            self.dropped_turns += overflow
+            logger.warning(f"Dropped {overflow} unsummarized turns of session {session.id}")
+        if session.folding:
+            self._schedule_summary(session)
+
+    def _schedule_summary(self, session: Session):
+        if session.task is not None and not session.task.done():
+            return
+        if time.monotonic() < session.retry_at:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            logger.warning(f"No event loop to summarize session {session.id}; keeping turns verbatim")
+            return
+        session.task = loop.create_task(self._summarize(session))
+
+    async def _summarize(self, session: Session):
+        while session.folding:
+            batch = list(session.folding)
+            try:
+                summary = await self.summarizer(session.summary, batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.summary_failures += 1
+                session.failures += 1
+                delay = min(self.retry_delay * 2 ** (session.failures - 1), self.max_retry_delay)
+                session.retry_at = time.monotonic() + delay
+                # The turns stay queued; the first turn after the delay retries them
+                logger.warning(f"Summarizing session {session.id} failed, retrying after {delay:.1f}s: {e}")
+                return
+            session.summary = summary
+            session.summary_tokens = count_tokens(summary)
+            session.failures = 0
+            del session.folding[:len(batch)]
+            self.summaries += 1
+
+    async def wait_for_summaries(self, session_id: str):
+        """Wait for a session's pending summary, e.g. in tests or before shutdown."""
+        session = self._sessions.get(session_id)
+        if session is not None and session.task is not None:
+            await asyncio.shield(session.task)
+
+    def clear(self, session_id: str):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._drop(session, evicted=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "evictions": self.evictions,
+                "summaries": self.summaries,
+                "summary_failures": self.summary_failures,
+                "dropped_turns": self.dropped_turns
+            }
+
+
+_conversation_memory: Optional[ConversationMemory] = None
+_conversation_memory_lock = threading.Lock()
+
+
+def get_conversation_memory() -> ConversationMemory:
+    """Return the process-wide conversation memory, creating it on first use."""
+    global _conversation_memory
+    if _conversation_memory is None:
+        with _conversation_memory_lock:
+            if _conversation_memory is None:
+                _conversation_memory = ConversationMemory(
+                    max_turns=settings.CONVERSATION_MAX_TURNS,
+                    token_budget=settings.CONVERSATION_TOKEN_BUDGET,
+                    max_sessions=settings.CONVERSATION_MAX_SESSIONS,
+                    idle_ttl=settings.CONVERSATION_IDLE_TTL
+                )
+    return _conversation_memory
@@ -0,0 +1,170 @@
+import json
+import logging
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.rag.lexical_index import MappedLexicalIndex, write_lexical_postings
+from app.services.memory.numpy_store import _top_k
+from app.services.memory.vector_store import MMAP_INDEX_DIRNAME, ReadOnlyVectorStoreError, SearchResult, VectorStore
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+# Generations kept on disk: the current one plus those workers may still have mapped
+_KEEP_GENERATIONS = 2
+
+
+def _current_file(db_dir: Path) -> Path:
+    return Path(db_dir) / MMAP_INDEX_DIRNAME / "CURRENT"
+
+
+def current_generation(db_dir: Path) -> Optional[Path]:
+    """Directory of the published generation, or None if there is none."""
+    try:
+        name = _current_file(db_dir).read_text().strip()
+    except OSError:
+        return None
+    path = Path(db_dir) / MMAP_INDEX_DIRNAME / name
+    return path if name and (path / "header.json").exists() else None
+
+
+def write_mmap_index(db_dir: Path, ids: List[str], texts: List[str], metadatas: List[Dict], vectors) -> Path:
+    """Write the chunks as a new generation of flat files and publish it.
+
+    Each generation directory holds ``vectors.f32`` (N x dim float32 rows),
+    ``norms.f32`` (squared row norms), ``records.bin`` (one JSON record with
+    the text and metadata per row), ``offsets.i64`` (N + 1 byte offsets into
+    records.bin), ``ids.json``, ``header.json`` and the BM25 postings of the
+    same rows (see ``write_lexical_postings``). ``CURRENT`` is switched
+    with an atomic rename once every file is written, so readers only ever
+    open complete generations; files of older generations stay valid for
+    processes that still map them.
+    """
+    root = Path(db_dir) / MMAP_INDEX_DIRNAME
+    root.mkdir(parents=True, exist_ok=True)
+    name = uuid.uuid4().hex
+    generation = root / name
+    generation.mkdir()
+
+    matrix = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(ids), -1) if len(ids) else np.empty((0, 0), dtype=np.float32)
+    matrix.tofile(generation / "vectors.f32")
+    np.einsum("ij,ij->i", matrix, matrix).astype(np.float32).tofile(generation / "norms.f32")
+
+    offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    with open(generation / "records.bin", "wb") as f:
+        for i, (text, metadata) in enumerate(zip(texts, metadatas)):
+            record = json.dumps({"text": text, "metadata": metadata or {}}).encode("utf-8")
+            f.write(record)
+            offsets[i + 1] = offsets[i] + len(record)
+    offsets.tofile(generation / "offsets.i64")
+    with open(generation / "ids.json", "w") as f:
+        json.dump(list(ids), f)
+    write_lexical_postings(generation, texts)
+    with open(generation / "header.json", "w") as f:
+        json.dump({"format": FORMAT_VERSION, "count": len(ids), "dim": int(matrix.shape[1]), "dtype": "float32"}, f)
+
+    tmp_path = root / "CURRENT.tmp"
+    tmp_path.write_text(name)
+    os.replace(tmp_path, _current_file(db_dir))
+    logger.info(f"Published memory-mapped index {name} with {len(ids)} chunks")
+
+    _remove_old_generations(root, name)
+    return generation
+
+
+def _remove_old_generations(root: Path, current: str):
+    generations = sorted(
+        (path for path in root.iterdir() if path.is_dir() and path.name != current),
+        key=lambda path: path.stat().st_mtime,
+        reverse=True
+    )
+    for path in generations[_KEEP_GENERATIONS - 1:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class MmapVectorStore(VectorStore):
+    """Read-only exact search over a published memory-mapped index.
+
+    Nothing is copied into the heap on open except the chunk IDs: vectors,
+    norms, records and the BM25 postings are ``np.memmap`` views, so every
+    worker on a host shares one copy through the page cache and a fresh
+    worker serves its first query without loading the index. Texts and
+    metadata are decoded only for the rows a query returns.
+    """
+
+    name = "mmap"
+
+    def __init__(self, generation: Path):
+        self.generation = Path(generation)
+        with open(self.generation / "header.json") as f:
+            header = json.load(f)
+        if header.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported memory-mapped index format: {header.get('format')}")
+        self.dim = header["dim"]
+        count = header["count"]
+        with open(self.generation / "ids.json") as f:
+            self.ids: List[str] = json.load(f)
+        self.positions = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        if count:
+            self.vectors = np.memmap(self.generation / "vectors.f32", dtype=np.float32, mode="r", shape=(count, self.dim))
+            self.sq_norms = np.memmap(self.generation / "norms.f32", dtype=np.float32, mode="r", shape=(count,))
+            self.offsets = np.memmap(self.generation / "offsets.i64", dtype=np.int64, mode="r", shape=(count + 1,))
+            self.records = np.memmap(self.generation / "records.bin", dtype=np.uint8, mode="r")
+        else:
+            self.vectors = np.empty((0, self.dim), dtype=np.float32)
+            self.sq_norms = np.empty(0, dtype=np.float32)
+        self.lexical = MappedLexicalIndex.open(self.generation, self.ids)
+
+    @classmethod
+    def open(cls, db_dir: Path) -> Optional["MmapVectorStore"]:
+        """The current generation under ``db_dir``, or None if none is published."""
+        generation = current_generation(db_dir)
+        return cls(generation) if generation is not None else None
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def lexical_index(self) -> Optional[MappedLexicalIndex]:
+        return self.lexical
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict], vectors: List[List[float]]):
+        raise ReadOnlyVectorStoreError("The memory-mapped index is read-only; ingestion publishes a new generation")
+
+    def delete(self, ids: List[str]):
+        raise ReadOnlyVectorStoreError("The memory-mapped index is read-only; ingestion publishes a new generation")
+
+    def _record(self, i: int) -> Dict:
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return json.loads(self.records[start:end].tobytes().decode("utf-8"))
+
+    def _result(self, i: int, score: float) -> SearchResult:
+        record = self._record(i)
+        return SearchResult(id=self.ids[i], content=record["text"], score=score, metadata=record["metadata"])
+
+    def query(self, vector: List[float], k: int) -> List[SearchResult]:
+        n = len(self.ids)
+        if not n or k <= 0:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        distances = self.sq_norms - 2.0 * (self.vectors @ query)
+        top = _top_k(distances, min(k, n))
+        offset = float(query @ query)
+        return [self._result(i, max(float(distances[i]) + offset, 0.0)) for i in top]
+
+    def get(self, ids: List[str]) -> List[SearchResult]:
+        return [self._result(self.positions[doc_id], 0.0) for doc_id in ids if doc_id in self.positions]
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.name,
+            "count": len(self.ids),
+            "dimensions": self.dim,
+            "generation": self.generation.name,
+            "mapped_bytes": int(self.vectors.nbytes)
+        }
@@ -0,0 +1,267 @@
+import logging
+import os
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.services.memory.vector_store import ChromaVectorStore, SearchResult, VectorStore
+
+logger = logging.getLogger(__name__)
+
+PRECISIONS = ("float32", "float16", "int8")
+
+# Rows converted to float32 at a time when scoring a compact matrix
+_BLOCK_ROWS = 8192
+
+
+def _spill(vectors: np.ndarray, directory: Optional[str]) -> np.ndarray:
+    """Write float32 rows to a temporary file and map it read-only.
+
+    The file is unlinked straight away; the mapping keeps it alive, so the
+    rows live in the page cache (and on disk) rather than in the heap.
+    """
+    if not len(vectors):
+        return np.empty(vectors.shape, dtype=np.float32)
+    fd, path = tempfile.mkstemp(prefix="vectors-", suffix=".f32", dir=directory or None)
+    os.close(fd)
+    writer = np.memmap(path, dtype=np.float32, mode="w+", shape=vectors.shape)
+    writer[:] = vectors
+    writer.flush()
+    del writer
+    rows = np.memmap(path, dtype=np.float32, mode="r", shape=vectors.shape)
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+    return rows
+
+
+@dataclass
+class _Snapshot:
+    ids: List[str]
+    texts: List[str]
+    metadatas: List[Dict]
+    # Searched matrix: float32 rows, float16 rows or int8 codes
+    matrix: np.ndarray
+    # Squared full-precision row norms, so a squared L2 distance costs one matmul
+    sq_norms: np.ndarray
+    # Per-dimension int8 scale (codes * scale ~ vectors)
+    scale: Optional[np.ndarray] = None
+    # Full-precision rows for rescoring, when ``matrix`` is compact
+    full: Optional[np.ndarray] = None
+    positions: Dict[str, int] = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, ids, texts, metadatas, vectors: np.ndarray, precision: str = "float32", spill_directory: Optional[str] = None) -> "_Snapshot":
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        scale, full = None, None
+        if precision == "float32":
+            matrix = vectors
+        elif precision == "float16":
+            matrix = vectors.astype(np.float16)
+            full = _spill(vectors, spill_directory)
+        elif precision == "int8":
+            scale = np.abs(vectors).max(axis=0) / 127.0 if len(vectors) else np.ones(vectors.shape[1], dtype=np.float32)
+            scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+            matrix = np.clip(np.rint(vectors / scale), -127, 127).astype(np.int8)
+            full = _spill(vectors, spill_directory)
+        else:
+            raise ValueError(f"Unknown precision {precision}, expected one of {PRECISIONS}")
+        return cls(
+            ids=list(ids),
+            texts=list(texts),
+            metadatas=list(metadatas),
+            matrix=matrix,
+            sq_norms=np.einsum("ij,ij->i", vectors, vectors),
+            scale=scale,
+            full=full,
+            positions={doc_id: i for i, doc_id in enumerate(ids)}
+        )
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Full-precision rows, wherever they are kept."""
+        return self.full if self.full is not None else self.matrix
+
+    def dot(self, query: np.ndarray) -> np.ndarray:
+        """``matrix @ query`` in float32, without materialising a float32 copy of a compact matrix."""
+        if self.full is None:
+            return self.matrix @ query
+        if self.scale is not None:
+            query = query * self.scale
+        out = np.empty(len(self.matrix), dtype=np.float32)
+        for start in range(0, len(self.matrix), _BLOCK_ROWS):
+            out[start:start + _BLOCK_ROWS] = self.matrix[start:start + _BLOCK_ROWS].astype(np.float32) @ query
+        return out
+
+
+def _top_k(distances: np.ndarray, k: int) -> np.ndarray:
+    if k < len(distances):
+        top = np.argpartition(distances, k - 1)[:k]
+    else:
+        top = np.arange(len(distances))
+    return top[np.argsort(distances[top])]
+
+
+class NumpyVectorStore(VectorStore):
+    """Exact nearest-neighbour search over one contiguous matrix.
+
+    A query is a single matrix-vector product plus ``argpartition`` for the
+    top k. numpy releases the GIL for the product, so searches on the
+    retrieval pool run in parallel. Writes build a new snapshot and swap it
+    in, so readers never see a half-updated index.
+
+    With ``precision`` float16 or int8 (per-dimension scaled) the matrix in
+    memory is 2x or 4x smaller. The compact form picks ``rescore_factor * k``
+    candidates, which are re-ranked against full-precision rows kept in a
+    memory-mapped file.
+    """
+
+    name = "numpy"
+
+    def __init__(self, dim: int = 0, precision: str = "float32", rescore_factor: int = 4, spill_directory: Optional[str] = None):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision {precision}, expected one of {PRECISIONS}")
+        self.precision = precision
+        self.rescore_factor = rescore_factor
+        self.spill_directory = spill_directory
+        self.recall: Optional[Dict] = None
+        self._write_lock = threading.Lock()
+        self._snapshot = _Snapshot.build([], [], [], np.empty((0, dim), dtype=np.float32))
+
+    @classmethod
+    def from_chroma(cls, chroma_store: ChromaVectorStore, **kwargs) -> "NumpyVectorStore":
+        ids, texts, metadatas, vectors = chroma_store.export()
+        store = cls(**kwargs)
+        if ids:
+            store.add(ids, texts, metadatas, vectors)
+        if store.precision != "float32" and ids:
+            store.recall = store.recall_against_float32()
+        logger.info(f"Loaded {len(ids)} vectors into memory: {store.stats()}")
+        return store
+
+    @property
+    def nbytes(self) -> int:
+        return self._snapshot.matrix.nbytes
+
+    def count(self) -> int:
+        return len(self._snapshot.ids)
+
+    def _build(self, ids, texts, metadatas, vectors: np.ndarray) -> _Snapshot:
+        return _Snapshot.build(ids, texts, metadatas, vectors, self.precision, self.spill_directory)
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict], vectors: List[List[float]]):
+        new_rows = np.asarray(vectors, dtype=np.float32)
+        with self._write_lock:
+            current = self._snapshot
+            if set(ids) & current.positions.keys():
+                # Re-added IDs replace their old rows
+                self._delete_rows(ids)
+                current = self._snapshot
+            rows = new_rows if not len(current.ids) else np.vstack([current.vectors, new_rows])
+            self._snapshot = self._build(
+                current.ids + list(ids),
+                current.texts + list(texts),
+                current.metadatas + [m or {} for m in metadatas],
+                rows
+            )
+
+    def delete(self, ids: List[str]):
+        with self._write_lock:
+            self._delete_rows(ids)
+
+    def _delete_rows(self, ids: List[str]):
+        current = self._snapshot
+        drop = {current.positions[doc_id] for doc_id in ids if doc_id in current.positions}
+        if not drop:
+            return
+        keep = [i for i in range(len(current.ids)) if i not in drop]
+        self._snapshot = self._build(
+            [current.ids[i] for i in keep],
+            [current.texts[i] for i in keep],
+            [current.metadatas[i] for i in keep],
+            current.vectors[keep]
+        )
+
+    def _search(self, snapshot: _Snapshot, query: np.ndarray, k: int, rescore: bool = True):
+        """Row indices and squared L2 distances of the ``k`` nearest rows."""
+        approx = snapshot.sq_norms - 2.0 * snapshot.dot(query)
+        if snapshot.full is None or not rescore:
+            top = _top_k(approx, k)
+            return top, approx[top] + float(query @ query)
+
+        candidates = np.sort(_top_k(approx, min(len(approx), k * self.rescore_factor)))
+        rows = np.asarray(snapshot.full[candidates], dtype=np.float32)
+        exact = snapshot.sq_norms[candidates] - 2.0 * (rows @ query) + float(query @ query)
+        order = _top_k(exact, k)
+        return candidates[order], exact[order]
+
+    def query(self, vector: List[float], k: int) -> List[SearchResult]:
+        snapshot = self._snapshot
+        n = len(snapshot.ids)
+        if not n or k <= 0:
+            return []
+        top, distances = self._search(snapshot, np.asarray(vector, dtype=np.float32), min(k, n))
+        return [
+            SearchResult(
+                id=snapshot.ids[i],
+                content=snapshot.texts[i],
+                score=max(float(distance), 0.0),
+                metadata=dict(snapshot.metadatas[i])
+            )
+            for i, distance in zip(top, distances)
+        ]
+
+    def get(self, ids: List[str]) -> List[SearchResult]:
+        snapshot = self._snapshot
+        return [
+            SearchResult(id=doc_id, content=snapshot.texts[i], score=0.0, metadata=dict(snapshot.metadatas[i]))
+            for doc_id, i in ((doc_id, snapshot.positions.get(doc_id)) for doc_id in ids)
+            if i is not None
+        ]
+
+    def recall_against_float32(self, k: int = 10, sample: int = 100, seed: int = 0) -> Optional[Dict]:
+        """recall@k of compact-only and rescored search, measured against exact float32 search.
+
+        Queries are midpoints of random pairs of stored vectors, so they fall
+        between topics the way real questions do.
+        """
+        snapshot = self._snapshot
+        n = len(snapshot.ids)
+        if snapshot.full is None or not n:
+            return None
+        k = min(k, n)
+        rng = np.random.default_rng(seed)
+        pairs = rng.integers(0, n, size=(min(sample, n), 2))
+        full = snapshot.full
+        queries = (np.asarray(full[pairs[:, 0]]) + np.asarray(full[pairs[:, 1]])) / 2.0
+
+        compact_hits = rescored_hits = 0
+        for query in queries.astype(np.float32):
+            exact = set(_top_k(snapshot.sq_norms - 2.0 * (full @ query), k).tolist())
+            compact_hits += len(exact & set(self._search(snapshot, query, k, rescore=False)[0].tolist()))
+            rescored_hits += len(exact & set(self._search(snapshot, query, k)[0].tolist()))
+        total = len(queries) * k
+        return {
+            "k": k,
+            "queries": len(queries),
+            "recall_compact": round(compact_hits / total, 4),
+            "recall_rescored": round(rescored_hits / total, 4)
+        }
+
+    def stats(self) -> Dict:
+        snapshot = self._snapshot
+        float32_bytes = snapshot.sq_norms.size * snapshot.matrix.shape[1] * 4
+        return {
+            "backend": self.name,
+            "precision": self.precision,
+            "count": len(snapshot.ids),
+            "dimensions": snapshot.matrix.shape[1],
+            "matrix_bytes": snapshot.matrix.nbytes,
+            "float32_bytes": float32_bytes,
+            "bytes_saved": float32_bytes - snapshot.matrix.nbytes,
+            "recall_vs_float32": self.recall
+        }
@@ -0,0 +1,613 @@
+import asyncio
+import contextvars
+import hashlib
+import logging
+import threading
+import time
+import weakref
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+
+from app.core.config import settings
+from app.rag.lexical_index import LEXICAL_INDEX_FILENAME, LexicalIndex, looks_like_identifier, reciprocal_rank_fusion
+from app.services.knowledge_base.base import Embeddings
+from app.services.knowledge_base.embeddings import aembed_query, get_query_embeddings
+
+if TYPE_CHECKING:
+    # Imported when a Chroma collection is opened; the mmap backend never needs it
+    from langchain.vectorstores import Chroma
+
+    from app.rag.lexical_index import MappedLexicalIndex
+
+logger = logging.getLogger(__name__)
+
+# Flat-file index published by ingestion for the mmap backend (see mmap_store)
+MMAP_INDEX_DIRNAME = "mmap_index"
+
+
+@dataclass
+class SearchResult:
+    """A retrieved chunk. ``score`` is the vector distance (lower is better),
+    None for a chunk only keyword search found. Hybrid search also sets
+    ``fused_score``, the reciprocal-rank score it ranked by (higher is better)."""
+    id: str
+    content: str
+    score: Optional[float]
+    metadata: Dict = field(default_factory=dict)
+    fused_score: Optional[float] = None
+
+
+def detach_persistence(store: "Chroma"):
+    """Stop a read-only client from writing its snapshot back to disk.
+
+    chromadb's duckdb+parquet client persists from ``__del__``, so a replaced
+    client would otherwise overwrite a freshly rebuilt index when collected.
+    """
+    db = getattr(getattr(store, "_client", None), "_db", None)
+    if db is not None:
+        db.persist = lambda: None
+
+
+class ReadOnlyVectorStoreError(RuntimeError):
+    """Raised on a write to a backend that is only replaced as a whole, never changed in place."""
+
+
+class VectorStore(ABC):
+    """Chunk vectors plus their texts and metadata, searchable by distance.
+
+    Distances are squared L2, as in Chroma's default space, so scores are
+    comparable across backends. Implementations must be safe to query from
+    several threads at once.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict], vectors: List[List[float]]):
+        ...
+
+    @abstractmethod
+    def delete(self, ids: List[str]):
+        ...
+
+    @abstractmethod
+    def query(self, vector: List[float], k: int) -> List[SearchResult]:
+        """The ``k`` nearest chunks, nearest first, with their distance as score."""
+
+    @abstractmethod
+    def get(self, ids: List[str]) -> List[SearchResult]:
+        """Chunks by ID in the given order, skipping unknown IDs (score is 0)."""
+
+    def persist(self):
+        """Write pending changes to disk, for backends that keep any."""
+
+    def lexical_index(self) -> Optional["LexicalIndex"]:
+        """BM25 postings published with this index, or None to load ``lexical_index.json``."""
+        return None
+
+    def stats(self) -> Dict:
+        return {"backend": self.name, "count": self.count()}
+
+
+class ChromaVectorStore(VectorStore):
+    """The persisted Chroma collection: hnswlib for search, duckdb+parquet for the rest."""
+
+    name = "chroma"
+
+    def __init__(self, chroma: "Chroma"):
+        self.chroma = chroma
+        self.collection = chroma._collection
+        # chromadb shares one duckdb connection per client, which is not safe
+        # for concurrent queries; query embedding happens outside this lock
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, persist_directory: Path, embeddings: Embeddings, read_only: bool = True) -> "ChromaVectorStore":
+        from langchain.vectorstores import Chroma
+
+        chroma = Chroma(persist_directory=str(persist_directory), embedding_function=embeddings)
+        if read_only:
+            detach_persistence(chroma)
+        return cls(chroma)
+
+    def count(self) -> int:
+        with self._lock:
+            return self.collection.count()
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict], vectors: List[List[float]]):
+        with self._lock:
+            self.collection.add(ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            self.collection.delete(ids=ids)
+
+    def query(self, vector: List[float], k: int) -> List[SearchResult]:
+        with self._lock:
+            count = self.collection.count()
+            if not count:
+                return []
+            results = self.collection.query(
+                query_embeddings=[vector],
+                n_results=min(k, count),
+                include=["documents", "metadatas", "distances"]
+            )
+        return [
+            SearchResult(id=doc_id, content=content, score=distance, metadata=metadata or {})
+            for doc_id, content, metadata, distance in zip(
+                results["ids"][0],
+                results["documents"][0],
+                results["metadatas"][0],
+                results["distances"][0]
+            )
+        ]
+
+    def get(self, ids: List[str]) -> List[SearchResult]:
+        if not ids:
+            return []
+        with self._lock:
+            found = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        by_id = {
+            doc_id: SearchResult(id=doc_id, content=content, score=0.0, metadata=metadata or {})
+            for doc_id, content, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+        }
+        return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+
+    def export(self) -> Tuple[List[str], List[str], List[Dict], List[List[float]]]:
+        """Every chunk's ID, text, metadata and vector, for loading into another backend."""
+        with self._lock:
+            data = self.collection.get(include=["embeddings", "documents", "metadatas"])
+        return data["ids"], data["documents"], [m or {} for m in data["metadatas"]], data["embeddings"]
+
+    def persist(self):
+        self.chroma.persist()
+
+
+def open_vector_store(backend: str, persist_directory: Path, embeddings: Embeddings) -> Tuple[Optional["Chroma"], VectorStore]:
+    """Open the persisted collection and serve it through ``backend``.
+
+    The mmap backend does not open Chroma at all (None is returned in its
+    place); it falls back to Chroma until ingestion has published an index.
+    """
+    if backend == "mmap":
+        from app.services.memory.mmap_store import MmapVectorStore
+        store = MmapVectorStore.open(persist_directory)
+        if store is not None:
+            return None, store
+        logger.warning(f"No memory-mapped index in {persist_directory} yet, serving from Chroma")
+        backend = "chroma"
+    chroma_store = ChromaVectorStore.open(persist_directory, embeddings)
+    if backend == "chroma":
+        return chroma_store.chroma, chroma_store
+    if backend == "numpy":
+        from app.services.memory.numpy_store import NumpyVectorStore
+        return chroma_store.chroma, NumpyVectorStore.from_chroma(
+            chroma_store,
+            precision=settings.VECTOR_STORE_PRECISION,
+            rescore_factor=settings.VECTOR_STORE_RESCORE_FACTOR,
+            spill_directory=settings.VECTOR_STORE_SPILL_DIRECTORY
+        )
+    raise ValueError(f"Unknown vector store backend: {backend}")
+
+
+class RetrievalEngine:
+    """Process-wide handle on the persisted vector index.
+
+    Opening the collection reads the parquet files and the hnswlib index from
+    disk, so it is done once and repeated only when ingestion changes the index.
+    Searches go through the configured VectorStore backend.
+    """
+
+    def __init__(
+        self,
+        persist_directory: str,
+        embeddings: Optional[Embeddings] = None,
+        check_interval: float = settings.RAG_INDEX_CHECK_INTERVAL,
+        backend: str = "chroma"
+    ):
+        self.persist_directory = Path(persist_directory)
+        self.embeddings = embeddings or get_query_embeddings()
+        self.check_interval = check_interval
+        self.backend = backend
+        self._lock = threading.RLock()
+        self._store: Optional["Chroma"] = None
+        self._index: Optional[VectorStore] = None
+        self._lexical: Optional[Union[LexicalIndex, "MappedLexicalIndex"]] = None
+        self._count = 0
+        self._fingerprint = None
+        self._last_check = 0.0
+
+    def _index_fingerprint(self):
+        """Cheap stat-based signature of the files chromadb and ingestion write on persist."""
+        if not self.persist_directory.exists():
+            return None
+        entries = []
+        paths = sorted(self.persist_directory.glob("chroma-*.parquet")) + [self.persist_directory / LEXICAL_INDEX_FILENAME]
+        for path in paths:
+            if not path.exists():
+                continue
+            stat = path.stat()
+            entries.append((path.name, stat.st_size, stat.st_mtime_ns))
+        index_dir = self.persist_directory / "index"
+        if index_dir.exists():
+            for path in sorted(index_dir.iterdir()):
+                stat = path.stat()
+                entries.append((path.name, stat.st_size, stat.st_mtime_ns))
+        current = self.persist_directory / MMAP_INDEX_DIRNAME / "CURRENT"
+        if current.exists():
+            entries.append((MMAP_INDEX_DIRNAME, current.read_text().strip()))
+        return tuple(entries)
+
+    def _open(self):
+        fingerprint = self._index_fingerprint()
+        store, index = open_vector_store(self.backend, self.persist_directory, self.embeddings)
+        count = index.count()
+        lexical = index.lexical_index()
+        if lexical is None:
+            lexical = LexicalIndex.load(self.persist_directory)
+
+        self._store = store
+        self._index = index
+        self._lexical = lexical
+        self._count = count
+        self._fingerprint = fingerprint
+        self._last_check = time.monotonic()
+        logger.info(
+            f"Opened vector store at {self.persist_directory} with {count} chunks "
+            f"({index.name} backend, {len(lexical)} in the lexical index)"
+        )
+
+    def reload(self):
+        """Reopen the collection unconditionally."""
+        with self._lock:
+            self._open()
+
+    def reload_if_changed(self):
+        """Reopen the collection if the files on disk changed since it was opened."""
+        now = time.monotonic()
+        if self._index is not None and now - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            if self._index is not None and now - self._last_check < self.check_interval:
+                return
+            fingerprint = self._index_fingerprint()
+            if self._index is None or fingerprint != self._fingerprint:
+                if self._index is not None:
+                    logger.info("Vector store changed on disk, reloading")
+                self._open()
+            else:
+                self._last_check = now
+
+    def invalidate(self):
+        """Force a fingerprint check on the next access, e.g. right after ingestion."""
+        with self._lock:
+            self._last_check = 0.0
+
+    @property
+    def vector_store(self) -> "Chroma":
+        """The underlying langchain Chroma wrapper, for langchain retrievers."""
+        self.reload_if_changed()
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = ChromaVectorStore.open(self.persist_directory, self.embeddings).chroma
+        return self._store
+
+    @property
+    def index(self) -> VectorStore:
+        self.reload_if_changed()
+        return self._index
+
+    @property
+    def index_version(self) -> str:
+        """Short identifier of the currently loaded index."""
+        self.reload_if_changed()
+        return self.loaded_version
+
+    @property
+    def loaded_version(self) -> Optional[str]:
+        """``index_version`` without checking the disk for changes; None before the first open."""
+        if self._index is None:
+            return None
+        return hashlib.sha1(repr(self._fingerprint).encode()).hexdigest()[:12]
+
+    def count(self) -> int:
+        self.reload_if_changed()
+        return self._count
+
+    @property
+    def loaded_count(self) -> Optional[int]:
+        """``count()`` without checking the disk for changes; None before the first open."""
+        return self._count if self._index is not None else None
+
+    @property
+    def lexical_index(self) -> Union[LexicalIndex, "MappedLexicalIndex"]:
+        self.reload_if_changed()
+        return self._lexical
+
+    def lexical_search(self, query: str, k: int = settings.RAG_TOP_K) -> List[Tuple[str, float]]:
+        """Return the IDs and BM25 scores of the ``k`` best keyword matches."""
+        return self.lexical_index.search(query, k)
+
+    def get_results(self, ids: List[str]) -> List[SearchResult]:
+        """Fetch chunks by ID, in the given order (score is left at 0)."""
+        return self.index.get(ids)
+
+    def search(self, query: str, k: int = settings.RAG_TOP_K) -> List[SearchResult]:
+        """Return the ``k`` chunks closest to ``query``, best first."""
+        self.reload_if_changed()
+        if not self._count:
+            return []
+        return self.search_by_vector(self.embeddings.embed_query(query), k)
+
+    def search_by_vector(self, query_embedding: List[float], k: int = settings.RAG_TOP_K) -> List[SearchResult]:
+        """Return the ``k`` chunks closest to an already embedded query."""
+        self.reload_if_changed()
+        if not self._count:
+            return []
+        return self._index.query(query_embedding, k)
+
+
+@dataclass
+class SearchTiming:
+    queue_ms: float
+    search_ms: float
+    # The part of search_ms spent embedding the query, before queueing for the pool
+    embed_ms: float = 0.0
+
+
+@dataclass
+class Retrieval:
+    """Search results together with what produced them."""
+    results: List[SearchResult]
+    query_embedding: Optional[List[float]]
+    index_version: str
+    timing: SearchTiming
+
+
+class AsyncRetriever:
+    """Async facade that keeps vector search off the event loop.
+
+    The query is embedded on the caller's event loop first, so concurrent
+    queries share micro-batched embedding requests however small the pool.
+    Index lookups then run on a dedicated pool of ``max_workers`` threads and
+    at most ``max_in_flight`` are submitted at once; the rest wait on a
+    semaphore. The time a search spends waiting for a slot and a thread is
+    reported as its queue time.
+
+    With ``hybrid`` on, BM25 and dense search run concurrently and their top
+    ``candidates`` are merged by reciprocal rank fusion; a query that is an
+    exact identifier in the corpus is answered by BM25 alone, without
+    embedding it.
+    """
+
+    def __init__(
+        self,
+        engine: RetrievalEngine,
+        max_workers: int = 4,
+        max_in_flight: int = 8,
+        hybrid: bool = False,
+        candidates: int = 20,
+        rrf_k: int = 60
+    ):
+        self.engine = engine
+        self.max_workers = max_workers
+        self.max_in_flight = max_in_flight
+        self.hybrid = hybrid
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="retrieval")
+        self._semaphores = weakref.WeakKeyDictionary()
+        self.searches = 0
+        self.lexical_only = 0
+        self.waiting = 0
+        self.in_flight = 0
+        self._queue_ms_total = 0.0
+        self._search_ms_total = 0.0
+        self.max_queue_ms = 0.0
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.max_in_flight)
+        return self._semaphores[loop]
+
+    def _run(self, loop: asyncio.AbstractEventLoop, func, *args) -> asyncio.Future:
+        """Run ``func`` on the pool in a copy of the caller's context, so its log records keep the request ID."""
+        return loop.run_in_executor(self.executor, contextvars.copy_context().run, func, *args)
+
+    @asynccontextmanager
+    async def _slot(self):
+        """Hold one of the ``max_in_flight`` search slots."""
+        semaphore = self._semaphore()
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            semaphore.release()
+
+    @staticmethod
+    def _timing(submitted: float, started: float, embed_ms: float = 0.0) -> SearchTiming:
+        return SearchTiming(
+            queue_ms=round((started - submitted) * 1000, 1),
+            search_ms=round((time.monotonic() - started) * 1000 + embed_ms, 1),
+            embed_ms=embed_ms
+        )
+
+    async def _embed(self, query: str) -> Tuple[Optional[List[float]], float]:
+        """Embed ``query`` on the calling loop, unless the loaded index is empty.
+
+        Done before taking a slot and without a pool thread, so every query
+        waiting for the pool can join the same embedding batch.
+        """
+        count = self.engine.loaded_count
+        if count is None:
+            # First query: open the index on the pool to learn whether it is empty
+            count = await self._run(asyncio.get_running_loop(), self.engine.count)
+        if not count:
+            return None, 0.0
+        started = time.monotonic()
+        query_embedding = await aembed_query(self.engine.embeddings, query)
+        return query_embedding, round((time.monotonic() - started) * 1000, 1)
+
+    def _dense(self, query: str, query_embedding: Optional[List[float]], k: int, submitted: float, embed_ms: float) -> Retrieval:
+        started = time.monotonic()
+        index_version = self.engine.index_version
+        if query_embedding is None and self.engine.count():
+            # The index was empty when the query arrived and has been filled since
+            query_embedding = self.engine.embeddings.embed_query(query)
+        results = self.engine.search_by_vector(query_embedding, k) if query_embedding else []
+        return Retrieval(results, query_embedding, index_version, self._timing(submitted, started, embed_ms))
+
+    def _identifier_lookup(self, query: str, k: int, submitted: float) -> Optional[Retrieval]:
+        started = time.monotonic()
+        if not self.engine.lexical_index.is_exact_identifier(query):
+            return None
+        index_version = self.engine.index_version
+        ids = [doc_id for doc_id, _ in self.engine.lexical_search(query, k)]
+        # Ranked like hybrid results, from the keyword ranking alone
+        fused = dict(reciprocal_rank_fusion([ids], k=self.rrf_k))
+        results = [replace(r, score=None, fused_score=round(fused[r.id], 6)) for r in self.engine.get_results(ids)]
+        return Retrieval(results, None, index_version, self._timing(submitted, started))
+
+    async def _hybrid(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        query: str,
+        query_embedding: Optional[List[float]],
+        k: int,
+        submitted: float,
+        embed_ms: float
+    ) -> Retrieval:
+        dense, lexical = await asyncio.gather(
+            self._run(loop, self._dense, query, query_embedding, self.candidates, submitted, embed_ms),
+            self._run(loop, self.engine.lexical_search, query, self.candidates)
+        )
+        fused = reciprocal_rank_fusion(
+            [[result.id for result in dense.results], [doc_id for doc_id, _ in lexical]],
+            k=self.rrf_k
+        )[:k]
+        by_id = {result.id: result for result in dense.results}
+        missing = [doc_id for doc_id, _ in fused if doc_id not in by_id]
+        if missing:
+            # Keyword-only hits: fetch their text from the collection
+            for result in await self._run(loop, self.engine.get_results, missing):
+                by_id[result.id] = replace(result, score=None)
+        results = [replace(by_id[doc_id], fused_score=round(score, 6)) for doc_id, score in fused if doc_id in by_id]
+
+        queue_ms = dense.timing.queue_ms
+        search_ms = round((time.monotonic() - submitted) * 1000 - queue_ms + embed_ms, 1)
+        timing = SearchTiming(queue_ms, search_ms, embed_ms)
+        return Retrieval(results, dense.query_embedding, dense.index_version, timing)
+
+    async def retrieve(self, query: str, k: int = settings.RAG_TOP_K) -> Retrieval:
+        loop = asyncio.get_running_loop()
+        retrieval = None
+        if self.hybrid and looks_like_identifier(query):
+            submitted = time.monotonic()
+            async with self._slot():
+                retrieval = await self._run(loop, self._identifier_lookup, query, k, submitted)
+            if retrieval is not None:
+                self.lexical_only += 1
+
+        if retrieval is None:
+            query_embedding, embed_ms = await self._embed(query)
+            submitted = time.monotonic()
+            async with self._slot():
+                if self.hybrid:
+                    retrieval = await self._hybrid(loop, query, query_embedding, k, submitted, embed_ms)
+                else:
+                    retrieval = await self._run(loop, self._dense, query, query_embedding, k, submitted, embed_ms)
+
+        timing = retrieval.timing
+        self.searches += 1
+        self._queue_ms_total += timing.queue_ms
+        self._search_ms_total += timing.search_ms
+        self.max_queue_ms = max(self.max_queue_ms, timing.queue_ms)
+        return retrieval
+
+    async def search(self, query: str, k: int = settings.RAG_TOP_K) -> List[SearchResult]:
+        return (await self.retrieve(query, k)).results
+
+    def stats(self) -> Dict:
+        searches = self.searches or 1
+        return {
+            "workers": self.max_workers,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "searches": self.searches,
+            "lexical_only": self.lexical_only,
+            "avg_queue_ms": round(self._queue_ms_total / searches, 1),
+            "max_queue_ms": self.max_queue_ms,
+            "avg_search_ms": round(self._search_ms_total / searches, 1)
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+_engine: Optional[RetrievalEngine] = None
+_engine_lock = threading.Lock()
+_retriever: Optional[AsyncRetriever] = None
+
+
+def get_retrieval_engine() -> RetrievalEngine:
+    """Return the shared retrieval engine, creating it on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RetrievalEngine(
+                    settings.CHROMA_DIRECTORY,
+                    embeddings=get_query_embeddings(),
+                    backend=settings.VECTOR_STORE_BACKEND
+                )
+    return _engine
+
+
+def current_index_version() -> Optional[str]:
+    """Version of the index the shared engine has loaded, without opening or reloading it."""
+    engine = _engine
+    return engine.loaded_version if engine is not None else None
+
+
+def get_async_retriever() -> AsyncRetriever:
+    """Return the shared async retriever over the shared retrieval engine."""
+    global _retriever
+    if _retriever is None:
+        engine = get_retrieval_engine()
+        with _engine_lock:
+            if _retriever is None:
+                _retriever = AsyncRetriever(
+                    engine,
+                    max_workers=settings.RAG_SEARCH_WORKERS,
+                    max_in_flight=settings.RAG_SEARCH_MAX_IN_FLIGHT,
+                    hybrid=settings.RAG_HYBRID_SEARCH,
+                    candidates=settings.RAG_HYBRID_CANDIDATES,
+                    rrf_k=settings.RAG_RRF_K
+                )
+    return _retriever
+
+
+def close_async_retriever():
+    """Shut down the shared retriever's thread pool; the next call creates a new one."""
+    global _retriever
+    with _engine_lock:
+        retriever, _retriever = _retriever, None
+    if retriever is not None:
+        retriever.shutdown()
@@ -0,0 +1,94 @@
+"""Advisory lock file shared by every process on a host.
+
+Threading locks only serialize one process; with several uvicorn workers
+(and the command-line scripts) writing the same vector store, the writers
+take an ``fcntl`` lock instead. The holder records who it is in the file, so
+a process that finds the lock taken can say which job holds it. The kernel
+drops the lock when its holder exits, so a crashed worker cannot leave it
+stuck.
+"""
+import fcntl
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+
+class FileLock:
+    """Exclusive ``flock`` on ``path``, created on first use.
+
+    Not reentrant: acquiring it twice fails even within one process. The
+    ``owner`` passed to ``acquire`` is written into the file for ``holder``.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._fd: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def held(self) -> bool:
+        """Whether this object holds the lock."""
+        return self._fd is not None
+
+    def acquire(self, owner: Optional[Dict] = None, blocking: bool = True) -> bool:
+        with self._lock:
+            if self._fd is not None:
+                return False
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            except BaseException:
+                os.close(fd)
+                raise
+            os.ftruncate(fd, 0)
+            os.write(fd, json.dumps(dict(owner or {}, pid=os.getpid())).encode("utf-8"))
+            self._fd = fd
+            return True
+
+    def release(self):
+        with self._lock:
+            if self._fd is None:
+                return
+            fd, self._fd = self._fd, None
+            os.ftruncate(fd, 0)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def is_locked(self) -> bool:
+        """Whether any process, this one included, holds the lock."""
+        if self.held:
+            return True
+        if not self.path.exists():
+            return False
+        fd = os.open(str(self.path), os.O_RDONLY)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        finally:
+            os.close(fd)
+        return False
+
+    def holder(self) -> Optional[Dict]:
+        """The owner recorded by the current holder, or None if the lock is free."""
+        if not self.is_locked():
+            return None
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # Taken but not yet written
+            return {}
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
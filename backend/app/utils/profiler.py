@@ -0,0 +1,203 @@
+"""Sampling profiler for a live worker process.
+
+A sampler thread reads every thread's stack with ``sys._current_frames()`` at
+a fixed interval and counts the stacks, which costs the profiled threads
+nothing between samples. The counts are written as folded stacks, the input
+format of flamegraph.pl and speedscope. Optionally a tracemalloc snapshot is
+diffed across the window, and a heartbeat on the event loop lets the sampler
+catch the loop's stack whenever one step runs longer than a threshold.
+"""
+import asyncio
+import io
+import json
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+import zipfile
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_STACK_DEPTH = 64
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})"
+
+
+def stack_labels(frame) -> List[str]:
+    """Frame labels from the outermost call to ``frame``."""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return labels[::-1]
+
+
+@dataclass
+class BlockingEvent:
+    started_at: float
+    blocked_ms: float
+    stack: List[str]
+
+    def to_dict(self) -> Dict:
+        return {"started_at": self.started_at, "blocked_ms": round(self.blocked_ms, 1), "stack": self.stack}
+
+
+@dataclass
+class ProfileResult:
+    seconds: float
+    interval: float
+    samples: int = 0
+    stacks: Counter = field(default_factory=Counter)
+    memory_top: List[str] = field(default_factory=list)
+    blocking: List[BlockingEvent] = field(default_factory=list)
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, limit: int = 30) -> List[Dict]:
+        """Frames by the share of samples in which they were the innermost frame."""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [
+            {"frame": frame, "samples": count, "share": round(count / total, 4)}
+            for frame, count in leaves.most_common(limit)
+        ]
+
+    def summary(self) -> Dict:
+        return {
+            "seconds": self.seconds,
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "top_functions": self.top_functions(),
+            "memory_top": self.memory_top,
+            "blocking": [event.to_dict() for event in self.blocking]
+        }
+
+    def to_zip(self) -> bytes:
+        """profile.json (summary), cpu.folded and, when collected, memory.txt."""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("profile.json", json.dumps(self.summary(), indent=2))
+            archive.writestr("cpu.folded", self.folded())
+            if self.memory_top:
+                archive.writestr("memory.txt", "\n".join(self.memory_top) + "\n")
+        return buffer.getvalue()
+
+
+class LoopProfiler:
+    """Profiles this process for one window, including the calling event loop.
+
+    Only one window runs at a time per process; ``busy`` tells whether one is.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(
+        self,
+        seconds: float,
+        interval: float = 0.005,
+        memory: bool = True,
+        blocking_threshold: Optional[float] = None,
+        memory_top: int = 25
+    ):
+        self.seconds = seconds
+        self.interval = interval
+        self.memory = memory
+        self.blocking_threshold = blocking_threshold
+        self.memory_top = memory_top
+        self.result = ProfileResult(seconds=seconds, interval=interval)
+        self._stop = threading.Event()
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+
+    @classmethod
+    def busy(cls) -> bool:
+        return cls._lock.locked()
+
+    def _thread_names(self) -> Dict[int, str]:
+        return {thread.ident: thread.name for thread in threading.enumerate()}
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = self._thread_names()
+        blocked_since: Optional[float] = None
+        next_sample = time.monotonic()
+        while not self._stop.is_set():
+            frames = sys._current_frames()
+            for thread_id, frame in frames.items():
+                if thread_id == own:
+                    continue
+                if thread_id not in names:
+                    names = self._thread_names()
+                name = names.get(thread_id, str(thread_id))
+                self.result.stacks[";".join([name] + stack_labels(frame))] += 1
+            self.result.samples += 1
+
+            if self.blocking_threshold is not None and self._loop_thread_id in frames:
+                now = time.monotonic()
+                lag = now - self._heartbeat
+                if lag > self.blocking_threshold and blocked_since != self._heartbeat:
+                    # One event per stall, with the stack that is holding the loop
+                    blocked_since = self._heartbeat
+                    stack = stack_labels(frames[self._loop_thread_id])
+                    self.result.blocking.append(BlockingEvent(time.time() - lag, lag * 1000, stack))
+                    logger.warning(f"Event loop blocked for {lag * 1000:.0f}ms in {stack[-1] if stack else '?'}")
+                elif blocked_since == self._heartbeat and self.result.blocking:
+                    self.result.blocking[-1].blocked_ms = lag * 1000
+
+            next_sample += self.interval
+            self._stop.wait(max(0.0, next_sample - time.monotonic()))
+
+    async def _beat(self):
+        step = self.blocking_threshold / 2
+        while not self._stop.is_set():
+            self._heartbeat = time.monotonic()
+            await asyncio.sleep(step)
+
+    def _memory_diff(self, before: tracemalloc.Snapshot) -> List[str]:
+        after = tracemalloc.take_snapshot()
+        return [str(stat) for stat in after.compare_to(before, "lineno")[:self.memory_top]]
+
+    async def run(self) -> ProfileResult:
+        """Profile for ``seconds`` without blocking the loop; raises RuntimeError if a profile is running."""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running in this worker")
+        loop = asyncio.get_running_loop()
+        started_tracing = False
+        try:
+            if self.memory:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    started_tracing = True
+                # Snapshots of a large heap take hundreds of ms; keep them off the loop
+                before = await loop.run_in_executor(None, tracemalloc.take_snapshot)
+
+            self._loop_thread_id = threading.get_ident()
+            sampler = threading.Thread(target=self._sample, name="profiler", daemon=True)
+            sampler.start()
+            beat = asyncio.ensure_future(self._beat()) if self.blocking_threshold else None
+            try:
+                await asyncio.sleep(self.seconds)
+            finally:
+                self._stop.set()
+                if beat is not None:
+                    await beat
+                await loop.run_in_executor(None, sampler.join)
+
+            if self.memory:
+                self.result.memory_top = await loop.run_in_executor(None, self._memory_diff, before)
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+            self._lock.release()
+        logger.info(f"Profiled {self.seconds}s: {self.result.samples} samples, {len(self.result.blocking)} loop stalls")
+        return self.result
@@ -0,0 +1,155 @@
+"""Startup warmup and the readiness state behind /api/ready.
+
+A worker is live as soon as it answers /api/health, but it is only ready for
+traffic once the first query costs what every later one does: the heavy
+imports are done, the index is open and the LLM connection pool holds a
+connection. ``Warmup`` runs named steps in order in the background, retrying
+the ones readiness depends on, and records how each went.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Worker states
+PENDING = "pending"
+WARMING = "warming"
+READY = "ready"
+FAILED = "failed"
+
+# Step statuses
+STEP_PENDING = "pending"
+STEP_RUNNING = "running"
+STEP_OK = "ok"
+STEP_SKIPPED = "skipped"
+STEP_FAILED = "failed"
+
+
+class WarmupSkipped(Exception):
+    """Raised by a step that does not apply to this configuration."""
+
+
+@dataclass
+class WarmupStep:
+    name: str
+    run: Callable[[], Awaitable]
+    required: bool = False
+    status: str = STEP_PENDING
+    attempts: int = 0
+    duration_ms: float = 0.0
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        data = {"name": self.name, "status": self.status, "attempts": self.attempts, "duration_ms": self.duration_ms}
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+class Warmup:
+    """Runs warmup steps and reports whether the worker is ready.
+
+    A failed ``required`` step leaves the worker not ready and is retried,
+    after ``retry_delay`` seconds doubling up to ``max_retry_delay``, until it
+    succeeds; the steps after it wait. Any other failed step is recorded and
+    logged but does not hold readiness back, so an upstream outage does not
+    take every replica out of rotation.
+    """
+
+    def __init__(
+        self,
+        steps: Sequence[Tuple[str, Callable[[], Awaitable]]],
+        required: Sequence[str] = (),
+        timeout: float = 60.0,
+        retry_delay: float = 1.0,
+        max_retry_delay: float = 60.0
+    ):
+        self.steps = [WarmupStep(name, run, required=name in required) for name, run in steps]
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.status = PENDING
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status == READY
+
+    def start(self):
+        """Run the steps in a background task on the running loop, unless already done or running."""
+        if self.ready or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.ensure_future(self.run())
+
+    def skip(self):
+        """Mark the worker ready without warming up."""
+        for step in self.steps:
+            step.status = STEP_SKIPPED
+        self.status = READY
+
+    def cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run_step(self, step: WarmupStep) -> bool:
+        step.status = STEP_RUNNING
+        step.attempts += 1
+        step.error = None
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(step.run(), self.timeout)
+            step.status = STEP_OK
+        except WarmupSkipped as e:
+            step.status = STEP_SKIPPED
+            step.error = str(e)
+        except asyncio.TimeoutError:
+            step.status = STEP_FAILED
+            step.error = f"Timed out after {self.timeout}s"
+        except Exception as e:
+            step.status = STEP_FAILED
+            step.error = str(e)
+        step.duration_ms = round((time.monotonic() - started) * 1000, 1)
+        if step.status == STEP_FAILED:
+            logger.error(f"Warmup step {step.name} failed after {step.duration_ms}ms: {step.error}")
+        else:
+            logger.info(f"Warmup step {step.name}: {step.status} in {step.duration_ms}ms")
+        return step.status != STEP_FAILED or not step.required
+
+    async def run(self):
+        self.status = WARMING
+        self.started_at = time.monotonic()
+        delay = self.retry_delay
+        try:
+            for step in self.steps:
+                while not await self._run_step(step):
+                    self.status = FAILED
+                    logger.warning(f"Retrying required warmup step {step.name} in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.max_retry_delay)
+                    self.status = WARMING
+            self.status = READY
+        except asyncio.CancelledError:
+            # Shut down mid-warmup; a later start() runs every step again
+            self.status = PENDING
+            for step in self.steps:
+                step.status = STEP_PENDING
+                step.attempts = 0
+            raise
+        self.finished_at = time.monotonic()
+        logger.info(f"Warmup finished in {self.finished_at - self.started_at:.2f}s: {self.status}")
+
+    def state(self) -> Dict:
+        seconds = None
+        if self.started_at is not None:
+            seconds = round((self.finished_at or time.monotonic()) - self.started_at, 3)
+        return {
+            "status": self.status,
+            "ready": self.ready,
+            "seconds": seconds,
+            "steps": [step.to_dict() for step in self.steps]
+        }
@@ -0,0 +1,222 @@
+"""Local stand-in for the OpenAI embeddings and chat completions APIs.
+
+Embeddings are deterministic unit vectors seeded from each input's sha256, so
+equal texts get equal vectors across runs. Chat completions return a fixed
+number of filler words, streamed or whole. Latencies are configurable and a
+share of requests can be answered with 429 to exercise retry paths.
+
+Point the openai library at it with ``OPENAI_API_BASE=http://127.0.0.1:<port>/v1``.
+Run standalone from ``backend/``:
+
+    python -m benchmarks.fake_openai --port 8100 --chat-first-token-ms 300
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class FakeOpenAIConfig:
+    dim: int = 1536
+    embedding_latency_ms: float = 50.0
+    # Added per input in a batch, on top of the fixed latency
+    embedding_latency_per_input_ms: float = 0.5
+    chat_first_token_ms: float = 300.0
+    chat_token_interval_ms: float = 15.0
+    answer_words: int = 60
+    embedding_429_rate: float = 0.0
+    chat_429_rate: float = 0.0
+    retry_after: float = 0.1
+    seed: int = 0
+
+
+@dataclass
+class FakeOpenAIStats:
+    embedding_requests: int = 0
+    embedding_inputs: int = 0
+    chat_requests: int = 0
+    streamed_requests: int = 0
+    rate_limited: Dict[str, int] = field(default_factory=lambda: {"embeddings": 0, "chat": 0})
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data["avg_embedding_batch"] = round(self.embedding_inputs / (self.embedding_requests or 1), 2)
+        return data
+
+
+def embedding(item, dim: int) -> List[float]:
+    """Unit vector seeded from the input (a string or a list of token IDs)."""
+    payload = item if isinstance(item, str) else json.dumps(item)
+    seed = int.from_bytes(hashlib.sha256(payload.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim)
+    return (vector / np.linalg.norm(vector)).astype(np.float32).tolist()
+
+
+def rate_limited(retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"error": {"message": "Rate limit reached (simulated)", "type": "requests", "code": "rate_limit_exceeded"}},
+        headers={"retry-after": str(retry_after)}
+    )
+
+
+def create_app(config: FakeOpenAIConfig, stats: FakeOpenAIStats) -> FastAPI:
+    app = FastAPI()
+    rng = random.Random(config.seed)
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"]
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        if rng.random() < config.embedding_429_rate:
+            stats.rate_limited["embeddings"] += 1
+            return rate_limited(config.retry_after)
+        stats.embedding_requests += 1
+        stats.embedding_inputs += len(inputs)
+        await asyncio.sleep((config.embedding_latency_ms + config.embedding_latency_per_input_ms * len(inputs)) / 1000)
+        return {
+            "object": "list",
+            "model": body.get("model", "text-embedding-ada-002"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": embedding(item, config.dim)}
+                for i, item in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)}
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        if rng.random() < config.chat_429_rate:
+            stats.rate_limited["chat"] += 1
+            return rate_limited(config.retry_after)
+        stats.chat_requests += 1
+        question = body["messages"][-1]["content"]
+        words = [f"word{i}" for i in range(config.answer_words)]
+        prompt_tokens = sum(len(m["content"]) // 4 for m in body["messages"])
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words), "total_tokens": prompt_tokens + len(words)}
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep((config.chat_first_token_ms + config.chat_token_interval_ms * len(words)) / 1000)
+            return {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": created,
+                "model": body.get("model"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": f"Answer to {question}: " + " ".join(words)},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            }
+
+        stats.streamed_requests += 1
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        async def events():
+            def chunk(delta, finish_reason=None, **extra):
+                data = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": body.get("model"),
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                    **extra
+                }
+                return f"data: {json.dumps(data)}\n\n"
+
+            await asyncio.sleep(config.chat_first_token_ms / 1000)
+            yield chunk({"role": "assistant", "content": f"Answer to {question}:"})
+            for word in words:
+                await asyncio.sleep(config.chat_token_interval_ms / 1000)
+                yield chunk({"content": f" {word}"})
+            yield chunk({}, finish_reason="stop")
+            if include_usage:
+                yield f"data: {json.dumps({'id': 'chatcmpl-fake', 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats.to_dict()
+
+    return app
+
+
+class FakeOpenAIServer:
+    """The fake API served by uvicorn on a background thread."""
+
+    def __init__(self, config: FakeOpenAIConfig, host: str = "127.0.0.1", port: int = 8100):
+        self.config = config
+        self.stats = FakeOpenAIStats()
+        self.url = f"http://{host}:{port}/v1"
+        self.server = uvicorn.Server(uvicorn.Config(
+            create_app(config, self.stats), host=host, port=port, log_level="warning"
+        ))
+        self.thread = threading.Thread(target=self.server.run, name="fake-openai", daemon=True)
+
+    def start(self, timeout: float = 10.0):
+        self.thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Fake OpenAI server did not start")
+            time.sleep(0.05)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    defaults = FakeOpenAIConfig()
+    parser.add_argument("--dim", type=int, default=defaults.dim, help="embedding dimensions")
+    parser.add_argument("--embedding-latency-ms", type=float, default=defaults.embedding_latency_ms)
+    parser.add_argument("--embedding-latency-per-input-ms", type=float, default=defaults.embedding_latency_per_input_ms)
+    parser.add_argument("--chat-first-token-ms", type=float, default=defaults.chat_first_token_ms)
+    parser.add_argument("--chat-token-interval-ms", type=float, default=defaults.chat_token_interval_ms)
+    parser.add_argument("--answer-words", type=int, default=defaults.answer_words)
+    parser.add_argument("--embedding-429-rate", type=float, default=0.0, help="share of embedding requests answered with 429")
+    parser.add_argument("--chat-429-rate", type=float, default=0.0, help="share of chat requests answered with 429")
+
+
+def config_from_args(args: argparse.Namespace) -> FakeOpenAIConfig:
+    return FakeOpenAIConfig(
+        dim=args.dim,
+        embedding_latency_ms=args.embedding_latency_ms,
+        embedding_latency_per_input_ms=args.embedding_latency_per_input_ms,
+        chat_first_token_ms=args.chat_first_token_ms,
+        chat_token_interval_ms=args.chat_token_interval_ms,
+        answer_words=args.answer_words,
+        embedding_429_rate=args.embedding_429_rate,
+        chat_429_rate=args.chat_429_rate
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(config_from_args(args), FakeOpenAIStats()), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
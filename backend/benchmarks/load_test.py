@@ -0,0 +1,278 @@
+"""End-to-end load test of ingestion and /api/chat/ws against a fake OpenAI.
+
+Starts the fake OpenAI API (benchmarks.fake_openai) in-process and the app
+under uvicorn in a subprocess pointed at it, with its data, index and caches
+in a temporary directory. It ingests the PDFs through /api/initialize-rag on
+a single worker and reports chunks/s, then restarts the app with ``--workers``
+processes, which open the finished index during warmup, drives concurrent
+WebSocket clients and reports latency percentiles, time to first token,
+throughput and the per-stage timings the server puts in its done frames.
+Settings such as
+VECTOR_STORE_BACKEND or RAG_SEARCH_WORKERS are passed through from the
+environment, so runs can be compared per configuration.
+
+Run from ``backend/``:
+
+    python -m benchmarks.load_test --clients 50 --requests 10 --workers 2 --output load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import websockets
+
+from benchmarks.fake_openai import FakeOpenAIServer, add_arguments, config_from_args
+
+DEFAULT_PDF_DIR = Path(__file__).resolve().parents[2] / "data"
+
+QUESTIONS = [
+    "What products do you sell?",
+    "How long does delivery take?",
+    "What is your refund policy?",
+    "Do you deliver on weekends?",
+    "How do I track my order?",
+    "Which payment methods are accepted?",
+    "Can I cancel an order after placing it?",
+    "Where do your vegetables come from?"
+]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def http_json(url: str, method: str = "GET", timeout: float = 30) -> Dict:
+    request = urllib.request.Request(url, method=method, data=b"" if method == "POST" else None)
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def percentiles(values: List[float]) -> Dict:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    array = np.asarray(values)
+    return {
+        "p50": round(float(np.percentile(array, 50)), 1),
+        "p95": round(float(np.percentile(array, 95)), 1),
+        "p99": round(float(np.percentile(array, 99)), 1),
+        "mean": round(float(array.mean()), 1)
+    }
+
+
+def start_app(port: int, workers: int, env: Dict[str, str], log) -> subprocess.Popen:
+    command = [
+        sys.executable, "-m", "uvicorn", "app.main:app",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers), "--log-level", "warning"
+    ]
+    process = subprocess.Popen(
+        command, env=env, cwd=Path(__file__).resolve().parents[1], stdout=log, stderr=subprocess.STDOUT
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App exited with code {process.returncode}")
+        try:
+            # 503 until the startup warmup is done, so the first measured query is not a cold one
+            http_json(f"http://127.0.0.1:{port}/api/ready", timeout=1)
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("App did not become ready within 60s")
+
+
+def ingest(base_url: str, timeout: float = 600) -> Dict:
+    started = time.monotonic()
+    job_id = http_json(f"{base_url}/api/initialize-rag", method="POST")["job_id"]
+    while time.monotonic() - started < timeout:
+        job = http_json(f"{base_url}/api/ingestion/jobs/{job_id}")["job"]
+        if job["status"] not in ("queued", "running"):
+            break
+        time.sleep(0.2)
+    else:
+        raise RuntimeError(f"Ingestion job {job_id} did not finish within {timeout}s")
+    wall_s = time.monotonic() - started
+    if job["status"] != "succeeded":
+        raise RuntimeError(f"Ingestion failed: {job['error']}")
+    result = job["result"]["changes"]
+    chunks = result["chunks_added"]
+    return {
+        "chunks": chunks,
+        "wall_s": round(wall_s, 2),
+        "chunks_per_second": round(chunks / wall_s, 1) if wall_s else None,
+        "pipeline_chunks_per_second": result["chunks_per_second"]
+    }
+
+
+async def ask(websocket, question: str, stream: bool) -> Dict:
+    sent = time.perf_counter()
+    await websocket.send(json.dumps({"message": question, "stream": stream}))
+    first_token_ms: Optional[float] = None
+    while True:
+        frame = json.loads(await websocket.recv())
+        if frame.get("type") == "delta" and first_token_ms is None:
+            first_token_ms = (time.perf_counter() - sent) * 1000
+        if frame.get("error"):
+            return {"latency_ms": (time.perf_counter() - sent) * 1000, "error": frame["error"]}
+        if not stream or frame.get("type") == "done":
+            return {
+                "latency_ms": (time.perf_counter() - sent) * 1000,
+                "first_token_ms": first_token_ms,
+                "cached": frame.get("cached"),
+                "timing": frame.get("timing") or {},
+                "error": None
+            }
+
+
+async def client(url: str, client_id: int, requests: int, stream: bool, distinct: bool, tag: str) -> List[Dict]:
+    samples = []
+    async with websockets.connect(url, max_size=None, open_timeout=30) as websocket:
+        for i in range(requests):
+            question = QUESTIONS[(client_id + i) % len(QUESTIONS)]
+            if distinct:
+                # Unique text defeats the query, answer and single-flight caches
+                question = f"{question} ({tag} {client_id}, request {i})"
+            try:
+                samples.append(await ask(websocket, question, stream))
+            except Exception as e:
+                samples.append({"latency_ms": None, "error": str(e)})
+    return samples
+
+
+async def drive(url: str, clients: int, requests: int, stream: bool, distinct: bool, tag: str = "client") -> Dict:
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(client(url, c, requests, stream, distinct, tag) for c in range(clients)),
+        return_exceptions=True
+    )
+    wall_s = time.perf_counter() - started
+
+    samples, errors = [], {}
+    for result in results:
+        if isinstance(result, Exception):
+            errors[str(result)] = errors.get(str(result), 0) + requests
+            continue
+        for sample in result:
+            if sample["error"]:
+                errors[sample["error"]] = errors.get(sample["error"], 0) + 1
+            else:
+                samples.append(sample)
+
+    stages = {}
+    for name in ("retrieval_ms", "time_to_first_token_ms", "completion_ms"):
+        values = [s["timing"][name] for s in samples if s["timing"].get(name) is not None]
+        stages[name] = percentiles(values)
+    total = clients * requests
+    return {
+        "requests": total,
+        "succeeded": len(samples),
+        "error_rate": round((total - len(samples)) / total, 4) if total else 0.0,
+        "errors": errors,
+        "wall_s": round(wall_s, 2),
+        "throughput_rps": round(len(samples) / wall_s, 2) if wall_s else None,
+        "cached": sum(1 for s in samples if s["cached"]),
+        "latency_ms": percentiles([s["latency_ms"] for s in samples]),
+        "first_token_ms": percentiles([s["first_token_ms"] for s in samples if s["first_token_ms"] is not None]),
+        "server_stages_ms": stages
+    }
+
+
+def run(args: argparse.Namespace) -> Dict:
+    fake = FakeOpenAIServer(config_from_args(args), port=free_port())
+    fake.start()
+    workdir = Path(tempfile.mkdtemp(prefix="load-test-"))
+    process = None
+    try:
+        pdf_dir = workdir / "data"
+        pdf_dir.mkdir()
+        for pdf in sorted(Path(args.pdf_dir).glob("*.pdf")):
+            shutil.copy(pdf, pdf_dir / pdf.name)
+
+        port = free_port()
+        env = dict(os.environ)
+        env.update({
+            "OPENAI_API_KEY": "sk-fake",
+            "OPENAI_API_BASE": fake.url,
+            "EMBEDDING_BACKEND": "openai",
+            "PDF_DIRECTORY": str(pdf_dir),
+            "CHROMA_DIRECTORY": str(workdir / "chroma_db"),
+            "EMBEDDING_CACHE_PATH": str(workdir / "embedding_cache" / "embeddings.sqlite3"),
+            "RAG_WATCH_DATA_DIR": "false"
+        })
+        log = open(args.app_log, "w") if args.app_log else subprocess.DEVNULL
+        base_url = f"http://127.0.0.1:{port}"
+
+        # One worker ingests, so its job is polled where it runs and no worker
+        # serves the first questions from an index opened before ingestion
+        report = {"config": {k: v for k, v in vars(args).items() if k != "output"}}
+        process = start_app(port, 1, env, log)
+        report["ingestion"] = ingest(base_url)
+        print(f"Ingestion: {report['ingestion']}", flush=True)
+        process.terminate()
+        process.wait(timeout=10)
+        process = start_app(port, args.workers, env, log)
+
+        url = f"ws://127.0.0.1:{port}/api/chat/ws"
+        # Warm up imports, index and connections with a question no client asks
+        asyncio.run(drive(url, 1, 1, args.stream, distinct=True, tag="warm-up"))
+        report["chat"] = asyncio.run(drive(url, args.clients, args.requests, args.stream, not args.shared_questions))
+        report["fake_openai"] = fake.stats.to_dict()
+        return report
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        fake.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=20, help="concurrent WebSocket connections")
+    parser.add_argument("--requests", type=int, default=5, help="questions per connection, sent one after another")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--pdf-dir", default=str(DEFAULT_PDF_DIR), help="PDFs to ingest")
+    parser.add_argument("--no-stream", dest="stream", action="store_false", help="ask for single-frame answers")
+    parser.add_argument(
+        "--shared-questions", action="store_true",
+        help="reuse a small set of questions so the caches and request coalescing take effect"
+    )
+    parser.add_argument("--app-log", help="write the app's output to this file instead of discarding it")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    report = run(args)
+    chat = report["chat"]
+    print(f"\n{'':32} {'p50':>8} {'p95':>8} {'p99':>8} {'mean':>8}")
+    rows = [("latency ms", chat["latency_ms"]), ("first token ms", chat["first_token_ms"])]
+    rows += [(f"server {name}", values) for name, values in chat["server_stages_ms"].items()]
+    for name, values in rows:
+        print(f"{name:32} " + " ".join(f"{str(values[key]):>8}" for key in ("p50", "p95", "p99", "mean")))
+    print(
+        f"\n{chat['succeeded']}/{chat['requests']} succeeded in {chat['wall_s']}s, "
+        f"{chat['throughput_rps']} req/s, {chat['cached']} cached, errors: {chat['errors'] or 'none'}"
+    )
+    print(f"Ingestion: {report['ingestion']['chunks']} chunks at {report['ingestion']['chunks_per_second']} chunks/s")
+    print(f"Fake OpenAI: {report['fake_openai']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
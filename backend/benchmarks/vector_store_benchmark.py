@@ -0,0 +1,127 @@
+"""Latency and recall of the vector store backends at different corpus sizes.
+
+Builds each backend over the same synthetic, clustered unit vectors (a rough
+stand-in for OpenAI embeddings of a FAQ corpus), runs the same queries against
+them and compares the results with exact float64 search. The NumPy backend is
+measured at each requested precision, with the memory its matrix takes.
+
+Run from ``backend/``:
+
+    python -m benchmarks.vector_store_benchmark --sizes 1000,10000,30000 --dim 1536 --precisions float32,int8
+"""
+import argparse
+import json
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+from langchain.embeddings import FakeEmbeddings
+
+from app.services.memory.numpy_store import NumpyVectorStore
+from app.services.memory.vector_store import ChromaVectorStore, VectorStore
+
+CHROMA_ADD_BATCH = 5000
+
+
+def make_corpus(size: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    clusters = max(1, int(np.sqrt(size)))
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, size)] + 0.5 * rng.standard_normal((size, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_queries(corpus: np.ndarray, count: int, rng: np.random.Generator) -> np.ndarray:
+    """Perturbed corpus vectors, like paraphrases of indexed questions."""
+    picks = corpus[rng.integers(0, len(corpus), count)]
+    queries = picks + 0.3 * rng.standard_normal(picks.shape).astype(np.float32) / np.sqrt(corpus.shape[1])
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> List[set]:
+    corpus64 = corpus.astype(np.float64)
+    distances = (
+        np.einsum("ij,ij->i", corpus64, corpus64)[None, :]
+        - 2.0 * queries.astype(np.float64) @ corpus64.T
+    )
+    return [set(np.argsort(row)[:k].tolist()) for row in distances]
+
+
+def fill(store: VectorStore, corpus: np.ndarray, batch: int):
+    for start in range(0, len(corpus), batch):
+        rows = corpus[start:start + batch]
+        ids = [str(i) for i in range(start, start + len(rows))]
+        store.add(ids, [f"chunk {i}" for i in ids], [{} for _ in ids], rows.tolist())
+
+
+def measure(store: VectorStore, queries: np.ndarray, truth: List[set], k: int) -> Dict:
+    latencies, hits = [], 0
+    for query, expected in zip(queries.tolist(), truth):
+        started = time.perf_counter()
+        results = store.query(query, k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += len({int(r.id) for r in results} & expected)
+    latencies = np.asarray(latencies)
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "mean_ms": round(float(latencies.mean()), 3),
+        f"recall@{k}": round(hits / (len(queries) * k), 4)
+    }
+
+
+def run(sizes: List[int], dim: int, queries: int, k: int, seed: int, precisions: List[str]) -> List[Dict]:
+    rng = np.random.default_rng(seed)
+    rows = []
+    for size in sizes:
+        corpus = make_corpus(size, dim, rng)
+        query_vectors = make_queries(corpus, queries, rng)
+        truth = exact_top_k(corpus, query_vectors, k)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            backends = {"chroma": (ChromaVectorStore.open(tmp, FakeEmbeddings(size=dim)), CHROMA_ADD_BATCH)}
+            for precision in precisions:
+                name = "numpy" if precision == "float32" else f"numpy-{precision}"
+                backends[name] = (NumpyVectorStore(dim, precision=precision, spill_directory=tmp), size)
+            for name, (store, batch) in backends.items():
+                started = time.perf_counter()
+                fill(store, corpus, batch)
+                build_s = time.perf_counter() - started
+                row = {"backend": name, "size": size, "dim": dim, "build_s": round(build_s, 2)}
+                if isinstance(store, NumpyVectorStore):
+                    row["matrix_mb"] = round(store.nbytes / 1e6, 1)
+                row.update(measure(store, query_vectors, truth, k))
+                rows.append(row)
+                print(json.dumps(row), flush=True)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,5000,20000", help="comma-separated corpus sizes")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--precisions", default="float32,float16,int8", help="NumPy backend precisions to compare")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    rows = run(
+        [int(s) for s in args.sizes.split(",")], args.dim, args.queries, args.k, args.seed,
+        args.precisions.split(",")
+    )
+
+    print(f"\n{'backend':14} {'size':>8} {'build s':>8} {'MB':>7} {'p50 ms':>8} {'p95 ms':>8} {'recall':>7}")
+    for row in rows:
+        print(
+            f"{row['backend']:14} {row['size']:>8} {row['build_s']:>8} {row.get('matrix_mb', '-'):>7} "
+            f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row[f'recall@{args.k}']:>7}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
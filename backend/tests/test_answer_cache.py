@@ -0,0 +1,28 @@
+import pytest
+from app.services.chat.answer_cache import SemanticAnswerCache
+
+@pytest.fixture
+def cache():
+    cache = SemanticAnswerCache(max_distance=0.05, max_entries=3)
+    cache.store("What do you grow?", [1.0, 0.0, 0.0], ["a", "b"], "v1", "Vegetables.")
+    return cache
+
+def test_close_paraphrase_with_same_chunks_hits(cache):
+    hit = cache.lookup([0.99, 0.05, 0.0], ["b", "a"], "v1")
+    assert hit is not None and hit.answer == "Vegetables."
+    assert cache.stats()["hits"] == 1
+
+def test_distant_query_or_different_chunks_miss(cache):
+    assert cache.lookup([0.7, 0.7, 0.0], ["a", "b"], "v1") is None
+    assert cache.lookup([1.0, 0.0, 0.0], ["a", "c"], "v1") is None
+    assert cache.lookup([1.0, 0.0, 0.0], ["a", "b"], "v2") is None
+
+def test_new_index_version_evicts_old_answers(cache):
+    cache.store("What do you sell?", [0.0, 1.0, 0.0], ["c"], "v2", "Produce.")
+    assert cache.stats()["entries"] == 1
+    assert cache.lookup([1.0, 0.0, 0.0], ["a", "b"], "v1") is None
+
+def test_size_bound(cache):
+    for i in range(5):
+        cache.store(f"q{i}", [0.0, 0.0, 1.0], [str(i)], "v1", "answer")
+    assert cache.stats()["entries"] == 3
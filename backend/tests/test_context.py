@@ -0,0 +1,46 @@
+from app.rag.context import PASSAGE_SEPARATOR, merge_adjacent, pack_context
+from app.rag.parsing import make_text_splitter
+from app.services.memory.vector_store import SearchResult
+from app.utils.tokens import count_tokens
+
+TEXT = " ".join(f"Sentence {i} explains the refund policy for order type {i % 7}." for i in range(60))
+
+def chunk_results(source="faq.pdf", page=0):
+    chunks = make_text_splitter().split_text(TEXT)
+    return [
+        SearchResult(
+            id=f"{source}-{i}",
+            content=chunk,
+            score=0.0,
+            metadata={"source": source, "page": page, "chunk_index": i, "token_count": count_tokens(chunk)}
+        )
+        for i, chunk in enumerate(chunks)
+    ]
+
+def test_adjacent_chunks_merge_without_overlap():
+    results = chunk_results()
+    passages = merge_adjacent([results[2], results[0], results[1]])
+
+    assert len(passages) == 1
+    assert TEXT.startswith(passages[0].text)
+    assert len(passages[0].text) < sum(len(r.content) for r in results[:3])
+    assert [r.id for r in passages[0].chunks] == [r.id for r in results[:3]]
+
+def test_passages_keep_rank_order():
+    first, other = chunk_results(), chunk_results(source="manual.pdf")
+    passages = merge_adjacent([other[3], first[0], first[2], other[4]])
+
+    assert [(p.source, len(p.chunks)) for p in passages] == [("manual.pdf", 2), ("faq.pdf", 1), ("faq.pdf", 1)]
+
+def test_packing_respects_the_token_budget():
+    results = chunk_results()
+    everything = pack_context([results[0], results[3]], token_budget=10_000)
+    assert everything.text == results[0].content + PASSAGE_SEPARATOR + results[3].content
+
+    packed = pack_context([results[0], results[3]], token_budget=results[0].metadata["token_count"] + 40)
+    assert packed.tokens <= results[0].metadata["token_count"] + 40
+    assert packed.text.startswith(results[0].content + PASSAGE_SEPARATOR)
+    assert len(packed.passages) == 2 and packed.dropped == 0
+
+    tight = pack_context([results[0], results[3]], token_budget=results[0].metadata["token_count"] + 5)
+    assert tight.text == results[0].content and tight.dropped == 1
@@ -0,0 +1,87 @@
+import asyncio
+import pytest
+from app.services.memory.conversation import ConversationMemory
+
+class RecordingSummarizer:
+    def __init__(self):
+        self.calls = []
+        self.release = asyncio.Event()
+
+    async def __call__(self, summary, turns):
+        self.calls.append([turn.question for turn in turns])
+        await self.release.wait()
+        return (summary + " " + " ".join(turn.question for turn in turns)).strip()
+
+@pytest.mark.asyncio
+async def test_old_turns_fold_into_summary_off_the_critical_path():
+    summarizer = RecordingSummarizer()
+    memory = ConversationMemory(max_turns=2, token_budget=10_000, summarizer=summarizer)
+    for i in range(3):
+        memory.add_turn("alice", f"q{i}", f"a{i}")
+
+    # The summary is still pending: the folded turn is sent verbatim meanwhile
+    assert [m.content for m in memory.history("alice")] == ["q0", "a0", "q1", "a1", "q2", "a2"]
+
+    summarizer.release.set()
+    await memory.wait_for_summaries("alice")
+    history = memory.history("alice")
+    assert "q0" in history[0].content and history[0].type == "system"
+    assert [m.content for m in history[1:]] == ["q1", "a1", "q2", "a2"]
+    assert summarizer.calls == [["q0"]]
+
+@pytest.mark.asyncio
+async def test_prompt_stays_flat_and_sessions_are_isolated():
+    async def summarizer(summary, turns):
+        return "summary"
+
+    memory = ConversationMemory(max_turns=3, token_budget=10_000, summarizer=summarizer)
+    sizes = []
+    for i in range(20):
+        memory.add_turn("alice", f"question {i} " * 20, f"answer {i} " * 20)
+        await memory.wait_for_summaries("alice")
+        sizes.append(memory.history_tokens("alice"))
+
+    assert max(sizes[5:]) <= sizes[4] * 1.1
+    assert memory.history("bob") == []
+
+@pytest.mark.asyncio
+async def test_failed_summary_keeps_its_turns_and_retries_after_backoff():
+    calls = []
+
+    async def flaky(summary, turns):
+        calls.append([turn.question for turn in turns])
+        if len(calls) == 1:
+            raise RuntimeError("rate limited")
+        return " ".join(turn.question for turn in turns)
+
+    memory = ConversationMemory(max_turns=1, token_budget=10_000, summarizer=flaky, retry_delay=0.05)
+    memory.add_turn("alice", "q0", "a0")
+    memory.add_turn("alice", "q1", "a1")
+    await memory.wait_for_summaries("alice")
+    assert memory.stats()["summary_failures"] == 1
+
+    # Within the backoff the next turn does not retry; the failed turn is still sent
+    memory.add_turn("alice", "q2", "a2")
+    await memory.wait_for_summaries("alice")
+    assert len(calls) == 1
+    assert [m.content for m in memory.history("alice")] == ["q0", "a0", "q1", "a1", "q2", "a2"]
+
+    await asyncio.sleep(0.06)
+    memory.add_turn("alice", "q3", "a3")
+    await memory.wait_for_summaries("alice")
+    assert calls == [["q0"], ["q0", "q1", "q2"]]
+    history = memory.history("alice")
+    assert history[0].content.endswith("q0 q1 q2")
+    assert [m.content for m in history[1:]] == ["q3", "a3"]
+    assert memory.stats()["dropped_turns"] == 0
+
+def test_lru_and_idle_eviction():
+    memory = ConversationMemory(max_sessions=2, idle_ttl=3600)
+    for user in ("alice", "bob", "carol"):
+        memory.add_turn(user, "hi", "hello")
+    assert memory.stats()["sessions"] == 2 and memory.stats()["evictions"] == 1
+    assert memory.history("alice") == []
+
+    memory.idle_ttl = 0
+    memory.history("dave")
+    assert memory.stats()["sessions"] == 1
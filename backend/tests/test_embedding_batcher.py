@@ -0,0 +1,118 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from langchain.embeddings import FakeEmbeddings
+from app.services.knowledge_base.embedding_batcher import (
+    AsyncEmbeddingBatcher,
+    BatchedEmbeddings,
+    FakeEmbeddingBackend,
+    MicroBatchedQueryEmbeddings,
+    RetryableEmbeddingError,
+    TokenBucket
+)
+
+class TrackingBackend(FakeEmbeddingBackend):
+    def __init__(self, **kwargs):
+        super().__init__(size=8, **kwargs)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def embed(self, texts):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return await super().embed(texts)
+        finally:
+            self.in_flight -= 1
+
+@pytest.mark.asyncio
+async def test_batches_run_concurrently_and_keep_order():
+    backend = TrackingBackend(latency=0.01)
+    batcher = AsyncEmbeddingBatcher(backend, batch_size=2, max_concurrency=3)
+    texts = [f"text {i}" for i in range(11)]
+
+    vectors = await batcher.aembed(texts)
+
+    assert vectors == [backend.vector(text) for text in texts]
+    assert backend.requests == 6
+    assert backend.max_in_flight == 3
+
+@pytest.mark.asyncio
+async def test_retryable_errors_are_retried():
+    backend = FakeEmbeddingBackend(size=8, fail_every=2)
+    batcher = AsyncEmbeddingBatcher(backend, batch_size=1, max_concurrency=1, base_delay=0.001)
+
+    vectors = await batcher.aembed(["a", "b", "c"])
+
+    assert len(vectors) == 3
+    assert batcher.retries > 0
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_retries():
+    backend = FakeEmbeddingBackend(size=8, fail_every=1)
+    batcher = AsyncEmbeddingBatcher(backend, max_retries=2, base_delay=0.001)
+
+    with pytest.raises(RetryableEmbeddingError):
+        await batcher.aembed(["a"])
+    assert backend.requests == 3
+
+@pytest.mark.asyncio
+async def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(tokens_per_minute=6000, capacity=10)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    await bucket.acquire(10)
+    await bucket.acquire(5)
+
+    # 5 tokens at 100 tokens/s take about 50ms to refill
+    assert loop.time() - started >= 0.04
+
+def test_concurrency_cap_holds_across_sync_callers():
+    # Each sync call runs its own event loop; the cap must still be shared
+    backend = TrackingBackend(latency=0.01)
+    embeddings = BatchedEmbeddings(AsyncEmbeddingBatcher(backend, batch_size=1, max_concurrency=2))
+    texts = [f"text {i}" for i in range(8)]
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = list(executor.map(embeddings.embed_documents, [texts, texts]))
+
+    assert results == [[backend.vector(text) for text in texts]] * 2
+    assert backend.requests == 16
+    assert backend.max_in_flight == 2
+
+def test_sync_adapter_outside_event_loop():
+    embeddings = BatchedEmbeddings(AsyncEmbeddingBatcher(FakeEmbeddingBackend(size=8)))
+    assert embeddings.embed_query("hello") == embeddings.embed_documents(["hello"])[0]
+    assert embeddings.model == "fake-8"
+
+class RecordingEmbeddings(FakeEmbeddings):
+    batches: list = []
+    fail: bool = False
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        if self.fail:
+            raise RuntimeError("API Error")
+        return [[float(len(text))] * self.size for text in texts]
+
+def test_concurrent_queries_share_embedding_requests():
+    inner = RecordingEmbeddings(size=2, batches=[])
+    embeddings = MicroBatchedQueryEmbeddings(inner, max_batch=8, max_wait=0.1)
+    queries = [f"q{i}" * (i + 1) for i in range(8)] + ["q0"]
+
+    with ThreadPoolExecutor(max_workers=9) as pool:
+        vectors = list(pool.map(embeddings.embed_query, queries))
+
+    assert vectors == [[float(len(q))] * 2 for q in queries]
+    assert len(inner.batches) < len(queries)
+    assert all(len(batch) <= 8 for batch in inner.batches)
+    assert embeddings.stats()["queries"] == 9
+
+def test_failed_batch_fails_every_query():
+    embeddings = MicroBatchedQueryEmbeddings(RecordingEmbeddings(size=2, batches=[], fail=True), max_wait=0.05)
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [pool.submit(embeddings.embed_query, text) for text in ("a", "b", "c")]
+        for future in futures:
+            with pytest.raises(RuntimeError, match="API Error"):
+                future.result()
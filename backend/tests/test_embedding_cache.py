@@ -0,0 +1,93 @@
+from unittest.mock import patch
+import pytest
+from langchain.embeddings import FakeEmbeddings
+from app.services.knowledge_base.embedding_batcher import AsyncEmbeddingBatcher, BatchedEmbeddings, FakeEmbeddingBackend
+from app.services.knowledge_base.embeddings import (
+    CacheBackedEmbeddings,
+    CachedQueryEmbeddings,
+    PersistentEmbeddingCache,
+    QueryEmbeddingCache,
+    normalize_query
+)
+
+class CountingEmbeddings(FakeEmbeddings):
+    calls: int = 0
+    embedded: int = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return [float(len(text))] * self.size
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.embedded += len(texts)
+        return [[float(len(text))] * self.size for text in texts]
+
+def test_normalize_query():
+    assert normalize_query("  How do I   RESET\tmy password? ") == "how do i reset my password"
+    # Chat questions coalesce on the same key
+    assert normalize_query("  What do you  GROW? ") == normalize_query("what do you grow")
+
+def test_repeated_query_hits_cache():
+    backend = CountingEmbeddings(size=4)
+    embeddings = CachedQueryEmbeddings(backend)
+
+    first = embeddings.embed_query("Where is my order?")
+    second = embeddings.embed_query("where is my   order?")
+
+    assert first == second
+    assert backend.calls == 1
+    assert embeddings.cache.stats()["hits"] == 1
+    assert embeddings.cache.stats()["misses"] == 1
+
+def test_cached_and_uncached_vectors_match():
+    backend = FakeEmbeddingBackend(size=8)
+    uncached = BatchedEmbeddings(AsyncEmbeddingBatcher(backend))
+    embeddings = CachedQueryEmbeddings(uncached)
+
+    # The second call is a hit, served from the float32 copy in the cache
+    for _ in range(2):
+        assert embeddings.embed_query("Error E-42 on SKU AB12") == pytest.approx(uncached.embed_query("Error E-42 on SKU AB12"), rel=1e-6)
+    assert embeddings.cache.stats()["hits"] == 1
+
+def test_lru_evicts_oldest_entry():
+    cache = QueryEmbeddingCache(max_entries=2)
+    cache.put("a", [1.0])
+    cache.put("b", [2.0])
+    cache.get("a")
+    cache.put("c", [3.0])
+
+    assert cache.get("b") is None
+    assert cache.get("a") == [1.0]
+    assert cache.stats()["evictions"] == 1
+
+def test_size_bound_evicts_entries():
+    cache = QueryEmbeddingCache(max_entries=100, max_bytes=40)
+    cache.put("a", [1.0] * 4)
+    cache.put("b", [1.0] * 4)
+    cache.put("c", [1.0] * 4)
+
+    assert cache.stats()["bytes"] <= 40
+    assert cache.get("a") is None
+
+def test_expired_entries_are_misses():
+    cache = QueryEmbeddingCache(ttl=10)
+    with patch("app.services.knowledge_base.embeddings.time.monotonic", return_value=100.0):
+        cache.put("a", [1.0])
+    with patch("app.services.knowledge_base.embeddings.time.monotonic", return_value=111.0):
+        assert cache.get("a") is None
+
+def test_persistent_cache_skips_known_chunks(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    backend = CountingEmbeddings(size=4)
+    embeddings = CacheBackedEmbeddings(backend, PersistentEmbeddingCache(path))
+    first = embeddings.embed_documents(["alpha", "beta", "alpha"])
+
+    # A fresh process re-opening the same file only embeds the new chunk
+    reopened = CacheBackedEmbeddings(backend, PersistentEmbeddingCache(path))
+    second = reopened.embed_documents(["beta", "gamma", "alpha"])
+
+    assert first == [[5.0] * 4, [4.0] * 4, [5.0] * 4]
+    assert second == [[4.0] * 4, [5.0] * 4, [5.0] * 4]
+    assert backend.embedded == 3
+    assert reopened.hits == 2 and reopened.misses == 1
@@ -0,0 +1,233 @@
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+from unittest.mock import patch
+import pytest
+from langchain.embeddings import FakeEmbeddings
+from langchain.schema import Document
+from langchain.vectorstores import Chroma
+from app.rag.initialize_rag import RAGInitializer
+from app.rag.lexical_index import LexicalIndex
+from app.rag.manifest import IngestionManifest
+from app.rag.parsing import parse_pdfs
+from app.rag.pipeline import IngestionPipeline, IngestionProgress
+from app.services.memory.mmap_store import MmapVectorStore
+from app.services.memory.vector_store import ReadOnlyVectorStoreError
+from app.services.knowledge_base.service import IngestionJobManager, IngestionRejected
+from app.utils.file_lock import FileLock
+
+SAMPLE_PDF = Path(__file__).parent.parent.parent / "data" / "promode-agro-faq.pdf"
+
+@pytest.fixture
+def dirs(tmp_path):
+    pdf_dir = tmp_path / "data"
+    db_dir = tmp_path / "chroma_db"
+    pdf_dir.mkdir()
+    shutil.copy(SAMPLE_PDF, pdf_dir / "faq.pdf")
+    return pdf_dir, db_dir
+
+@pytest.fixture
+def initializer(dirs):
+    pdf_dir, db_dir = dirs
+    with patch("app.rag.initialize_rag.get_ingestion_embeddings", return_value=FakeEmbeddings(size=8)):
+        yield RAGInitializer(pdf_dir=str(pdf_dir), db_dir=str(db_dir))
+
+def stored_ids(db_dir):
+    store = Chroma(persist_directory=str(db_dir), embedding_function=FakeEmbeddings(size=8))
+    return set(store.get()["ids"])
+
+def test_manifest_diff(tmp_path):
+    first, second = tmp_path / "a.pdf", tmp_path / "b.pdf"
+    first.write_bytes(b"one")
+    second.write_bytes(b"two")
+    manifest = IngestionManifest(tmp_path)
+    manifest.record(first, "stale-hash", ["id-1"])
+    manifest.record(tmp_path / "b.pdf", "x", [])
+    manifest.files[str(tmp_path / "gone.pdf")] = {"size": 1, "mtime": 0, "sha256": "y", "chunk_ids": []}
+    manifest.files[str(first)]["size"] = 0
+
+    diff = manifest.diff([first, second])
+
+    assert diff.changed == [first]
+    assert diff.unchanged == [second]
+    assert diff.removed == [str(tmp_path / "gone.pdf")]
+
+def test_sync_is_incremental(initializer, dirs):
+    pdf_dir, db_dir = dirs
+    progress = IngestionProgress()
+    first = initializer.sync_vector_store(progress)
+    ids = stored_ids(db_dir)
+
+    assert progress.files_parsed == progress.files_total == 1
+    assert set(LexicalIndex.load(db_dir).docs) == ids
+    assert progress.chunks_written == progress.estimated_total_chunks() == len(ids)
+
+    assert first["added"] == ["faq.pdf"]
+    assert first["chunks_added"] == len(ids) > 0
+
+    # A second run with nothing changed neither adds nor duplicates chunks
+    second = initializer.sync_vector_store()
+    assert second["chunks_added"] == 0
+    assert stored_ids(db_dir) == ids
+
+    shutil.copy(SAMPLE_PDF, pdf_dir / "copy.pdf")
+    os.remove(pdf_dir / "faq.pdf")
+    third = initializer.sync_vector_store()
+
+    assert third["added"] == ["copy.pdf"]
+    assert third["removed"] == ["faq.pdf"]
+    assert third["chunks_deleted"] == len(ids)
+    assert len(stored_ids(db_dir)) == third["chunks_added"]
+    assert stored_ids(db_dir).isdisjoint(ids)
+    assert set(LexicalIndex.load(db_dir).docs) == stored_ids(db_dir)
+
+def test_sync_publishes_mmap_index(initializer, dirs):
+    pdf_dir, db_dir = dirs
+    with patch("app.core.config.settings.MMAP_INDEX_ENABLED", True):
+        initializer.sync_vector_store()
+        first = MmapVectorStore.open(db_dir)
+        assert set(first.ids) == stored_ids(db_dir)
+
+        # Unchanged data keeps the published generation
+        initializer.sync_vector_store()
+        assert MmapVectorStore.open(db_dir).generation == first.generation
+
+        os.remove(pdf_dir / "faq.pdf")
+        initializer.sync_vector_store()
+        assert MmapVectorStore.open(db_dir).count() == 0
+
+def test_sync_never_writes_to_mmap_backend(initializer, dirs):
+    pdf_dir, db_dir = dirs
+    writes = []
+    with patch("app.core.config.settings.MMAP_INDEX_ENABLED", True):
+        initializer.sync_vector_store()
+        store = MmapVectorStore.open(db_dir)
+        with pytest.raises(ReadOnlyVectorStoreError):
+            store.add(["id"], ["text"], [{}], [[0.0] * store.dim])
+
+        with patch.object(MmapVectorStore, "add", lambda self, *args: writes.append("add")), \
+                patch.object(MmapVectorStore, "delete", lambda self, *args: writes.append("delete")):
+            os.remove(pdf_dir / "faq.pdf")
+            initializer.sync_vector_store()
+
+    # Ingestion writes Chroma and publishes a new generation instead
+    assert writes == []
+    assert MmapVectorStore.open(db_dir).generation != store.generation
+
+def test_parallel_parsing_keeps_order_and_isolates_failures(tmp_path):
+    good = tmp_path / "a.pdf"
+    broken = tmp_path / "b.pdf"
+    shutil.copy(SAMPLE_PDF, good)
+    broken.write_bytes(b"not a pdf")
+
+    sequential = list(parse_pdfs([good, broken, good], workers=1))
+    parallel = list(parse_pdfs([good, broken, good], workers=2))
+
+    assert [path for path, _, _ in parallel] == [good, broken, good]
+    assert parallel[1][1] is None and parallel[1][2]
+    assert [c.page_content for c in parallel[0][1]] == [c.page_content for c in sequential[0][1]]
+    assert [c.metadata["chunk_index"] for c in parallel[2][1]] == list(range(len(parallel[2][1])))
+
+def test_pipeline_batches_embeddings_and_upserts():
+    writes = []
+    pipeline = IngestionPipeline(
+        FakeEmbeddings(size=4),
+        upsert=lambda ids, texts, metadatas, vectors: writes.append((ids, vectors)),
+        embed_batch_size=3,
+        upsert_batch_size=6,
+        max_pending_batches=1
+    )
+    chunks = ((f"id-{i}", Document(page_content=f"chunk {i}")) for i in range(14))
+
+    stats = pipeline.run(chunks)
+
+    assert stats["chunks"] == 14
+    assert [len(ids) for ids, _ in writes] == [6, 6, 2]
+    assert [i for ids, _ in writes for i in ids] == [f"id-{i}" for i in range(14)]
+    assert all(len(vector) == 4 for _, vectors in writes for vector in vectors)
+
+def test_pipeline_propagates_embedding_errors():
+    class FailingEmbeddings(FakeEmbeddings):
+        def embed_documents(self, texts):
+            raise RuntimeError("rate limited")
+
+    pipeline = IngestionPipeline(FailingEmbeddings(size=4), upsert=lambda *args: None, embed_batch_size=2)
+    chunks = ((str(i), Document(page_content="x")) for i in range(10))
+
+    with pytest.raises(RuntimeError, match="rate limited"):
+        pipeline.run(chunks)
+
+def test_job_manager_runs_in_background_and_coalesces():
+    release = threading.Event()
+
+    def slow_sync(progress):
+        release.wait(5)
+        return {"total_chunks": 3}
+
+    manager = IngestionJobManager({"sync": slow_sync, "rebuild": lambda progress: {}})
+    job, coalesced = manager.submit("sync")
+    again, coalesced_again = manager.submit("sync")
+
+    assert not coalesced and coalesced_again and again is job
+    with pytest.raises(IngestionRejected):
+        manager.submit("rebuild")
+
+    release.set()
+    assert manager.wait(job.id, timeout=5).status == "succeeded"
+    assert job.result == {"total_chunks": 3}
+    assert manager.active is None
+    assert manager.submit("rebuild")[0] is not job
+
+def test_job_manager_records_failures():
+    def broken(progress):
+        raise RuntimeError("no PDFs")
+
+    manager = IngestionJobManager({"sync": broken})
+    job, _ = manager.submit("sync")
+
+    assert manager.wait(job.id, timeout=5).status == "failed"
+    assert job.to_dict()["error"] == "no PDFs"
+
+def test_job_state_and_lock_are_shared_across_processes(tmp_path):
+    # Two managers with their own lock handles stand in for two workers
+    release = threading.Event()
+
+    def slow_sync(progress):
+        release.wait(5)
+        return {"total_chunks": 3}
+
+    def manager():
+        return IngestionJobManager(
+            {"sync": slow_sync, "rebuild": lambda progress: {}},
+            lock=FileLock(tmp_path / "chroma_db.lock"),
+            state_dir=tmp_path / "jobs",
+            publish_interval=0.01
+        )
+
+    first, second = manager(), manager()
+    job, _ = first.submit("sync")
+    joined, coalesced = second.submit("sync")
+
+    assert coalesced and joined.id == job.id
+    assert second.get(job.id).status == "running"
+    with pytest.raises(IngestionRejected) as rejected:
+        second.submit("rebuild")
+    assert rejected.value.active.id == job.id
+
+    release.set()
+    finished = second.wait(job.id, timeout=5)
+    assert finished.status == "succeeded" and finished.to_dict()["result"] == {"total_chunks": 3}
+    assert [j.id for j in second.recent()] == [job.id]
+    assert second.submit("rebuild")[0].id != job.id
+
+def test_job_of_a_dead_process_is_reported_failed(tmp_path):
+    jobs = tmp_path / "jobs"
+    jobs.mkdir()
+    (jobs / "abc123.json").write_text(json.dumps({"id": "abc123", "kind": "sync", "status": "running", "created_at": 0}))
+    manager = IngestionJobManager({"sync": lambda progress: {}}, lock=FileLock(tmp_path / "db.lock"), state_dir=jobs)
+
+    job = manager.get("abc123")
+    assert job.status == "failed" and not job.active
+    assert manager.get("../abc123") is None
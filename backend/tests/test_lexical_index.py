@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from app.rag.lexical_index import LexicalIndex, MappedLexicalIndex, looks_like_identifier, reciprocal_rank_fusion, tokenize, write_lexical_postings
+
+def test_tokenize_keeps_identifiers_whole():
+    assert tokenize("Error ERR_TIMEOUT on SKU-1042.") == ["error", "err_timeout", "err", "timeout", "sku-1042", "sku", "1042"]
+
+def test_identifier_detection():
+    assert looks_like_identifier(" PMA-2041 ")
+    assert looks_like_identifier("E1234")
+    assert not looks_like_identifier("refunds")
+    assert not looks_like_identifier("how long is delivery")
+
+def test_bm25_ranks_exact_code_first(tmp_path):
+    index = LexicalIndex(tmp_path)
+    index.add(
+        ["a", "b", "c"],
+        ["Seeds ship in packs.", "Pack PMA-2041 contains tomato seeds.", "Tomato seeds grow fast."]
+    )
+    assert [doc_id for doc_id, _ in index.search("PMA-2041", 3)] == ["b"]
+    assert index.search("tomato seeds", 3)[-1][0] == "a"
+
+def test_add_remove_and_persist(tmp_path):
+    index = LexicalIndex(tmp_path)
+    index.add(["a", "b"], ["alpha beta", "beta gamma"])
+    index.remove(["a"])
+    index.save()
+
+    loaded = LexicalIndex.load(tmp_path)
+    assert len(loaded) == 1
+    assert loaded.search("alpha", 5) == []
+    assert loaded.is_exact_identifier("gamma") is False
+    assert [doc_id for doc_id, _ in loaded.search("beta", 5)] == ["b"]
+
+def test_mapped_postings_match_in_memory_index(tmp_path):
+    ids = ["a", "b", "c", "d"]
+    texts = ["Seeds ship in packs.", "Pack PMA-2041 contains tomato seeds.", "Tomato seeds grow fast.", "Refunds take a week."]
+    index = LexicalIndex(tmp_path)
+    index.add(ids, texts)
+    write_lexical_postings(tmp_path, texts)
+    mapped = MappedLexicalIndex.open(tmp_path, ids)
+
+    assert isinstance(mapped.rows, np.memmap) and len(mapped) == 4
+    for query in ["tomato seeds", "PMA-2041", "pack", "refunds week", "unknown"]:
+        expected = index.search(query, 3)
+        assert [doc_id for doc_id, _ in mapped.search(query, 3)] == [doc_id for doc_id, _ in expected]
+        assert [score for _, score in mapped.search(query, 3)] == pytest.approx([score for _, score in expected])
+    assert mapped.is_exact_identifier("PMA-2041") and not mapped.is_exact_identifier("PMA-9999")
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], k=60)
+    assert [doc_id for doc_id, _ in fused] == ["a", "c", "b"]
@@ -0,0 +1,57 @@
+import asyncio
+import json
+import httpx
+import pytest
+from app.services.knowledge_base.embedding_batcher import ProviderEmbeddingBackend, RetryableEmbeddingError
+from app.services.llm.provider import OpenAIProvider, ProviderError
+
+def handler(request: httpx.Request) -> httpx.Response:
+    assert request.headers["authorization"] == "Bearer sk-test"
+    body = json.loads(request.content)
+    if request.url.path == "/v1/embeddings":
+        if body["input"] == ["limited"]:
+            return httpx.Response(429, headers={"retry-after": "2"}, json={"error": {"message": "Slow down"}})
+        if body["input"] == ["bad"]:
+            return httpx.Response(400, json={"error": {"message": "Bad input"}})
+        data = [{"index": i, "embedding": [float(len(text))]} for i, text in enumerate(body["input"])]
+        return httpx.Response(200, json={"data": list(reversed(data))})
+    if body.get("stream"):
+        chunks = [{"choices": [{"delta": {"content": word}}]} for word in ("We ", "grow")]
+        chunks.append({"choices": [], "usage": {"total_tokens": 5}})
+        lines = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks)
+        return httpx.Response(200, content=f"{lines}data: [DONE]\n\n".encode())
+    return httpx.Response(200, json={"choices": [{"message": {"content": "Hi"}}], "usage": {"total_tokens": 3}})
+
+@pytest.fixture
+def provider():
+    provider = OpenAIProvider("sk-test", base_url="http://llm.test/v1", transport=httpx.MockTransport(handler))
+    yield provider
+    provider.close()
+
+def test_calls_from_different_loops_share_one_client(provider):
+    async def call():
+        vectors = await provider.embed(["a", "bbb"], model="m")
+        result = await provider.chat([{"role": "user", "content": "Hello"}], model="m")
+        return vectors, result.content
+
+    assert asyncio.run(call()) == ([[1.0], [3.0]], "Hi")
+    client = provider._client
+    assert asyncio.run(call()) == ([[1.0], [3.0]], "Hi")
+    assert provider._client is client and provider.requests == 4
+
+def test_stream_chat_yields_chunks_until_done(provider):
+    async def stream():
+        return [chunk async for chunk in provider.stream_chat([{"role": "user", "content": "Hi"}], model="m")]
+
+    chunks = asyncio.run(stream())
+    assert [c["choices"][0]["delta"]["content"] for c in chunks[:2]] == ["We ", "grow"]
+    assert chunks[-1]["usage"] == {"total_tokens": 5}
+
+def test_errors_are_classified_for_retries(provider):
+    backend = ProviderEmbeddingBackend(provider, model="m")
+    with pytest.raises(RetryableEmbeddingError) as limited:
+        asyncio.run(backend.embed(["limited"]))
+    assert limited.value.retry_after == 2.0
+    with pytest.raises(ProviderError) as bad:
+        asyncio.run(backend.embed(["bad"]))
+    assert bad.value.status == 400 and not bad.value.retryable and str(bad.value) == "Bad input"
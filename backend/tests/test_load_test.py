@@ -0,0 +1,22 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+from benchmarks.load_test import DEFAULT_PDF_DIR
+
+BACKEND_DIR = str(Path(__file__).parent.parent)
+
+@pytest.mark.skipif(not list(DEFAULT_PDF_DIR.glob("*.pdf")), reason="no sample PDFs")
+def test_harness_runs_with_several_workers(tmp_path):
+    output = tmp_path / "load.json"
+    command = [
+        sys.executable, "-m", "benchmarks.load_test",
+        "--clients", "4", "--requests", "2", "--workers", "2", "--output", str(output)
+    ]
+    result = subprocess.run(command, capture_output=True, text=True, cwd=BACKEND_DIR, timeout=300)
+    assert result.returncode == 0, result.stdout + result.stderr
+
+    report = json.loads(output.read_text())
+    assert report["ingestion"]["chunks"] > 0
+    assert report["chat"]["succeeded"] == report["chat"]["requests"] == 8
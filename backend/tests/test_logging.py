@@ -0,0 +1,54 @@
+import json
+import logging
+import queue
+from unittest.mock import patch
+from app.core.config.logging import (
+    JsonFormatter,
+    NonBlockingQueueHandler,
+    PayloadSampler,
+    RequestIdFilter,
+    bind_request_id,
+    log_payload,
+    reset_request_id
+)
+
+def test_queue_handler_tags_truncates_and_drops():
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1), max_message_chars=10)
+    handler.addFilter(RequestIdFilter())
+    logger = logging.getLogger("tests.queue")
+    logger.addHandler(handler)
+    logger.propagate = False
+    token = bind_request_id("req-1")
+    try:
+        logger.warning("%s", "x" * 50)
+        logger.warning("dropped")
+    finally:
+        reset_request_id(token)
+        logger.removeHandler(handler)
+
+    record = handler.queue.get_nowait()
+    assert record.request_id == "req-1"
+    assert record.getMessage() == "x" * 10 + "... [40 chars truncated]"
+    assert handler.dropped == 1
+
+def test_sampler_uses_nearest_configured_logger():
+    sampler = PayloadSampler(0.5, {"app": 1.0, "app.rag": 0.0})
+    assert sampler.rate("app.main") == 1.0
+    assert sampler.rate("app.rag.pipeline") == 0.0
+    assert sampler.rate("uvicorn") == 0.5
+
+def test_unsampled_payload_is_never_formatted():
+    class Unformattable:
+        def __repr__(self):
+            raise AssertionError("payload was formatted")
+
+    logger = logging.getLogger("tests.payload")
+    with patch("app.core.config.logging._sampler", PayloadSampler(0.0)):
+        log_payload(logger, "Context", Unformattable())
+
+def test_json_formatter_includes_request_id_and_extra():
+    record = logging.LogRecord("app.main", logging.INFO, __file__, 1, "Answered", None, None)
+    record.request_id = "req-2"
+    record.sampled = True
+    data = json.loads(JsonFormatter().format(record))
+    assert data["message"] == "Answered" and data["request_id"] == "req-2" and data["sampled"] is True
@@ -0,0 +1,34 @@
+import pytest
+from app.utils.metrics import MetricsRegistry
+
+def test_render_prometheus_text():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ["outcome"])
+    latency = registry.histogram("latency_seconds", "Latency", ["stage"], buckets=(0.1, 1.0))
+    sockets = registry.gauge("sockets", "Open sockets")
+
+    requests.inc(outcome="ok")
+    requests.inc(2, outcome="ok")
+    for value in (0.05, 0.5, 3.0):
+        latency.observe(value, stage="llm")
+    sockets.inc()
+    sockets.inc()
+    sockets.dec()
+
+    lines = registry.render().splitlines()
+    assert "# TYPE requests_total counter" in lines
+    assert 'requests_total{outcome="ok"} 3' in lines
+    assert 'latency_seconds_bucket{stage="llm",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="llm",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{stage="llm",le="+Inf"} 3' in lines
+    assert 'latency_seconds_sum{stage="llm"} 3.55' in lines
+    assert 'latency_seconds_count{stage="llm"} 3' in lines
+    assert "sockets 1" in lines
+
+def test_labels_must_match():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ["outcome"])
+    with pytest.raises(ValueError):
+        requests.inc(stage="llm")
+    with pytest.raises(ValueError):
+        registry.counter("requests_total", "Again")
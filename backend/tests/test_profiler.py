@@ -0,0 +1,43 @@
+import asyncio
+import io
+import json
+import time
+import zipfile
+from unittest.mock import patch
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.utils.profiler import LoopProfiler
+
+def block_loop():
+    time.sleep(0.2)
+
+def test_profile_requires_admin_token():
+    client = TestClient(app)
+    with patch("app.core.config.settings.ADMIN_API_TOKEN", ""):
+        assert client.post("/api/admin/profile?seconds=0.1").status_code == 404
+    with patch("app.core.config.settings.ADMIN_API_TOKEN", "secret"):
+        response = client.post("/api/admin/profile?seconds=0.1", headers={"Authorization": "Bearer wrong"})
+        assert response.status_code == 401
+
+def test_profile_downloads_zip():
+    with patch("app.core.config.settings.ADMIN_API_TOKEN", "secret"):
+        response = TestClient(app).post("/api/admin/profile?seconds=0.2", headers={"Authorization": "Bearer secret"})
+
+    assert response.status_code == 200
+    assert response.headers["content-disposition"].startswith("attachment")
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert json.loads(archive.read("profile.json"))["samples"] > 0
+    assert archive.read("cpu.folded") and "memory.txt" in archive.namelist()
+
+@pytest.mark.asyncio
+async def test_blocking_step_is_caught_with_its_stack():
+    async def stall():
+        await asyncio.sleep(0.1)
+        block_loop()
+
+    profiler = LoopProfiler(0.5, memory=False, blocking_threshold=0.05)
+    result, _ = await asyncio.gather(profiler.run(), stall())
+
+    assert len(result.blocking) == 1 and result.blocking[0].blocked_ms >= 100
+    assert any("block_loop" in frame for frame in result.blocking[0].stack)
@@ -1,6 +1,7 @@
 import pytest
 import os
 import json
+import time
 from pathlib import Path
 from fastapi.testclient import TestClient
 from fastapi.websockets import WebSocketDisconnect
@@ -154,10 +155,18 @@ def test_initialize_rag_endpoint(test_client):
     """Test the RAG initialization endpoint with actual PDFs"""
     response = test_client.post("/api/initialize-rag")
     assert response.status_code == 200
+    assert response.json()["status"] == "accepted"
+    job_id = response.json()["job_id"]
     
-    data = response.json()
-    print(f"\nInitialization response: {json.dumps(data, indent=2)}")
+    # The sync runs in the background; poll until it finishes
+    deadline = time.monotonic() + 300
+    while True:
+        job = test_client.get(f"/api/ingestion/jobs/{job_id}").json()["job"]
+        if job["status"] not in ("queued", "running") or time.monotonic() > deadline:
+            break
+        time.sleep(0.5)
+    print(f"\nInitialization job: {json.dumps(job, indent=2)}")
     
-    assert data["status"] == "success"
-    assert data["final_state"]["total_documents"] > 0
-    assert len(data["final_state"]["pdf_files"]) > 0 
\ No newline at end of file
+    assert job["status"] == "succeeded"
+    assert job["result"]["final_state"]["total_documents"] > 0
+    assert len(job["result"]["final_state"]["pdf_files"]) > 0 
\ No newline at end of file
@@ -0,0 +1,70 @@
+import asyncio
+import pytest
+from app.services.chat.single_flight import SingleFlight
+
+async def collect(flights, flight):
+    try:
+        return [event async for event in flight.events_from_start()]
+    finally:
+        flights.leave(flight)
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_run():
+    flights = SingleFlight()
+    release = asyncio.Event()
+    runs = []
+
+    async def producer(publish):
+        runs.append(1)
+        publish("start")
+        await release.wait()
+        publish("done")
+
+    first, joined_first = flights.join("q", producer)
+    waiters = [asyncio.ensure_future(collect(flights, first))]
+    await asyncio.sleep(0)
+    second, joined_second = flights.join("q", producer)
+    waiters.append(asyncio.ensure_future(collect(flights, second)))
+    release.set()
+
+    assert await asyncio.gather(*waiters) == [["start", "done"], ["start", "done"]]
+    assert second is first and not joined_first and joined_second
+    assert len(runs) == 1
+    assert flights.stats() == {"started": 1, "joined": 1, "failed": 0}
+
+@pytest.mark.asyncio
+async def test_failures_reach_every_waiter_and_are_not_cached():
+    flights = SingleFlight()
+    calls = []
+
+    async def producer(publish):
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("API Error")
+
+    waiters = [asyncio.ensure_future(collect(flights, flights.join("q", producer)[0])) for _ in range(3)]
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+
+    assert [str(r) for r in results] == ["API Error"] * 3 and len(calls) == 1
+    flight, joined = flights.join("q", producer)
+    assert not joined
+    with pytest.raises(RuntimeError):
+        await collect(flights, flight)
+    assert len(calls) == 2
+
+@pytest.mark.asyncio
+async def test_producer_is_cancelled_when_everyone_leaves():
+    flights = SingleFlight()
+    cancelled = asyncio.Event()
+
+    async def producer(publish):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    flight, _ = flights.join("q", producer)
+    await asyncio.sleep(0)
+    flights.leave(flight)
+    await asyncio.wait_for(cancelled.wait(), 1)
@@ -0,0 +1,207 @@
+import asyncio
+import threading
+import numpy as np
+import pytest
+from langchain.embeddings import FakeEmbeddings
+from langchain.vectorstores import Chroma
+from app.rag.lexical_index import LexicalIndex, MappedLexicalIndex
+from app.services.knowledge_base.embedding_batcher import MicroBatchedQueryEmbeddings
+from app.services.memory.mmap_store import MmapVectorStore, write_mmap_index
+from app.services.memory.numpy_store import NumpyVectorStore
+from app.services.memory.vector_store import AsyncRetriever, RetrievalEngine
+
+TEXTS = [
+    "Orders are delivered within two days.",
+    "Refunds are processed within a week.",
+    "Support is available around the clock."
+]
+
+@pytest.fixture
+def db_dir(tmp_path):
+    store = Chroma.from_texts(
+        texts=TEXTS,
+        embedding=FakeEmbeddings(size=8),
+        persist_directory=str(tmp_path)
+    )
+    store.persist()
+    return tmp_path
+
+def test_engine_opens_store_once(db_dir):
+    engine = RetrievalEngine(str(db_dir), embeddings=FakeEmbeddings(size=8), check_interval=0)
+    first = engine.vector_store
+    results = engine.search("refunds", k=2)
+
+    assert len(results) == 2
+    assert all(result.content in TEXTS for result in results)
+    assert engine.vector_store is first
+
+def test_engine_reloads_when_index_changes(db_dir):
+    engine = RetrievalEngine(str(db_dir), embeddings=FakeEmbeddings(size=8), check_interval=0)
+    version = engine.index_version
+    assert engine.count() == 3
+
+    writer = Chroma(persist_directory=str(db_dir), embedding_function=FakeEmbeddings(size=8))
+    writer.add_texts(["Invoices are emailed monthly."])
+    writer.persist()
+
+    assert engine.count() == 4
+    assert engine.index_version != version
+
+def test_engine_with_empty_store(tmp_path):
+    engine = RetrievalEngine(str(tmp_path), embeddings=FakeEmbeddings(size=8))
+    assert engine.search("anything") == []
+
+@pytest.mark.asyncio
+async def test_async_retriever_runs_searches_off_the_loop(db_dir):
+    engine = RetrievalEngine(str(db_dir), embeddings=FakeEmbeddings(size=8))
+    release = threading.Event()
+    search_by_vector = engine.search_by_vector
+
+    def slow_search(query_embedding, k):
+        release.wait(5)
+        return search_by_vector(query_embedding, k)
+
+    engine.search_by_vector = slow_search
+    # Opened up front: the first query would otherwise open it before queueing
+    engine.count()
+    retriever = AsyncRetriever(engine, max_workers=1, max_in_flight=1)
+    try:
+        first = asyncio.ensure_future(retriever.retrieve("refunds", 2))
+        second = asyncio.ensure_future(retriever.retrieve("orders", 2))
+        # The event loop stays free while both searches are pending
+        await asyncio.sleep(0.05)
+        assert (retriever.in_flight, retriever.waiting) == (1, 1)
+
+        release.set()
+        first, second = await asyncio.gather(first, second)
+        assert len(first.results) == 2
+        assert len(first.query_embedding) == 8
+        assert second.timing.queue_ms >= 40
+        assert retriever.stats()["searches"] == 2
+    finally:
+        retriever.shutdown()
+
+@pytest.mark.asyncio
+async def test_concurrent_queries_batch_beyond_the_pool_size(db_dir):
+    embeddings = MicroBatchedQueryEmbeddings(FakeEmbeddings(size=8), max_batch=16, max_wait=0.05)
+    retriever = AsyncRetriever(RetrievalEngine(str(db_dir), embeddings=embeddings), max_workers=2, max_in_flight=2, hybrid=True)
+    try:
+        retrievals = await asyncio.gather(*(retriever.retrieve(f"question {i}", 2) for i in range(12)))
+        assert all(len(retrieval.results) == 2 for retrieval in retrievals)
+        # Queries wait for their embedding on the loop, not on the two pool threads
+        assert embeddings.max_batch_seen > retriever.max_workers
+        assert embeddings.requests < 12
+    finally:
+        retriever.shutdown()
+
+@pytest.fixture
+def hybrid_dir(tmp_path):
+    texts = TEXTS + ["Order code PMA-2041 is a tomato seed pack."]
+    ids = [f"chunk-{i}" for i in range(len(texts))]
+    store = Chroma.from_texts(texts=texts, ids=ids, embedding=FakeEmbeddings(size=8), persist_directory=str(tmp_path))
+    store.persist()
+    lexical = LexicalIndex(tmp_path)
+    lexical.add(ids, texts)
+    lexical.save()
+    return tmp_path
+
+class CountingEmbeddings(FakeEmbeddings):
+    calls: int = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return super().embed_query(text)
+
+@pytest.mark.asyncio
+async def test_hybrid_retrieval_fuses_keyword_hits(hybrid_dir):
+    embeddings = CountingEmbeddings(size=8)
+    retriever = AsyncRetriever(RetrievalEngine(str(hybrid_dir), embeddings=embeddings), hybrid=True)
+    try:
+        retrieval = await retriever.retrieve("which pack is PMA-2041 exactly", k=2)
+        # Fake vectors rank it arbitrarily; BM25 ranks it first, so fusion keeps it
+        assert "chunk-3" in [result.id for result in retrieval.results]
+        assert retrieval.query_embedding is not None and embeddings.calls == 1
+        # Distances keep their meaning; the fused rank score is reported on its own
+        fused = [result.fused_score for result in retrieval.results]
+        assert fused == sorted(fused, reverse=True) and all(0 < score < 0.04 for score in fused)
+        assert all(result.score is not None for result in retrieval.results)
+
+        retrieval = await retriever.retrieve("PMA-2041", k=2)
+        assert [result.id for result in retrieval.results] == ["chunk-3"]
+        assert retrieval.results[0].score is None and retrieval.results[0].fused_score > 0
+        assert retrieval.query_embedding is None and embeddings.calls == 1
+        assert retriever.stats()["lexical_only"] == 1
+    finally:
+        retriever.shutdown()
+
+def test_numpy_backend_matches_chroma(db_dir):
+    chroma_engine = RetrievalEngine(str(db_dir), embeddings=FakeEmbeddings(size=8))
+    numpy_engine = RetrievalEngine(str(db_dir), embeddings=FakeEmbeddings(size=8), backend="numpy")
+    query = [0.1 * i for i in range(8)]
+
+    expected = chroma_engine.search_by_vector(query, k=3)
+    results = numpy_engine.search_by_vector(query, k=3)
+
+    assert numpy_engine.index.name == "numpy"
+    assert [r.id for r in results] == [r.id for r in expected]
+    assert [r.score for r in results] == pytest.approx([r.score for r in expected], rel=1e-4)
+    assert numpy_engine.get_results([results[1].id])[0].content == results[1].content
+
+def test_numpy_store_add_replace_delete():
+    store = NumpyVectorStore()
+    store.add(["a", "b"], ["first", "second"], [{}, {"page": 1}], [[1.0, 0.0], [0.0, 1.0]])
+    store.add(["a"], ["first again"], [{}], [[0.0, 0.9]])
+
+    assert store.count() == 2
+    assert [r.id for r in store.query([0.0, 1.0], k=2)] == ["b", "a"]
+    assert store.get(["a", "missing"])[0].content == "first again"
+
+    store.delete(["b"])
+    assert [r.id for r in store.query([0.0, 1.0], k=5)] == ["a"]
+
+def test_mmap_backend_serves_published_generations(db_dir):
+    chroma_engine = RetrievalEngine(str(db_dir), embeddings=FakeEmbeddings(size=8))
+    exported = chroma_engine.vector_store._collection.get(include=["embeddings", "documents", "metadatas"])
+    write_mmap_index(db_dir, exported["ids"], exported["documents"], exported["metadatas"], exported["embeddings"])
+
+    engine = RetrievalEngine(str(db_dir), embeddings=FakeEmbeddings(size=8), check_interval=0, backend="mmap")
+    query = [0.1 * i for i in range(8)]
+    expected = chroma_engine.search_by_vector(query, k=3)
+    results = engine.search_by_vector(query, k=3)
+
+    assert isinstance(engine.index, MmapVectorStore) and engine._store is None
+    assert isinstance(engine.index.vectors, np.memmap)
+    # Keyword search maps the generation's postings instead of parsing lexical_index.json
+    assert isinstance(engine.lexical_index, MappedLexicalIndex) and len(engine.lexical_index) == 3
+    refunds_id = exported["ids"][exported["documents"].index(TEXTS[1])]
+    assert [doc_id for doc_id, _ in engine.lexical_search("refunds", 3)] == [refunds_id]
+    assert [r.id for r in results] == [r.id for r in expected]
+    assert [r.score for r in results] == pytest.approx([r.score for r in expected], rel=1e-4)
+    assert engine.get_results([results[0].id])[0].content == results[0].content
+
+    # A new generation is picked up; the old files stay readable for whoever mapped them
+    old_index, version = engine.index, engine.index_version
+    write_mmap_index(db_dir, ["x"], ["Only chunk"], [{"page": 2}], [[1.0] * 8])
+    assert engine.count() == 1 and engine.index_version != version
+    assert engine.search_by_vector(query, k=3)[0].metadata == {"page": 2}
+    assert len(old_index.query(query, 3)) == 3
+
+@pytest.mark.parametrize("precision", ["float16", "int8"])
+def test_quantized_store_rescores_to_exact_results(precision):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((500, 32)).astype(np.float32)
+    ids = [str(i) for i in range(500)]
+    exact = NumpyVectorStore()
+    compact = NumpyVectorStore(precision=precision, rescore_factor=4)
+    for store in (exact, compact):
+        store.add(ids, ids, [{} for _ in ids], vectors)
+
+    query = rng.standard_normal(32).tolist()
+    assert [r.id for r in compact.query(query, 5)] == [r.id for r in exact.query(query, 5)]
+    assert compact.query(query, 1)[0].score == pytest.approx(exact.query(query, 1)[0].score, rel=1e-5)
+
+    stats = compact.stats()
+    assert stats["bytes_saved"] == stats["float32_bytes"] - stats["matrix_bytes"] > 0
+    recall = compact.recall_against_float32(k=5, sample=20)
+    assert recall["recall_rescored"] >= recall["recall_compact"]
+    assert recall["recall_rescored"] > 0.95
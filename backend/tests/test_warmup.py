@@ -0,0 +1,77 @@
+import asyncio
+import subprocess
+import sys
+from pathlib import Path
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app.main import app
+from app.utils.warmup import Warmup, WarmupSkipped
+
+BACKEND_DIR = str(Path(__file__).parent.parent)
+
+def step(calls, name, error=None):
+    async def run():
+        calls.append(name)
+        if error is not None:
+            raise error
+    return run
+
+def test_optional_failures_do_not_hold_readiness_back():
+    calls = []
+    warmup = Warmup([
+        ("index", step(calls, "index")),
+        ("llm", step(calls, "llm", RuntimeError("connection refused"))),
+        ("key", step(calls, "key", WarmupSkipped("no key"))),
+        ("search", step(calls, "search"))
+    ], required=["index"])
+    asyncio.run(warmup.run())
+
+    state = warmup.state()
+    assert calls == ["index", "llm", "key", "search"]
+    assert state["ready"] and state["status"] == "ready"
+    assert [s["status"] for s in state["steps"]] == ["ok", "failed", "skipped", "ok"]
+    assert state["steps"][1]["error"] == "connection refused"
+
+def test_failed_required_step_is_retried_until_it_succeeds():
+    calls = []
+    failures = [OSError("no such directory")] * 2
+
+    async def open_index():
+        calls.append("index")
+        if failures:
+            raise failures.pop()
+
+    async def scenario():
+        warmup = Warmup(
+            [("index", open_index), ("search", step(calls, "search"))],
+            required=["index"], retry_delay=0.05, max_retry_delay=0.1
+        )
+        warmup.start()
+        await asyncio.sleep(0.02)
+        # Not ready while the index cannot be opened; the later step waits
+        assert warmup.state()["status"] == "failed" and not warmup.ready
+        assert warmup.state()["steps"][1]["status"] == "pending"
+        await warmup._task
+        return warmup
+
+    warmup = asyncio.run(scenario())
+    assert calls == ["index", "index", "index", "search"]
+    assert warmup.ready and warmup.state()["steps"][0]["attempts"] == 3
+
+def test_ready_endpoint_reports_503_until_warm():
+    calls = []
+    warmup = Warmup([("index", step(calls, "index"))], required=["index"])
+    with patch("app.main.warmup", warmup):
+        client = TestClient(app)
+        response = client.get("/api/ready")
+        assert response.status_code == 503 and response.json()["status"] == "pending"
+
+        asyncio.run(warmup.run())
+        response = client.get("/api/ready")
+        assert response.status_code == 200 and response.json()["ready"]
+
+def test_app_imports_without_langchain():
+    # langchain is only needed once Chroma is opened or an ingestion job runs
+    code = "import sys, app.main; print('langchain' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=BACKEND_DIR)
+    assert result.stdout.strip().splitlines()[-1] == "False"
@@ -1,9 +1,12 @@
+import asyncio
 import pytest
 from fastapi.testclient import TestClient
 import json
-import os
 from unittest.mock import patch
 from app.main import app
+from app.services.chat.answer_cache import get_answer_cache
+from app.services.llm.provider import OpenAIProvider
+from app.services.memory.vector_store import Retrieval, SearchResult, SearchTiming
 
 @pytest.fixture
 def test_client():
@@ -31,7 +34,7 @@ def test_invalid_message_format():
         assert response["response"] is None
 
 def test_missing_api_key():
-    with patch.dict(os.environ, {"OPENAI_API_KEY": ""}):
+    with patch(PROVIDER, return_value=OpenAIProvider(api_key="")):
         with TestClient(app).websocket_connect("/api/chat/ws") as websocket:
             data = {"message": "test"}
             websocket.send_json(data)
@@ -40,11 +43,121 @@ def test_missing_api_key():
             assert response["response"] is None
 
 def test_openai_api_error():
-    with patch('openai.ChatCompletion.acreate') as mock_create:
-        mock_create.side_effect = Exception("API Error")
+    with patch("app.main.get_rag_retrieval", return_value=fake_retrieval()), \
+            patch(PROVIDER, return_value=StubProvider(error=Exception("API Error"))):
         with TestClient(app).websocket_connect("/api/chat/ws") as websocket:
             data = {"message": "test"}
             websocket.send_json(data)
             response = websocket.receive_json()
             assert response["error"] == "API Error"
-            assert response["response"] is None 
\ No newline at end of file
+            assert response["response"] is None 
+
+@pytest.fixture(autouse=True)
+def empty_answer_cache():
+    get_answer_cache().clear()
+
+def fake_retrieval(embedding=(1.0, 0.0)):
+    results = [SearchResult(id="chunk-1", content="We grow vegetables.", score=0.1, metadata={"source": "/app/data/faq.pdf", "page": 2})]
+    return Retrieval(results, list(embedding), "v1", SearchTiming(queue_ms=0.0, search_ms=1.0))
+
+PROVIDER = "app.services.chat.service.get_llm_provider"
+
+class StubProvider:
+    """Streams fixed completion chunks, or fails with ``error``."""
+
+    configured = True
+
+    def __init__(self, *parts, usage=None, error=None):
+        self.parts = parts
+        self.usage = usage
+        self.error = error
+        self.calls = 0
+
+    async def stream_chat(self, messages, model, temperature=0.0, timeout=None):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        for part in self.parts:
+            yield {"choices": [{"index": 0, "delta": {"content": part}}]}
+        if self.usage:
+            yield {"choices": [], "usage": self.usage}
+
+def test_streaming_frames():
+    usage = {"prompt_tokens": 10, "completion_tokens": 3, "total_tokens": 13}
+    with patch("app.main.get_rag_retrieval", return_value=fake_retrieval()), \
+            patch(PROVIDER, return_value=StubProvider("We ", "grow ", "vegetables.", usage=usage)):
+        with TestClient(app).websocket_connect("/api/chat/ws") as websocket:
+            websocket.send_json({"message": "What do you grow?", "stream": True})
+            frames = [websocket.receive_json()]
+            while frames[-1]["type"] != "done":
+                frames.append(websocket.receive_json())
+
+    start, deltas, done = frames[0], frames[1:-1], frames[-1]
+    assert start["type"] == "start"
+    assert start["sources"] == [{"id": "chunk-1", "score": 0.1, "fused_score": None, "source": "faq.pdf", "page": 2}]
+    assert [d["content"] for d in deltas] == ["We ", "grow ", "vegetables."]
+    assert done["response"] == "We grow vegetables."
+    assert done["usage"] == usage
+    assert done["timing"]["time_to_first_token_ms"] is not None
+
+def test_streaming_error_frame():
+    with patch("app.main.get_rag_retrieval", return_value=fake_retrieval()), \
+            patch(PROVIDER, return_value=StubProvider(error=Exception("API Error"))):
+        with TestClient(app).websocket_connect("/api/chat/ws") as websocket:
+            websocket.send_json({"message": "test", "stream": True})
+            assert websocket.receive_json()["type"] == "start"
+            response = websocket.receive_json()
+            assert response == {"type": "error", "error": "API Error", "response": None}
+
+def test_paraphrase_is_answered_from_cache():
+    provider = StubProvider("We ", "grow ", "vegetables.")
+    with patch(PROVIDER, return_value=provider):
+        with TestClient(app).websocket_connect("/api/chat/ws") as websocket:
+            with patch("app.main.get_rag_retrieval", return_value=fake_retrieval()):
+                websocket.send_json({"message": "What do you grow?", "stream": True})
+                while websocket.receive_json()["type"] != "done":
+                    pass
+            with patch("app.main.get_rag_retrieval", return_value=fake_retrieval(embedding=(0.999, 0.02))):
+                websocket.send_json({"message": "What do you farm?"})
+                response = websocket.receive_json()
+
+    assert provider.calls == 1
+    assert response == {"error": None, "response": "We grow vegetables.", "cached": True}
+
+def test_identical_concurrent_questions_share_one_completion():
+    calls = []
+    provider = StubProvider("We ", "grow ", "vegetables.")
+
+    async def slow_retrieval(query):
+        calls.append(query)
+        await asyncio.sleep(0.2)
+        return fake_retrieval()
+
+    with patch("app.main.get_rag_retrieval", side_effect=slow_retrieval), \
+            patch(PROVIDER, return_value=provider):
+        with TestClient(app) as client:
+            with client.websocket_connect("/api/chat/ws") as first, client.websocket_connect("/api/chat/ws") as second:
+                first.send_json({"message": "What do you grow?", "stream": True})
+                second.send_json({"message": "what do you grow"})
+                frames = [first.receive_json()]
+                while frames[-1]["type"] != "done":
+                    frames.append(first.receive_json())
+                single = second.receive_json()
+
+    assert len(calls) == 1 and provider.calls == 1
+    assert frames[-1]["response"] == single["response"] == "We grow vegetables."
+
+def test_metrics_record_chat_stages():
+    with patch("app.main.get_rag_retrieval", return_value=fake_retrieval()), \
+            patch(PROVIDER, return_value=StubProvider("We ", "grow.", usage={"prompt_tokens": 10, "completion_tokens": 2})):
+        client = TestClient(app)
+        with client.websocket_connect("/api/chat/ws") as websocket:
+            websocket.send_json({"message": "What do you grow?"})
+            assert websocket.receive_json()["response"] == "We grow."
+        metrics = client.get("/metrics").text
+
+    assert 'chat_stage_seconds_count{stage="llm_first_token"}' in metrics
+    assert 'chat_stage_seconds_count{stage="prompt_build"}' in metrics
+    assert 'chat_requests_total{endpoint="websocket",outcome="answered"}' in metrics
+    assert 'llm_tokens_total{direction="completion"}' in metrics
+    assert "chat_active_websockets 0" in metrics